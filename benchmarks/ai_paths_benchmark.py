@@ -0,0 +1,214 @@
+"""
+Benchmark hors ligne des chemins IA (modération, assistant, promo, coaching) contre le modèle simulé
+(cogs/fake_gemini.py), à travers la passerelle, les lots, les caches et les index réels des cogs.
+Reproductible : mêmes graine et profil -> mêmes requêtes, mêmes latences et erreurs simulées par requête
+(les mesures varient seulement avec l'ordonnancement réel de la boucle).
+
+Utilisation : python benchmarks/ai_paths_benchmark.py [--messages 400] [--rate 40] [--questions 120]
+              [--unique 0.5] [--promos 10] [--coaching 60] [--latency-scale 0.2]
+              [--requests-per-minute N] [--profile profil.json] [--seed 42] [--check]
+
+Avec --check : rejoue la modération seule puis avec la charge complète (coaching compris) et échoue
+(code de sortie 1) si la charge mixte fait échouer des modérations ou pousse leur p95 au-delà de
+l'échéance de la classe, c'est-à-dire si les autres classes épuisent le quota réservé à la modération.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cogs.ai_gateway import GeminiGateway, DEFAULT_DEADLINES, PRIORITY_COACHING, PRIORITY_MODERATION, percentile
+from cogs.assistant_cog import AssistantCog
+from cogs.fake_gemini import FakeGenerativeModel, load_fake_profile
+from cogs.manager_cog import ManagerCog
+from cogs.moderator_cog import ModeratorCog
+
+MESSAGES = [
+    "Salut tout le monde, quelqu'un a testé le dernier drop ?", "Je vends mon compte, MP moi", "Rejoignez discord.gg/promo123",
+    "T'es vraiment un idiot", "Merci pour l'aide hier !", "C'est une arnaque ce site ?", "Quel est le meilleur produit pour débuter ?",
+    "Go voir https://site-inconnu.example/offre", "Bonne soirée à tous", "J'achète des V-Bucks pas cher",
+]
+QUESTIONS = [
+    "Quels sont les moyens de paiement ?", "comment je reçois mes achats", "Comment gagner de l'XP ?", "remboursement possible ?",
+    "j'ai un bug avec mon compte netflix", "le prix des vbucks ?", "je n'ai pas reçu ma commande", "comment retirer mes gains",
+]
+
+
+def load_json(name):
+    with open(os.path.join(ROOT, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def summary(name, latencies, failures, elapsed):
+    latencies_ms = [latency * 1000 for latency in latencies]
+    print(f"{name:<22}{len(latencies):>8}{failures:>8}{percentile(latencies_ms, 0.5):>10.0f}{percentile(latencies_ms, 0.95):>10.0f}"
+          f"{percentile(latencies_ms, 0.99):>10.0f}{len(latencies) / elapsed if elapsed else 0:>10.1f}")
+
+
+async def timed(coroutine, latencies, loop):
+    started_at = loop.time()
+    result = await coroutine
+    latencies.append(loop.time() - started_at)
+    return result
+
+
+async def run(args):
+    config = load_json("config.json")
+    if args.requests_per_minute:
+        config.setdefault("AI_GATEWAY_CONFIG", {})["REQUESTS_PER_MINUTE"] = args.requests_per_minute
+    products, knowledge_base = load_json("products.json"), load_json("knowledge_base.json")
+    profile = load_fake_profile(args.profile)
+    profile["SEED"] = args.seed
+    profile["LATENCY_SCALE"] = args.latency_scale
+    model = FakeGenerativeModel(profile)
+    model.configure(config)
+
+    state = ManagerCog._compile_static_data(config, products, [], knowledge_base)
+    manager = SimpleNamespace(
+        config=config, model=model, ai=GeminiGateway(model, config), products=products, knowledge_base=knowledge_base,
+        knowledge_index=state["knowledge_index"], _parse_gemini_json_response=lambda text: ManagerCog._parse_gemini_json_response(None, text),
+    )
+    bot = SimpleNamespace(get_cog=lambda name: manager)
+    moderator, assistant = ModeratorCog(bot), AssistantCog(bot)
+    for cog in (moderator, assistant):
+        cog.manager, cog.model = manager, model
+    moderator.configure_moderation()
+
+    loop = asyncio.get_running_loop()
+    results = {}
+
+    async def moderation_load():
+        rng = random.Random(f"{args.seed}:moderation")
+        latencies, tasks = [], []
+        for message_id in range(args.messages):
+            content = rng.choice(MESSAGES)
+            if rng.random() < args.unique:
+                # Variante inédite : ni cache ni fusion possibles.
+                content += f" ({message_id})"
+            message = SimpleNamespace(id=message_id, content=content, channel=SimpleNamespace(name=rng.choice(["général", "aide", "marketplace"])))
+            tasks.append(asyncio.create_task(timed(moderator.moderate_remote(message), latencies, loop)))
+            await asyncio.sleep(rng.expovariate(args.rate))
+        verdicts = await asyncio.gather(*tasks)
+        results["Modération"] = (latencies, sum(verdict is None for verdict in verdicts))
+
+    async def assistant_load():
+        rng = random.Random(f"{args.seed}:assistant")
+        latencies, tasks = [], []
+        for _ in range(args.questions):
+            question = rng.choice(QUESTIONS)
+
+            async def answer(question=question):
+                return assistant.local_answer(question) or await assistant.answer_with_model(question)
+            tasks.append(asyncio.create_task(timed(answer(), latencies, loop)))
+            await asyncio.sleep(rng.expovariate(args.rate / 4))
+        answers = await asyncio.gather(*tasks)
+        results["Assistant"] = (latencies, sum(not answer or answer.get("response_type") not in ("answer", "escalate") for answer in answers))
+
+    async def promo_load():
+        latencies = []
+        selected = products[:args.promos]
+        descriptions = await asyncio.gather(*(
+            timed(ManagerCog.query_gemini_for_promo(manager, product["name"], product.get("description", "")[:120]), latencies, loop)
+            for product in selected
+        ))
+        # En cas d'erreur, la description courte est renvoyée telle quelle.
+        results["Promo"] = (latencies, sum(description == product.get("description", "")[:120] for description, product in zip(descriptions, selected)))
+
+    async def coaching_load():
+        rng = random.Random(f"{args.seed}:coaching")
+        latencies = []
+        prompt_template = config.get("AI_PROCESSING_CONFIG", {}).get("AI_WEEKLY_COACH_PROMPT", "")
+        prompts = [
+            prompt_template.format(username=f"membre{user_index}", weekly_xp=rng.randint(10, 5000), weekly_affiliate_earnings=rng.randint(0, 300))
+            for user_index in range(args.coaching)
+        ]
+
+        async def report(prompt):
+            try:
+                await timed(manager.ai.generate(PRIORITY_COACHING, prompt), latencies, loop)
+                return True
+            except Exception:
+                return False
+        # Même forme que run_weekly_coaching : CONCURRENCY générateurs en parallèle.
+        concurrency = config.get("COACHING_CONFIG", {}).get("CONCURRENCY", 4)
+        pending = prompts[::-1]
+        outcomes = []
+
+        async def worker():
+            while pending:
+                outcomes.append(await report(pending.pop()))
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        results["Coaching"] = (latencies, outcomes.count(False))
+
+    started_at = time.perf_counter()
+    await asyncio.gather(moderation_load(), assistant_load(), promo_load(), coaching_load())
+    elapsed = time.perf_counter() - started_at
+
+    print(f"Profil : latence médiane {profile['LATENCY_MS']['MEDIAN']} ms x{args.latency_scale}, erreurs {profile['ERROR_RATE']:.0%}, "
+          f"{manager.ai.requests_bucket.capacity:.0f} requêtes/min, graine {args.seed}")
+    print(f"{'Chemin':<22}{'requêtes':>8}{'échecs':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+    for name, (latencies, failures) in results.items():
+        summary(name, latencies, failures, elapsed)
+
+    print(f"\nAppels au modèle : {model.usage['calls']} ({model.usage['errors']} erreurs injectées), "
+          f"tokens : {model.usage['prompt_tokens']} en entrée / {model.usage['output_tokens']} en sortie")
+    print(f"Modération : {moderator.batcher.counters['batches']} lots, cache {moderator.verdict_cache.stats()['hit_rate']:.0%}, "
+          f"{moderator.coalesced_verdicts} requêtes fusionnées")
+    print(f"Assistant : {assistant.counters['local_answers']} réponses locales, {assistant.counters['model_answers']} via le modèle, "
+          f"cache {assistant.answer_cache.stats()['hit_rate']:.0%}")
+    breaker = manager.ai.breaker.stats()
+    print(f"Disjoncteur : {breaker['state']}, {len(breaker['transitions'])} transitions, {breaker['rejected']} requêtes refusées, "
+          f"replis locaux : {moderator.degraded_verdicts} verdicts / {assistant.counters['degraded_answers']} réponses")
+    for priority, counters in manager.ai.stats()["classes"].items():
+        print(f"Passerelle [{priority}] : attente p95 {counters['wait_p95'] * 1000:.0f} ms, rejetées {counters.get('shed', 0)}, "
+              f"échéances {counters.get('expired_in_queue', 0) + counters.get('expired_in_call', 0)}")
+    return results, manager.ai.deadlines.get(PRIORITY_MODERATION, DEFAULT_DEADLINES[PRIORITY_MODERATION])
+
+
+def check(args) -> bool:
+    """Modération seule puis charge mixte : la modération ne doit pas se dégrader quand le coaching tourne."""
+    outcomes = {}
+    for label, overrides in (("modération seule", {"questions": 0, "promos": 0, "coaching": 0}), ("charge mixte", {})):
+        print(f"\n=== {label} ===")
+        results, deadline = asyncio.run(run(argparse.Namespace(**{**vars(args), **overrides})))
+        latencies, failures = results["Modération"]
+        outcomes[label] = (failures, percentile(latencies, 0.95))
+
+    baseline_failures, _ = outcomes["modération seule"]
+    failures, p95 = outcomes["charge mixte"]
+    # Marge de 1 % pour les erreurs injectées par le modèle simulé, indépendantes de la charge.
+    allowed = baseline_failures + args.messages // 100
+    passed = failures <= allowed and p95 < deadline
+    print(f"\nVérification : {failures} modérations en échec sous charge mixte (max {allowed}), "
+          f"p95 {p95 * 1000:.0f} ms (échéance {deadline * 1000:.0f} ms) -> {'OK' if passed else 'ÉCHEC'}")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des chemins IA contre le modèle Gemini simulé.")
+    parser.add_argument("--messages", type=int, default=400)
+    parser.add_argument("--rate", type=float, default=40, help="messages à modérer par seconde")
+    parser.add_argument("--unique", type=float, default=0.5, help="part des messages à modérer jamais vus auparavant")
+    parser.add_argument("--questions", type=int, default=120)
+    parser.add_argument("--promos", type=int, default=10)
+    parser.add_argument("--coaching", type=int, default=60)
+    parser.add_argument("--latency-scale", type=float, default=0.2)
+    parser.add_argument("--requests-per-minute", type=int, help="remplace AI_GATEWAY_CONFIG.REQUESTS_PER_MINUTE")
+    parser.add_argument("--profile", help="fichier JSON complétant le profil par défaut du modèle simulé")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--check", action="store_true", help="compare la modération seule et sous charge mixte ; code de sortie 1 si elle se dégrade")
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(0 if check(args) else 1)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
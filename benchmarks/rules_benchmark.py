@@ -0,0 +1,118 @@
+"""
+Microbenchmark des règles compilées (cogs/rules.py) face à l'ancienne résolution
+(tri des paliers et parsing ISO à chaque appel, recopiés de ManagerCog avant compilation).
+
+Utilisation : python benchmarks/rules_benchmark.py [itérations]
+"""
+import json
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cogs.rules import CompiledRules, LevelTable
+
+
+def legacy_xp_multiplier(config, user_data, now):
+    total_boost = 1.0
+    vip_data = user_data.get("vip_premium")
+    if vip_data and datetime.fromisoformat(vip_data.get("expires_at", "1970-01-01T00:00:00+00:00")) > now:
+        vip_config = config.get("GAMIFICATION_CONFIG", {}).get("VIP_SYSTEM", {}).get("PREMIUM", {})
+        sorted_tiers = sorted(vip_config.get("XP_BOOST_TIERS", []), key=lambda x: x.get("consecutive_months", 0), reverse=True)
+        for tier in sorted_tiers:
+            if vip_data.get("consecutive_months", 0) >= tier.get("consecutive_months", 999):
+                total_boost += tier.get("boost", 0)
+                break
+    for booster_id, booster_data in user_data.get("active_boosters", {}).items():
+        if 'xp_booster' in booster_id and datetime.fromisoformat(booster_data.get('expires_at', "1970-01-01T00:00:00+00:00")) > now:
+            total_boost += booster_data.get('multiplier', 1.0) - 1.0
+    return total_boost
+
+
+def legacy_commission_rate(config, referrer_data, now):
+    aff_config = config.get("GAMIFICATION_CONFIG", {}).get("AFFILIATE_SYSTEM", {})
+    vip_config = config.get("GAMIFICATION_CONFIG", {}).get("VIP_SYSTEM", {}).get("PREMIUM", {})
+    guild_config = config.get("GUILD_SYSTEM", {})
+    guild_bonus = referrer_data.get("guild_bonus", {})
+    if guild_bonus.get("type") == 'top1':
+        return guild_config.get("WEEKLY_REWARDS", {}).get("TOP_1", {}).get("commission_rate", 0.90)
+    base_rate = next((t.get('rate', 0) for t in sorted(aff_config.get("COMMISSION_TIERS", []), key=lambda x: x.get('level', 0), reverse=True) if referrer_data.get("level", 1) >= t.get('level', 999)), 0)
+    total_boost = 0.0
+    vip_data = referrer_data.get("vip_premium")
+    if vip_data and datetime.fromisoformat(vip_data.get("expires_at", "1970-01-01T00:00:00+00:00")) > now:
+        total_boost += next((t.get('bonus', 0) for t in sorted(vip_config.get("COMMISSION_BONUS_TIERS", []), key=lambda x: x.get('consecutive_months', 0), reverse=True) if vip_data.get("consecutive_months", 0) >= t.get('consecutive_months', 999)), 0)
+    if referrer_data.get("permanent_affiliate_bonus", False):
+        total_boost += aff_config.get("PERMANENT_LOYALTY_BONUS", {}).get("RATE", 0)
+    for booster_id, booster_data in referrer_data.get("active_boosters", {}).items():
+        if 'commission_booster' in booster_id and datetime.fromisoformat(booster_data.get('expires_at', "1970-01-01T00:00:00+00:00")) > now:
+            total_boost += booster_data.get('bonus', 0.0)
+    total_boost += referrer_data.get("affiliate_booster", 0.0)
+    if guild_bonus.get("type") in ['top2', 'top3']:
+        total_boost += guild_bonus.get("commission_boost", 0.0)
+    cap = guild_bonus.get("max_commission_rate", 1.0) if guild_bonus.get("type") in ['top2', 'top3'] else 1.0
+    return min(base_rate + total_boost, cap)
+
+
+def legacy_level(config, xp, level=1):
+    xp_config = config.get("GAMIFICATION_CONFIG", {}).get("XP_SYSTEM", {})
+    base_xp = xp_config.get("LEVEL_UP_FORMULA_BASE_XP", 150)
+    multiplier = xp_config.get("LEVEL_UP_FORMULA_MULTIPLIER", 1.6)
+    while xp >= int(base_xp * (multiplier ** level)):
+        level += 1
+    return level
+
+
+def random_user(now):
+    expiry = lambda: (now + timedelta(hours=random.randint(-48, 48))).isoformat()
+    user = {"level": random.randint(1, 60), "xp": random.randint(0, 10 ** 7), "affiliate_booster": random.choice([0.0, 0.1]),
+            "permanent_affiliate_bonus": random.random() < 0.3, "active_boosters": {}, "guild_bonus": {}}
+    if random.random() < 0.5:
+        user["vip_premium"] = {"expires_at": expiry(), "consecutive_months": random.randint(0, 5)}
+    if random.random() < 0.5:
+        user["active_boosters"]["xp_booster_1"] = {"expires_at": expiry(), "multiplier": 1.25}
+    if random.random() < 0.5:
+        user["active_boosters"]["commission_booster_1"] = {"expires_at": expiry(), "bonus": 0.10}
+    if random.random() < 0.3:
+        rank = random.randint(1, 3)
+        user["guild_bonus"] = {**{"commission_boost": 0.1, "max_commission_rate": 0.9}, "type": f"top{rank}"}
+    return user
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with open(os.path.join(ROOT, "config.json"), encoding="utf-8") as f:
+        config = json.load(f)
+    rules, table = CompiledRules(config), LevelTable.from_config(config)
+    now = datetime.now(timezone.utc)
+    now_ts = now.timestamp()
+    random.seed(42)
+    users = [random_user(now) for _ in range(1000)]
+
+    # Les deux implémentations doivent produire les mêmes résultats.
+    for user in users:
+        assert abs(legacy_xp_multiplier(config, user, now) - rules.xp_multiplier(user, now_ts)) < 1e-9
+        compiled = rules.commission_rate(user, user["guild_bonus"], user["affiliate_booster"], now_ts)
+        assert abs(legacy_commission_rate(config, user, now) - compiled) < 1e-9
+        assert legacy_level(config, user["xp"]) == table.level_for(user["xp"])
+
+    cases = {
+        "Multiplicateur d'XP": (lambda u: legacy_xp_multiplier(config, u, now), lambda u: rules.xp_multiplier(u, now_ts)),
+        "Taux de commission": (lambda u: legacy_commission_rate(config, u, now),
+                               lambda u: rules.commission_rate(u, u["guild_bonus"], u["affiliate_booster"], now_ts)),
+        "Niveau pour l'XP": (lambda u: legacy_level(config, u["xp"]), lambda u: table.level_for(u["xp"])),
+    }
+    print(f"{'Règle':<22}{'ancien (µs)':>14}{'compilé (µs)':>14}{'gain':>8}")
+    for name, (legacy, compiled) in cases.items():
+        timings = []
+        for fn in (legacy, compiled):
+            elapsed = timeit.timeit(lambda: [fn(u) for u in users], number=max(1, iterations // len(users)))
+            timings.append(elapsed / (max(1, iterations // len(users)) * len(users)) * 1e6)
+        print(f"{name:<22}{timings[0]:>14.2f}{timings[1]:>14.2f}{timings[0] / timings[1]:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,51 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 from typing import Optional
+from datetime import datetime, timezone
 
 from .manager_cog import ManagerCog, VerificationView, TicketCreationView, MissionView
+from .static_data import StaticDataError
+from .ai_gateway import BREAKER_CLOSED, BREAKER_OPEN, BREAKER_HALF_OPEN
+
+BREAKER_LABELS = {BREAKER_CLOSED: "🟢 fermé", BREAKER_OPEN: "🔴 ouvert", BREAKER_HALF_OPEN: "🟡 semi-ouvert"}
+
+class LedgerView(discord.ui.View):
+    """Pagination par curseur du journal d'un utilisateur dans l'embed de /admin check-user."""
+    def __init__(self, manager: ManagerCog, user_id: str, embed: discord.Embed, field_index: int, page_size: int):
+        super().__init__(timeout=300)
+        self.manager = manager
+        self.user_id = user_id
+        self.embed = embed
+        self.field_index = field_index
+        self.page_size = page_size
+        # Curseur de début de chaque page visitée (None = page la plus récente).
+        self.cursors: list = [None]
+        self.next_cursor = None
+
+    async def render(self):
+        entries, self.next_cursor = await self.manager.get_ledger_page(self.user_id, self.page_size, self.cursors[-1])
+        if entries:
+            value = "\n".join(
+                f"{discord.utils.format_dt(entry['timestamp'], 'd')} `{entry['type']}`: {entry['amount']} — {entry.get('description', '')}"[:200]
+                for entry in entries
+            )
+        else:
+            value = "Aucune transaction enregistrée."
+        self.embed.set_field_at(self.field_index, name=f"Transactions (page {len(self.cursors)})", value=value[:1024], inline=False)
+        self.newer_button.disabled = len(self.cursors) == 1
+        self.older_button.disabled = self.next_cursor is None
+
+    @discord.ui.button(label="◀ Plus récentes", style=discord.ButtonStyle.secondary)
+    async def newer_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.cursors.pop()
+        await self.render()
+        await interaction.response.edit_message(embed=self.embed, view=self)
+
+    @discord.ui.button(label="Plus anciennes ▶", style=discord.ButtonStyle.secondary)
+    async def older_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.cursors.append(self.next_cursor)
+        await self.render()
+        await interaction.response.edit_message(embed=self.embed, view=self)
 
 class AdminCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
@@ -32,13 +75,9 @@ class AdminCog(commands.Cog):
     async def grant_credits(self, interaction: discord.Interaction, membre: discord.Member, montant: float, raison: str):
         if not self.manager or not self.manager.db: return await interaction.response.send_message("Erreur interne.", ephemeral=True)
         
-        user_ref = self.manager.db.collection('users').document(str(membre.id))
-        
-        transaction = self.manager.db.transaction()
-        await self.manager.add_transaction(transaction, user_ref, "store_credit", montant, f"Octroi Admin : {raison}")
-
-        user_data = (await user_ref.get()).to_dict()
-        current_credits = user_data.get("store_credit", 0.0)
+        user_id_str = str(membre.id)
+        states = await self.manager.mutation().add(user_id_str, "store_credit", montant, f"Octroi Admin : {raison}").commit()
+        current_credits = states[user_id_str].get("store_credit", 0.0)
 
         await interaction.response.send_message(f"✅ **{montant:.2f} crédits** ont été accordés à {membre.mention}. Nouveau solde : **{current_credits:.2f} crédits**.", ephemeral=True)
         try:
@@ -65,7 +104,7 @@ class AdminCog(commands.Cog):
         if not self.manager or not self.manager.db: return await interaction.response.send_message("Erreur interne.", ephemeral=True)
         
         user_ref = self.manager.db.collection('users').document(str(membre.id))
-        user_data = (await user_ref.get()).to_dict()
+        user_data = await self.manager.get_user_data(user_ref)
 
         if not user_data:
             return await interaction.response.send_message("Aucune donnée trouvée pour cet utilisateur.", ephemeral=True)
@@ -98,15 +137,140 @@ class AdminCog(commands.Cog):
 
         embed.add_field(name="Avertissements", value=f"{user_data.get('warnings', 0)}", inline=True)
 
-        transaction_log = user_data.get("transaction_log", [])
-        if transaction_log:
-            log_text = "\n".join([f"`{entry['type']}`: {entry['amount']}" for entry in transaction_log[-5:]])
-            embed.add_field(name="5 Dernières Transactions", value=log_text, inline=False)
-        else:
-            embed.add_field(name="Transactions", value="Aucune transaction enregistrée.", inline=False)
+        embed.add_field(name="Transactions", value="\u200b", inline=False)
+        page_size = self.manager.config.get("TRANSACTION_LOG_CONFIG", {}).get("PAGE_SIZE", 5)
+        view = LedgerView(self.manager, str(membre.id), embed, len(embed.fields) - 1, page_size)
+        await view.render()
+
+        await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
 
+    @admin_group.command(name="cache-stats", description="Affiche les statistiques du cache utilisateur et du tampon d'XP.")
+    async def cache_stats(self, interaction: discord.Interaction):
+        if not self.manager: return await interaction.response.send_message("Erreur interne.", ephemeral=True)
+
+        stats = self.manager.user_cache.stats()
+        embed = discord.Embed(title="📊 Cache Utilisateur", color=discord.Color.blurple())
+        embed.add_field(name="Entrées", value=f"{stats['size']}/{stats['max_size']}", inline=True)
+        embed.add_field(name="Hits / Misses", value=f"{stats['hits']} / {stats['misses']}", inline=True)
+        embed.add_field(name="Taux de succès", value=f"{stats['hit_rate']:.1%}", inline=True)
+        embed.add_field(name="Évictions", value=f"{stats['evictions']}", inline=True)
+        embed.add_field(name="Tampon XP en attente", value=f"{len(self.manager.xp_buffer)}", inline=True)
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
+    @admin_group.command(name="moderation-stats", description="Affiche les compteurs du pré-filtre, des lots et du cache de modération.")
+    async def moderation_stats(self, interaction: discord.Interaction):
+        moderator = self.bot.get_cog('ModeratorCog')
+        if not moderator: return await interaction.response.send_message("Le module de modération n'est pas chargé.", ephemeral=True)
+
+        prefilter = moderator.prefilter.stats()
+        batches = moderator.batcher.counters
+        cache = moderator.verdict_cache.stats()
+        embed = discord.Embed(title="🛡️ Modération", color=discord.Color.blurple())
+        embed.add_field(name="Pré-filtre local", value=(
+            f"PASS : {prefilter['local_pass']}\nSanctions : {prefilter['local_action']}\n"
+            f"Vers l'IA : {prefilter['ai']}\nRésolus localement : {prefilter['local_rate']:.1%}"
+        ), inline=True)
+        embed.add_field(name="Cache de verdicts", value=(
+            f"Entrées : {cache['size']}/{cache['max_size']}\nHits / Misses : {cache['hits']} / {cache['misses']}\n"
+            f"Taux de succès : {cache['hit_rate']:.1%}\nRequêtes fusionnées : {moderator.coalesced_verdicts}"
+        ), inline=True)
+        embed.add_field(name="Requêtes Gemini", value=(
+            f"Lots : {batches['batches']} ({batches['batched_messages']} messages)\n"
+            f"Individuelles : {batches['single_requests']} (dont {batches['fallbacks']} replis)\n"
+            f"Délais dépassés : {batches['timeouts']}"
+        ), inline=True)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @admin_group.command(name="ai-status", description="Affiche l'état de la passerelle Gemini : files, débit et latences par priorité.")
+    async def ai_status(self, interaction: discord.Interaction):
+        if not self.manager: return await interaction.response.send_message("Erreur interne.", ephemeral=True)
+
+        stats = self.manager.ai.stats()
+        embed = discord.Embed(title="🤖 Passerelle Gemini", color=discord.Color.blurple())
+        embed.description = (
+            f"Modèle : {'disponible' if self.manager.ai.available else 'indisponible'}\n"
+            f"Appels en cours : {stats['in_flight']}/{stats['max_in_flight']}\n"
+            f"Disjoncteur : {BREAKER_LABELS[stats['breaker']['state']]} (détails : /admin ai-breaker)"
+        )
+        assistant = self.bot.get_cog('AssistantCog')
+        if assistant:
+            model_answers = assistant.counters["model_answers"]
+            embed.description += (
+                f"\nAssistant : {assistant.counters['local_answers']} réponses locales, {model_answers} via Gemini"
+                f" (prompt moyen : {assistant.counters['prompt_chars'] // model_answers if model_answers else 0} caractères)"
+            )
+            cache = assistant.answer_cache.stats()
+            embed.description += (
+                f"\nCache de réponses : {cache['size']} entrées, {cache['hit_rate']:.1%} de succès,"
+                f" {assistant.counters['coalesced_answers']} requêtes fusionnées"
+            )
+        for priority, counters in stats["classes"].items():
+            embed.add_field(name=priority.capitalize(), value=(
+                f"En file : {counters['queued']}\nTerminées : {counters.get('completed', 0)} / {counters.get('requests', 0)}\n"
+                f"Rejetées : {counters.get('shed', 0)} · Erreurs : {counters.get('errors', 0)}\n"
+                f"Refus du disjoncteur : {counters.get('unavailable', 0)}\n"
+                f"Échéances : {counters.get('expired_in_queue', 0) + counters.get('expired_in_call', 0)}\n"
+                f"Attente p50/p95 : {counters['wait_p50']:.2f}s / {counters['wait_p95']:.2f}s\n"
+                f"Latence p50/p95 : {counters['latency_p50']:.2f}s / {counters['latency_p95']:.2f}s"
+            ), inline=True)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @admin_group.command(name="ai-breaker", description="Affiche l'état du disjoncteur Gemini, ses dernières transitions et les replis locaux.")
+    async def ai_breaker(self, interaction: discord.Interaction):
+        if not self.manager: return await interaction.response.send_message("Erreur interne.", ephemeral=True)
+
+        breaker = self.manager.ai.breaker.stats()
+        colors = {BREAKER_CLOSED: discord.Color.green(), BREAKER_OPEN: discord.Color.red(), BREAKER_HALF_OPEN: discord.Color.gold()}
+        embed = discord.Embed(title="⚡ Disjoncteur Gemini", color=colors[breaker["state"]])
+        embed.description = f"État : **{BREAKER_LABELS[breaker['state']]}**" + ("" if breaker["enabled"] else " (désactivé)")
+        if breaker["state"] == BREAKER_OPEN:
+            embed.description += f"\nProchain essai dans {breaker['reopens_in']:.0f}s"
+        elif breaker["state"] == BREAKER_HALF_OPEN:
+            embed.description += f"\nEssais en cours : {breaker['probes_in_flight']} · réussis : {breaker['probe_successes']}"
+        embed.add_field(name="Appels récents", value=(
+            f"Échecs consécutifs : {breaker['consecutive_failures']}\n"
+            f"Taux d'échec : {breaker['failure_rate']:.0%} sur {breaker['window']} appels\n"
+            f"Requêtes refusées : {breaker['rejected']}"
+        ), inline=True)
+
+        moderator, assistant = self.bot.get_cog('ModeratorCog'), self.bot.get_cog('AssistantCog')
+        embed.add_field(name="Replis locaux", value=(
+            f"Verdicts de modération : {moderator.degraded_verdicts if moderator else 0}\n"
+            f"Réponses de l'assistant : {assistant.counters['degraded_answers'] if assistant else 0}"
+        ), inline=True)
+
+        transitions = [
+            f"{discord.utils.format_dt(datetime.fromtimestamp(t['at'], timezone.utc), 'T')} "
+            f"{BREAKER_LABELS[t['from']]} → {BREAKER_LABELS[t['to']]} : {t['reason']}"
+            for t in reversed(breaker["transitions"][-10:])
+        ]
+        embed.add_field(name="Dernières transitions", value="\n".join(transitions)[:1024] or "Aucune transition depuis le démarrage.", inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @admin_group.command(name="recompute-levels", description="Recalcule le niveau de tous les membres selon la formule actuelle.")
+    async def recompute_levels(self, interaction: discord.Interaction):
+        if not self.manager or not self.manager.db: return await interaction.response.send_message("Erreur interne.", ephemeral=True)
+
+        await interaction.response.defer(ephemeral=True)
+        scanned, changed = await self.manager.recompute_all_levels()
+        await interaction.followup.send(f"✅ Niveaux recalculés : **{scanned}** membres analysés, **{changed}** niveaux mis à jour.", ephemeral=True)
+
+    @admin_group.command(name="reload", description="Recharge config, produits, succès et boutique sans redémarrer le bot.")
+    async def reload_static_data(self, interaction: discord.Interaction):
+        if not self.manager: return await interaction.response.send_message("Erreur interne.", ephemeral=True)
+
+        await interaction.response.defer(ephemeral=True)
+        try:
+            timings = await self.manager.reload_static_data()
+        except StaticDataError as e:
+            return await interaction.followup.send(f"❌ Rechargement annulé, les données actuelles sont conservées :\n`{e}`", ephemeral=True)
+
+        embed = discord.Embed(title="🔄 Données statiques rechargées", color=discord.Color.green())
+        for step, elapsed_ms in timings.items():
+            embed.add_field(name=step, value=f"`{elapsed_ms:.1f} ms`", inline=True)
+        embed.set_footer(text=f"Total : {sum(timings.values()):.1f} ms | {len(self.manager.products)} produits, {len(self.manager.achievements)} succès")
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
     # --- Groupe de commandes /setup ---
     setup_group = app_commands.Group(name="setup", description="Commandes de configuration initiale du serveur.")
 
@@ -117,7 +281,7 @@ class AdminCog(commands.Cog):
         if not config or not channel_name:
             return await interaction.response.send_message("Configuration `SERVER_RULES` ou `CHANNELS.RULES` manquante.", ephemeral=True)
         
-        channel = discord.utils.get(interaction.guild.text_channels, name=channel_name)
+        channel = self.manager.resources.channel(interaction.guild, channel_name)
         if not channel:
             return await interaction.response.send_message(f"Le salon `{channel_name}` est introuvable.", ephemeral=True)
 
@@ -138,8 +302,8 @@ class AdminCog(commands.Cog):
         if not all([config, channel_name, rules_channel_name]):
             return await interaction.response.send_message("Configuration incomplète pour le système de vérification.", ephemeral=True)
 
-        channel = discord.utils.get(interaction.guild.text_channels, name=channel_name)
-        rules_channel = discord.utils.get(interaction.guild.text_channels, name=rules_channel_name)
+        channel = self.manager.resources.channel(interaction.guild, channel_name)
+        rules_channel = self.manager.resources.channel(interaction.guild, rules_channel_name)
 
         if not channel:
             return await interaction.response.send_message(f"Le salon `{channel_name}` est introuvable.", ephemeral=True)
@@ -159,7 +323,7 @@ class AdminCog(commands.Cog):
         if not config or not channel_name:
             return await interaction.response.send_message("Configuration `TICKET_SYSTEM` ou `CHANNELS.TICKET_CREATION` manquante.", ephemeral=True)
         
-        channel = discord.utils.get(interaction.guild.text_channels, name=channel_name)
+        channel = self.manager.resources.channel(interaction.guild, channel_name)
         if not channel:
             return await interaction.response.send_message(f"Le salon `{channel_name}` est introuvable.", ephemeral=True)
 
@@ -181,7 +345,7 @@ class AdminCog(commands.Cog):
             return await interaction.response.send_message("❌ La section `GAMIFICATION_INFO_MESSAGE` est manquante dans `config.json`.", ephemeral=True)
         
         channel_name = self.manager.config["CHANNELS"].get("GAMIFICATION_INFO")
-        channel = discord.utils.get(interaction.guild.text_channels, name=channel_name)
+        channel = self.manager.resources.channel(interaction.guild, channel_name)
         if not channel:
             return await interaction.response.send_message(f"❌ Le salon `{channel_name}` est introuvable.", ephemeral=True)
             
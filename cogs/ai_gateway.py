@@ -0,0 +1,422 @@
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import Counter, deque
+from typing import Dict, Any, Optional, List, Tuple, AsyncIterator
+
+# Classes de priorité, de la plus urgente à la moins urgente.
+PRIORITY_MODERATION = "moderation"
+PRIORITY_ASSISTANT = "assistant"
+PRIORITY_PROMO = "promo"
+PRIORITY_COACHING = "coaching"
+PRIORITIES = (PRIORITY_MODERATION, PRIORITY_ASSISTANT, PRIORITY_PROMO, PRIORITY_COACHING)
+
+DEFAULT_DEADLINES = {PRIORITY_MODERATION: 4, PRIORITY_ASSISTANT: 20, PRIORITY_PROMO: 30, PRIORITY_COACHING: 120}
+DEFAULT_QUEUE_LIMITS = {PRIORITY_MODERATION: 50, PRIORITY_ASSISTANT: 20, PRIORITY_PROMO: 5, PRIORITY_COACHING: 20}
+
+# États du disjoncteur.
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+
+class GatewayError(Exception):
+    """Requête refusée ou abandonnée par la passerelle Gemini (avant ou pendant l'appel)."""
+
+
+class GatewayOverloaded(GatewayError):
+    """File d'attente de la classe pleine : la requête est rejetée immédiatement."""
+
+
+class GatewayDeadlineExceeded(GatewayError):
+    """Échéance de la classe dépassée, en file d'attente ou pendant l'appel au modèle."""
+
+
+class GatewayUnavailable(GatewayError):
+    """Disjoncteur ouvert : Gemini est considéré en panne, la requête est refusée sans attendre."""
+
+
+def estimate_tokens(contents: Any) -> int:
+    """Estimation grossière (~4 caractères par token) utilisée pour réserver le quota avant l'appel."""
+    return len(str(contents)) // 4 + 1
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class TokenBucket:
+    """Seau à jetons rempli de `per_minute` unités par minute, d'une capacité d'une minute de quota."""
+    def __init__(self, per_minute: float):
+        self.configure(per_minute)
+        self.level = self.capacity
+        self.updated_at = time.monotonic()
+
+    def configure(self, per_minute: float):
+        self.capacity = max(float(per_minute), 1.0)
+        self.rate = self.capacity / 60
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay(self, amount: float, reserve: float = 0.0, now: Optional[float] = None) -> float:
+        """
+        Secondes à attendre avant de pouvoir prélever `amount` (0 si possible tout de suite)
+        sans faire descendre le niveau sous `reserve`.
+        """
+        now = now or time.monotonic()
+        self._refill(now)
+        missing = min(amount + reserve, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def consume(self, amount: float):
+        """Prélève `amount` ; un montant négatif rend du quota. Le niveau peut devenir négatif (dette)."""
+        self.level = min(self.capacity, self.level - amount)
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur partagé par tous les appels Gemini. Fermé, il compte les échecs (erreurs du modèle et
+    échéances dépassées pendant l'appel) et s'ouvre après CONSECUTIVE_FAILURES échecs d'affilée, ou quand
+    la part d'échecs des WINDOW derniers appels atteint FAILURE_RATE. Ouvert, il refuse tout pendant
+    OPEN_SECONDS, puis passe en semi-ouvert : HALF_OPEN_PROBES appels d'essai à la fois sont admis,
+    SUCCESSES_TO_CLOSE succès le referment et un échec le rouvre pour une durée doublée (MAX_OPEN_SECONDS au plus).
+    """
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.state = BREAKER_CLOSED
+        self.outcomes: deque = deque()
+        self.consecutive_failures = 0
+        self.open_seconds = 0.0
+        self.open_until = 0.0
+        # Chaque période semi-ouverte a son numéro : l'issue d'un essai d'une période close est ignorée.
+        self._half_open_epoch = 0
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        self.rejected = 0
+        self.transitions: deque = deque(maxlen=20)
+        self.configure(config or {})
+
+    def configure(self, config: Dict[str, Any]):
+        breaker = config.get("AI_GATEWAY_CONFIG", {}).get("CIRCUIT_BREAKER", {})
+        self.enabled = breaker.get("ENABLED", True)
+        self.consecutive_threshold = max(breaker.get("CONSECUTIVE_FAILURES", 5), 1)
+        self.failure_rate = breaker.get("FAILURE_RATE", 0.5)
+        self.min_calls = breaker.get("MIN_CALLS", 10)
+        self.outcomes = deque(self.outcomes, maxlen=max(breaker.get("WINDOW", 20), 1))
+        self.base_open_seconds = breaker.get("OPEN_SECONDS", 30)
+        self.max_open_seconds = max(breaker.get("MAX_OPEN_SECONDS", 300), self.base_open_seconds)
+        self.half_open_probes = max(breaker.get("HALF_OPEN_PROBES", 1), 1)
+        self.successes_to_close = max(breaker.get("SUCCESSES_TO_CLOSE", 2), 1)
+        if not self.enabled and self.state != BREAKER_CLOSED:
+            self._transition(BREAKER_CLOSED, "désactivé par la configuration")
+
+    def _transition(self, state: str, reason: str):
+        previous, self.state = self.state, state
+        self.transitions.append({"at": time.time(), "from": previous, "to": state, "reason": reason})
+        print(f"Disjoncteur Gemini : {previous} -> {state} ({reason})")
+        if state == BREAKER_OPEN:
+            self.open_until = time.monotonic() + self.open_seconds
+        elif state == BREAKER_HALF_OPEN:
+            self._half_open_epoch += 1
+            self.probes_in_flight = 0
+            self.probe_successes = 0
+        else:
+            self.outcomes.clear()
+            self.consecutive_failures = 0
+
+    def _open(self, reason: str, seconds: float):
+        self.open_seconds = seconds
+        self._transition(BREAKER_OPEN, f"{reason}, réessai dans {seconds:.0f}s")
+
+    @property
+    def rejecting(self) -> bool:
+        """Vrai si une nouvelle requête serait refusée : les appelants passent alors directement en mode dégradé."""
+        if not self.enabled or self.state == BREAKER_CLOSED:
+            return False
+        if self.state == BREAKER_OPEN:
+            return time.monotonic() < self.open_until
+        return self.probes_in_flight >= self.half_open_probes
+
+    @property
+    def retry_in(self) -> float:
+        """Secondes avant qu'une requête ait une chance d'être admise (0 si elle le serait tout de suite)."""
+        if not self.rejecting:
+            return 0.0
+        if self.state == BREAKER_OPEN:
+            return max(self.open_until - time.monotonic(), 0.0)
+        # Semi-ouvert, essais en cours : leur issue est connue en quelques secondes.
+        return 1.0
+
+    def allow(self) -> Tuple[bool, int]:
+        """
+        (admise, essai) pour une nouvelle requête ; `essai` vaut 0 hors période semi-ouverte.
+        Chaque requête admise doit être suivie d'un `record` avec la même valeur d'essai.
+        """
+        if not self.enabled or self.state == BREAKER_CLOSED:
+            return True, 0
+        if self.state == BREAKER_OPEN:
+            if time.monotonic() < self.open_until:
+                self.rejected += 1
+                return False, 0
+            self._transition(BREAKER_HALF_OPEN, "délai d'ouverture écoulé")
+        if self.probes_in_flight >= self.half_open_probes:
+            self.rejected += 1
+            return False, 0
+        self.probes_in_flight += 1
+        return True, self._half_open_epoch
+
+    def record(self, success: Optional[bool], probe: int = 0):
+        """Issue d'une requête admise : True (réponse), False (erreur ou échéance), None (abandonnée, sans effet)."""
+        if probe:
+            if probe != self._half_open_epoch or self.state != BREAKER_HALF_OPEN:
+                return
+            self.probes_in_flight -= 1
+            if success is None:
+                return
+            if not success:
+                self._open("échec de l'appel d'essai", min(max(self.open_seconds, self.base_open_seconds) * 2, self.max_open_seconds))
+            else:
+                self.probe_successes += 1
+                if self.probe_successes >= self.successes_to_close:
+                    self._transition(BREAKER_CLOSED, f"{self.probe_successes} appels d'essai réussis")
+            return
+
+        # Les réponses tardives d'appels lancés avant l'ouverture ne comptent plus.
+        if success is None or not self.enabled or self.state != BREAKER_CLOSED:
+            return
+        self.outcomes.append(success)
+        self.consecutive_failures = 0 if success else self.consecutive_failures + 1
+        if success:
+            return
+        failures = self.outcomes.count(False)
+        if self.consecutive_failures >= self.consecutive_threshold:
+            self._open(f"{self.consecutive_failures} échecs consécutifs", self.base_open_seconds)
+        elif len(self.outcomes) >= self.min_calls and failures / len(self.outcomes) >= self.failure_rate:
+            self._open(f"{failures} échecs sur les {len(self.outcomes)} derniers appels", self.base_open_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled, "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_rate": self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0,
+            "window": len(self.outcomes),
+            "reopens_in": max(self.open_until - time.monotonic(), 0.0) if self.state == BREAKER_OPEN else 0.0,
+            "probes_in_flight": self.probes_in_flight, "probe_successes": self.probe_successes,
+            "rejected": self.rejected, "transitions": list(self.transitions),
+        }
+
+
+class GeminiGateway:
+    """
+    Point de passage unique vers le modèle Gemini partagé. Limite le nombre d'appels simultanés
+    et le débit (requêtes et tokens par minute), sert les files par classe de priorité
+    (modération > assistant > promo > coaching), applique une échéance par classe et rejette
+    les requêtes quand la file de leur classe est pleine. Les places réservées à la modération
+    ne sont jamais occupées par les autres classes, et une part du quota (requêtes et tokens)
+    leur reste disponible : les autres classes attendent quand un seau descend sous cette
+    réserve. Un disjoncteur commun (`breaker`) refuse
+    immédiatement toute requête tant que Gemini est considéré en panne.
+    """
+    def __init__(self, model: Any = None, config: Optional[Dict[str, Any]] = None):
+        self.model = model
+        self._queue: List[Tuple[int, int, asyncio.Future, str, int]] = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.in_flight = 0
+        self.queued: Counter = Counter()
+        self.counters: Dict[str, Counter] = {priority: Counter() for priority in PRIORITIES}
+        self.wait_times: Dict[str, deque] = {priority: deque(maxlen=500) for priority in PRIORITIES}
+        self.latencies: Dict[str, deque] = {priority: deque(maxlen=500) for priority in PRIORITIES}
+        self.requests_bucket = TokenBucket(60)
+        self.tokens_bucket = TokenBucket(250000)
+        self.breaker = CircuitBreaker()
+        self.configure(config or {})
+
+    @property
+    def available(self) -> bool:
+        return self.model is not None
+
+    def configure(self, config: Dict[str, Any]):
+        gateway = config.get("AI_GATEWAY_CONFIG", {})
+        self.max_in_flight = max(gateway.get("MAX_IN_FLIGHT", 4), 1)
+        self.reserved_for_moderation = min(gateway.get("RESERVED_FOR_MODERATION", 1), self.max_in_flight - 1)
+        self.reserved_quota = min(max(gateway.get("RESERVED_QUOTA_FOR_MODERATION", 0.5), 0.0), 0.9)
+        self.output_tokens_estimate = gateway.get("OUTPUT_TOKENS_ESTIMATE", 300)
+        self.requests_bucket.configure(gateway.get("REQUESTS_PER_MINUTE", 60))
+        self.tokens_bucket.configure(gateway.get("TOKENS_PER_MINUTE", 250000))
+        self.deadlines = {**DEFAULT_DEADLINES, **gateway.get("DEADLINE_SECONDS", {})}
+        self.queue_limits = {**DEFAULT_QUEUE_LIMITS, **gateway.get("MAX_QUEUED", {})}
+        self.breaker.configure(config)
+
+    def _slot_limit(self, priority: str) -> int:
+        return self.max_in_flight if priority == PRIORITY_MODERATION else self.max_in_flight - self.reserved_for_moderation
+
+    def _reserve(self, priority: str, bucket: TokenBucket) -> float:
+        """Niveau sous lequel `priority` ne peut pas faire descendre `bucket` (réserve de la modération)."""
+        return 0.0 if priority == PRIORITY_MODERATION else bucket.capacity * self.reserved_quota
+
+    def _pump(self):
+        """Accorde des places aux requêtes en tête de file tant que la concurrence et le débit le permettent."""
+        self._timer = None
+        while self._queue:
+            _, _, future, priority, tokens = self._queue[0]
+            if future.done():
+                # Échéance dépassée pendant l'attente.
+                heapq.heappop(self._queue)
+                continue
+            if self.in_flight >= self._slot_limit(priority):
+                return
+            wait = max(
+                self.requests_bucket.delay(1, self._reserve(priority, self.requests_bucket)),
+                self.tokens_bucket.delay(tokens, self._reserve(priority, self.tokens_bucket)),
+            )
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._pump)
+                return
+            heapq.heappop(self._queue)
+            self.requests_bucket.consume(1)
+            self.tokens_bucket.consume(tokens)
+            self.in_flight += 1
+            future.set_result(None)
+
+    async def _acquire(self, priority: str, tokens: int, deadline: float):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        entry = (PRIORITIES.index(priority), next(self._sequence), future, priority, tokens)
+        heapq.heappush(self._queue, entry)
+        self.queued[priority] += 1
+        try:
+            if self._timer is not None and self._queue[0] is entry:
+                # La tête attendait la réserve de la modération : la nouvelle tête n'a pas à l'attendre.
+                self._timer.cancel()
+                self._timer = None
+            if self._timer is None:
+                self._pump()
+            await asyncio.wait_for(future, max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # Place accordée au moment même de l'échéance : elle est rendue.
+                self._release()
+            raise
+        finally:
+            self.queued[priority] -= 1
+
+    def _release(self):
+        self.in_flight -= 1
+        if self._timer is None:
+            self._pump()
+
+    async def _admit(self, priority: str, contents: Any) -> Tuple[float, float, int, int]:
+        """Contrôles d'entrée puis attente d'une place. Retourne (début, échéance, tokens réservés, essai du disjoncteur)."""
+        if self.model is None:
+            raise GatewayError("Aucun modèle Gemini n'est configuré.")
+        counters = self.counters[priority]
+        if self.queued[priority] >= self.queue_limits.get(priority, 0):
+            counters["shed"] += 1
+            raise GatewayOverloaded(f"File '{priority}' pleine ({self.queued[priority]} requêtes en attente).")
+        admitted, probe = self.breaker.allow()
+        if not admitted:
+            counters["unavailable"] += 1
+            raise GatewayUnavailable(f"Disjoncteur ouvert : requête '{priority}' refusée sans appel au modèle.")
+
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        deadline = started_at + self.deadlines.get(priority, 30)
+        tokens = estimate_tokens(contents) + self.output_tokens_estimate
+        counters["requests"] += 1
+        try:
+            await self._acquire(priority, tokens, deadline)
+        except asyncio.TimeoutError:
+            self.breaker.record(None, probe)
+            counters["expired_in_queue"] += 1
+            raise GatewayDeadlineExceeded(f"Échéance '{priority}' dépassée en file d'attente.") from None
+        except asyncio.CancelledError:
+            self.breaker.record(None, probe)
+            raise
+        self.wait_times[priority].append(loop.time() - started_at)
+        return started_at, deadline, tokens, probe
+
+    def _settle(self, priority: str, started_at: float, tokens: int, response: Any):
+        self.counters[priority]["completed"] += 1
+        self.latencies[priority].append(asyncio.get_running_loop().time() - started_at)
+        used = getattr(getattr(response, "usage_metadata", None), "total_token_count", None)
+        if isinstance(used, int):
+            # Corrige la réservation avec la consommation réelle.
+            self.tokens_bucket.consume(used - tokens)
+
+    async def generate(self, priority: str, contents: Any, **kwargs) -> Any:
+        """
+        `model.generate_content_async(contents, **kwargs)` sous le contrôle de la passerelle.
+        Lève GatewayUnavailable si le disjoncteur est ouvert, GatewayOverloaded si la file de la classe
+        est pleine, GatewayDeadlineExceeded à l'échéance ; les erreurs du modèle sont propagées.
+        """
+        started_at, deadline, tokens, probe = await self._admit(priority, contents)
+        loop = asyncio.get_running_loop()
+        success = None
+        try:
+            response = await asyncio.wait_for(self.model.generate_content_async(contents, **kwargs), max(deadline - loop.time(), 0))
+            success = True
+        except asyncio.TimeoutError:
+            success = False
+            self.counters[priority]["expired_in_call"] += 1
+            raise GatewayDeadlineExceeded(f"Échéance '{priority}' dépassée pendant l'appel au modèle.") from None
+        except Exception:
+            success = False
+            self.counters[priority]["errors"] += 1
+            raise
+        finally:
+            self._release()
+            self.breaker.record(success, probe)
+        self._settle(priority, started_at, tokens, response)
+        return response
+
+    async def stream(self, priority: str, contents: Any, **kwargs) -> AsyncIterator[str]:
+        """
+        Comme `generate`, avec `stream=True` : produit le texte de chaque fragment reçu. La place est tenue
+        jusqu'à la fin du flux (ou l'abandon par l'appelant) et l'échéance couvre le flux entier.
+        """
+        started_at, deadline, tokens, probe = await self._admit(priority, contents)
+        loop = asyncio.get_running_loop()
+        success = None
+        try:
+            response = await asyncio.wait_for(
+                self.model.generate_content_async(contents, stream=True, **kwargs), max(deadline - loop.time(), 0)
+            )
+            chunks = response.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), max(deadline - loop.time(), 0))
+                except StopAsyncIteration:
+                    break
+                yield chunk.text
+            success = True
+        except asyncio.TimeoutError:
+            success = False
+            self.counters[priority]["expired_in_call"] += 1
+            raise GatewayDeadlineExceeded(f"Échéance '{priority}' dépassée pendant le flux du modèle.") from None
+        except Exception:
+            success = False
+            self.counters[priority]["errors"] += 1
+            raise
+        finally:
+            self._release()
+            # Un flux abandonné par l'appelant (success à None) ne compte ni comme succès ni comme échec.
+            self.breaker.record(success, probe)
+        self._settle(priority, started_at, tokens, response)
+
+    def stats(self) -> Dict[str, Any]:
+        classes = {}
+        for priority in PRIORITIES:
+            waits, latencies = list(self.wait_times[priority]), list(self.latencies[priority])
+            classes[priority] = {
+                **self.counters[priority], "queued": self.queued[priority],
+                "wait_p50": percentile(waits, 0.5), "wait_p95": percentile(waits, 0.95),
+                "latency_p50": percentile(latencies, 0.5), "latency_p95": percentile(latencies, 0.95),
+            }
+        return {"in_flight": self.in_flight, "max_in_flight": self.max_in_flight, "classes": classes, "breaker": self.breaker.stats()}
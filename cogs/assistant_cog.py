@@ -3,11 +3,18 @@ import discord
 from discord.ext import commands
 import json
 import os
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable, Awaitable
 import re
+import asyncio
+import time
+from collections import Counter
 
 # Importation de ManagerCog pour l'autocomplétion
 from .manager_cog import ManagerCog
+from .ai_gateway import PRIORITY_ASSISTANT, GatewayUnavailable
+from .faq_index import question_key
+from .json_stream import JSONStringFieldReader
+from .user_store import TTLCache
 
 # Importation de la librairie Gemini
 try:
@@ -17,11 +24,80 @@ try:
 except ImportError:
     AI_AVAILABLE = False
 
+TECHNICAL_ERROR_RESPONSE = {
+    "response_type": "escalate",
+    "content": "Désolé, une erreur technique est survenue lors de l'analyse de votre question.",
+    "suggested_follow_up": "Puis-je vous aider avec autre chose ?"
+}
+DEGRADED_ESCALATION_RESPONSE = {
+    "response_type": "escalate",
+    "content": "L'assistant IA est momentanément indisponible et aucune FAQ ne correspond à votre question. Créez un ticket avec la commande /ticket pour obtenir de l'aide.",
+    "suggested_follow_up": None
+}
+# Limite de Discord pour la description d'un embed.
+EMBED_DESCRIPTION_LIMIT = 4096
+
+
+class StreamingReply:
+    """
+    Réponse de l'assistant publiée dès les premiers mots du modèle, puis complétée par des éditions
+    espacées d'au moins `interval` secondes (limite d'éditions de Discord). `finish` pose l'embed final.
+    """
+    def __init__(self, message: discord.Message, interval: float, first_post_chars: int):
+        self.message = message
+        self.interval = interval
+        self.first_post_chars = first_post_chars
+        self.reply: Optional[discord.Message] = None
+        self.shown = ""
+        self.last_edit = 0.0
+
+    @staticmethod
+    def _draft_embed(text: str) -> discord.Embed:
+        return discord.Embed(title="💡 Assistant ResellBoost", description=text[:EMBED_DESCRIPTION_LIMIT - 2] + " ▌", color=discord.Color.blue())
+
+    async def update(self, text: str):
+        now = time.monotonic()
+        try:
+            if self.reply is None:
+                if len(text.strip()) < self.first_post_chars:
+                    return
+                self.reply = await self.message.reply(embed=self._draft_embed(text), mention_author=False)
+            elif text != self.shown and now - self.last_edit >= self.interval:
+                await self.reply.edit(embed=self._draft_embed(text))
+            else:
+                return
+        except discord.HTTPException as e:
+            print(f"Erreur d'édition de la réponse en flux: {e}")
+        self.shown = text
+        self.last_edit = now
+
+    async def finish(self, embed: discord.Embed):
+        """Pose l'embed final sur le brouillon ; si le brouillon a disparu ou refuse l'édition, répond à nouveau."""
+        if self.reply is not None:
+            try:
+                await self.reply.edit(embed=embed)
+                return
+            except discord.HTTPException as e:
+                print(f"Erreur d'édition de la réponse finale (envoi d'une nouvelle réponse): {e}")
+        await self.message.reply(embed=embed, mention_author=False)
+        if self.reply is not None:
+            # Le brouillon inachevé ne doit pas rester à côté de la réponse complète.
+            try:
+                await self.reply.delete()
+            except discord.HTTPException:
+                pass
+
+
 class AssistantCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.manager: Optional[ManagerCog] = None
         self.model: Optional[genai.GenerativeModel] = None
+        self.counters: Counter = Counter()
+        # Réponses Gemini par question normalisée, valables pour une version de la base de connaissances et du catalogue.
+        self.answer_cache = TTLCache(max_size=1000, ttl_seconds=3600)
+        self._answer_cache_version: Optional[str] = None
+        self._inflight_answers: Dict[str, asyncio.Future] = {}
 
     async def cog_load(self):
         # Cette méthode est appelée lors du chargement du cog.
@@ -35,12 +111,47 @@ class AssistantCog(commands.Cog):
         else:
             print("⚠️ ATTENTION: AssistantCog désactivé car aucun modèle AI n'est disponible.")
             
-    async def query_gemini_for_answer(self, question: str) -> Optional[Dict[str, Any]]:
+    def local_answer(self, question: str) -> Optional[Dict[str, Any]]:
+        """Réponse tirée directement d'une FAQ quand elle couvre la question, sans appel au modèle."""
+        retrieval = self.manager.config.get("ASSISTANT_CONFIG", {}).get("RETRIEVAL", {})
+        if not retrieval.get("ENABLED", True):
+            return None
+        answer = self.manager.knowledge_index.direct_answer(
+            question, retrieval.get("DIRECT_ANSWER_MIN_CONFIDENCE", 0.75),
+            retrieval.get("DIRECT_ANSWER_MIN_TERMS", 2), retrieval.get("DIRECT_ANSWER_MIN_MARGIN", 1.2)
+        )
+        if answer:
+            self.counters["local_answers"] += 1
+        return answer
+
+    def degraded_answer(self, question: str) -> Dict[str, Any]:
+        """
+        Réponse locale quand le disjoncteur Gemini est ouvert : la FAQ la plus proche quel que soit son score,
+        ou une escalade. Marquée `degraded` pour ne jamais être mise en cache.
+        """
+        self.counters["degraded_answers"] += 1
+        answer = self.manager.knowledge_index.direct_answer(question, 0.0, min_terms=1, min_margin=1.0)
+        if answer is None:
+            return {**DEGRADED_ESCALATION_RESPONSE, "degraded": True}
+        answer["content"] = "*Réponse automatique tirée de la FAQ (assistant IA momentanément indisponible).*\n\n" + answer["content"]
+        return {**answer, "degraded": True}
+
+    async def query_gemini_for_answer(self, question: str, on_text: Optional[Callable[[str], Awaitable[None]]] = None) -> Optional[Dict[str, Any]]:
+        """Avec `on_text`, la réponse est lue en flux et `on_text` reçoit le champ `content` au fur et à mesure."""
         if not self.model or not self.manager:
             return None
 
-        knowledge_base_str = json.dumps(self.manager.knowledge_base.get("faqs", []))
-        products_list_str = json.dumps([{'id': p.get('id'), 'name': p.get('name'), 'category': p.get('category')} for p in self.manager.products])
+        retrieval = self.manager.config.get("ASSISTANT_CONFIG", {}).get("RETRIEVAL", {})
+        if retrieval.get("ENABLED", True):
+            # Seules les FAQs et les produits les plus proches de la question sont envoyés au modèle.
+            index = self.manager.knowledge_index
+            faqs = [faq for faq, _ in index.search_faqs(question, retrieval.get("TOP_K_FAQS", 3))]
+            products = index.search_products(question, retrieval.get("TOP_K_PRODUCTS", 5))
+        else:
+            faqs = self.manager.knowledge_base.get("faqs", [])
+            products = self.manager.products
+        knowledge_base_str = json.dumps(faqs)
+        products_list_str = json.dumps([{'id': p.get('id'), 'name': p.get('name'), 'category': p.get('category')} for p in products])
 
         prompt = f"""
         Tu es "ResellBoost Assistant", un support IA pour le serveur Discord "ResellBoost". Ta mission est de répondre aux questions des utilisateurs en te basant sur les informations fournies.
@@ -71,14 +182,81 @@ class AssistantCog(commands.Cog):
             generation_config = GenerationConfig(
                 response_mime_type="application/json"
             )
-            response = await self.model.generate_content_async(
-                contents=prompt,
-                generation_config=generation_config
-            )
-            return await self.manager._parse_gemini_json_response(response.text)
+            self.counters["model_answers"] += 1
+            self.counters["prompt_chars"] += len(prompt)
+            if on_text is None:
+                response = await self.manager.ai.generate(PRIORITY_ASSISTANT, prompt, generation_config=generation_config)
+                return await self.manager._parse_gemini_json_response(response.text)
+
+            reader = JSONStringFieldReader("content")
+            text = ""
+            async for chunk in self.manager.ai.stream(PRIORITY_ASSISTANT, prompt, generation_config=generation_config):
+                text += chunk
+                shown = reader.value
+                if reader.feed(chunk) != shown:
+                    await on_text(reader.value)
+            # Type de réponse et suggestion ne sont appliqués qu'une fois le JSON complet.
+            parsed = await self.manager._parse_gemini_json_response(text)
+            if parsed is None and reader.value:
+                parsed = {"response_type": "answer", "content": reader.value, "suggested_follow_up": None}
+            return parsed
+        except GatewayUnavailable:
+            return self.degraded_answer(question)
         except Exception as e:
             print(f"Erreur Gemini (Assistant): {e}")
-            return {"response_type": "escalate", "content": "Désolé, une erreur technique est survenue lors de l'analyse de votre question.", "suggested_follow_up": "Puis-je vous aider avec autre chose ?"}
+            return dict(TECHNICAL_ERROR_RESPONSE)
+
+    def configure_answer_cache(self) -> bool:
+        """Applique ASSISTANT_CONFIG.ANSWER_CACHE et vide le cache si les FAQs ou les produits ont changé. Retourne ENABLED."""
+        cache_config = self.manager.config.get("ASSISTANT_CONFIG", {}).get("ANSWER_CACHE", {})
+        self.answer_cache.max_size = cache_config.get("MAX_SIZE", 1000)
+        self.answer_cache.ttl_seconds = cache_config.get("TTL_SECONDS", 3600)
+        version = self.manager.knowledge_index.fingerprint
+        if version != self._answer_cache_version:
+            self.answer_cache.clear()
+            self._answer_cache_version = version
+        return cache_config.get("ENABLED", True)
+
+    @commands.Cog.listener()
+    async def on_static_data_reloaded(self):
+        if self.manager:
+            self.configure_answer_cache()
+
+    async def answer_with_model(self, question: str, on_text: Optional[Callable[[str], Awaitable[None]]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Réponse Gemini mise en cache par question normalisée ; les demandes identiques simultanées partagent un seul appel.
+        Seul l'appelant qui déclenche l'appel reçoit le texte en flux via `on_text`.
+        Disjoncteur ouvert, la réponse vient immédiatement de la FAQ (voir `degraded_answer`).
+        """
+        key = question_key(question)
+        use_cache = bool(key) and self.configure_answer_cache()
+        if use_cache:
+            cached = self.answer_cache.get(key)
+            if cached is not None:
+                return cached
+        if self.manager.ai.breaker.rejecting:
+            return self.degraded_answer(question)
+        if not use_cache:
+            return await self.query_gemini_for_answer(question, on_text)
+        pending = self._inflight_answers.get(key)
+        if pending is not None:
+            self.counters["coalesced_answers"] += 1
+            return await asyncio.shield(pending)
+
+        version = self._answer_cache_version
+        future = asyncio.get_running_loop().create_future()
+        self._inflight_answers[key] = future
+        result = None
+        try:
+            result = await self.query_gemini_for_answer(question, on_text)
+            # Ni les erreurs ni les réponses rendues avec une base de connaissances remplacée entre-temps.
+            if (isinstance(result, dict) and result != TECHNICAL_ERROR_RESPONSE and not result.get("degraded")
+                    and version == self._answer_cache_version):
+                self.answer_cache.put(key, result)
+        finally:
+            self._inflight_answers.pop(key, None)
+            future.set_result(result)
+        return result
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
@@ -101,13 +279,25 @@ class AssistantCog(commands.Cog):
             question = re.sub(r'<@!?\d+>', '', message.content).strip()
             if not question: return
             
-            async with message.channel.typing():
-                response_data = await self.query_gemini_for_answer(question)
+            response_data = self.local_answer(question)
+            if response_data is None:
+                streaming = assistant_config.get("STREAMING", {})
+                async with message.channel.typing():
+                    if streaming.get("ENABLED", True):
+                        reply = StreamingReply(message, streaming.get("EDIT_INTERVAL_SECONDS", 1.2), streaming.get("FIRST_POST_MIN_CHARS", 30))
+                        response_data = await self.answer_with_model(question, on_text=reply.update)
+                        if response_data:
+                            await reply.finish(self.build_response_embed(response_data))
+                        return
+                    response_data = await self.answer_with_model(question)
             
             if response_data:
                 await self.handle_ia_response(message, response_data)
 
     async def handle_ia_response(self, message: discord.Message, response_data: Dict[str, Any]):
+        await message.reply(embed=self.build_response_embed(response_data), mention_author=False)
+
+    def build_response_embed(self, response_data: Dict[str, Any]) -> discord.Embed:
         response_type = response_data.get("response_type")
         content = response_data.get("content", "Désolé, je n'ai pas de réponse à cela.")
         follow_up = response_data.get("suggested_follow_up")
@@ -121,11 +311,10 @@ class AssistantCog(commands.Cog):
             embed.title = "🤔 Une aide humaine est peut-être nécessaire"
             embed.color = discord.Color.orange()
             
-        embed.description = content
+        embed.description = content[:EMBED_DESCRIPTION_LIMIT]
         if follow_up:
             embed.set_footer(text=f"Suggestion : {follow_up}")
-        
-        await message.reply(embed=embed, mention_author=False)
+        return embed
 
 
 async def setup(bot: commands.Bot):
@@ -6,7 +6,7 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timezone
 import uuid
 import re
@@ -15,6 +15,9 @@ import re
 from .manager_cog import ManagerCog
 from .manager_cog import TicketCloseView, TicketCreationView
 
+# Nombre maximal d'options d'un menu déroulant Discord.
+SELECT_MAX_OPTIONS = 25
+
 # --- Vues et Modals pour l'Interaction avec le Catalogue ---
 
 class PurchasePromoView(discord.ui.View):
@@ -273,10 +276,11 @@ class OptionSelect(discord.ui.Select):
         await action_view.start_purchase_flow(interaction)
 
 class ProductSelect(discord.ui.Select):
-    def __init__(self, cog: 'CatalogueCog', products: List[Dict]):
+    def __init__(self, cog: 'CatalogueCog', category: str, page: int = 0):
         self.cog = cog
-        self.products = products
-        options = [discord.SelectOption(label=p['name'][:100], value=p['id']) for p in products]
+        self.category = category
+        self.page = page
+        options = list(cog.index.product_pages[category][page])
         super().__init__(placeholder="Choisissez un produit pour voir les détails...", options=options, custom_id="product_select_menu")
 
     async def callback(self, interaction: discord.Interaction):
@@ -286,11 +290,10 @@ class ProductSelect(discord.ui.Select):
         if not product:
             return await interaction.edit_original_response(content="Ce produit n'existe plus.", view=None, embed=None)
 
-        embed = self.cog.create_product_embed(product)
+        embed = self.cog.index.embeds.get(product_id) or self.cog.create_product_embed(product)
         
         # Create a fresh view to avoid adding items to an existing one
-        new_view = CatalogueBrowseView(self.cog, [opt.label for opt in self.view.children[0].options]) # Recreate category select
-        new_view.add_item(ProductSelect(self.cog, self.products)) # Re-add product select
+        new_view = CatalogueBrowseView(self.cog, self.category, self.page)
 
         # Add the correct action view
         if product.get("options"):
@@ -306,66 +309,133 @@ class ProductSelect(discord.ui.Select):
         await interaction.edit_original_response(embed=embed, view=new_view)
 
 
+class CategorySelect(discord.ui.Select):
+    def __init__(self, cog: 'CatalogueCog'):
+        self.cog = cog
+        super().__init__(placeholder="Choisissez une catégorie...", options=list(cog.index.category_options), custom_id="category_select_menu")
+
+    async def callback(self, interaction: discord.Interaction):
+        await interaction.response.defer()
+        category = self.values[0]
+        if category not in self.cog.index.product_pages:
+            return await interaction.edit_original_response(content="Cette catégorie n'existe plus.", view=None, embed=None)
+        await interaction.edit_original_response(embed=self.cog.index.page_embeds[category][0], view=CatalogueBrowseView(self.cog, category))
+
+
+class CataloguePageButton(discord.ui.Button):
+    def __init__(self, cog: 'CatalogueCog', category: str, page: int, label: str, disabled: bool):
+        super().__init__(label=label, style=discord.ButtonStyle.secondary, disabled=disabled)
+        self.cog = cog
+        self.category = category
+        self.page = page
+
+    async def callback(self, interaction: discord.Interaction):
+        await interaction.response.defer()
+        pages = self.cog.index.page_embeds.get(self.category, [])
+        if self.page >= len(pages):
+            return await interaction.edit_original_response(content="Cette page n'existe plus.", view=None, embed=None)
+        await interaction.edit_original_response(embed=pages[self.page], view=CatalogueBrowseView(self.cog, self.category, self.page))
+
+
 class CatalogueBrowseView(discord.ui.View):
-    def __init__(self, cog: 'CatalogueCog', categories: List[str]):
+    def __init__(self, cog: 'CatalogueCog', category: Optional[str] = None, page: int = 0):
         super().__init__(timeout=300)
         self.cog = cog
         self.manager = cog.manager
-        
-        self.add_item(discord.ui.Select(
-            placeholder="Choisissez une catégorie...",
-            options=[discord.SelectOption(label=cat) for cat in categories],
-            custom_id="category_select_menu"
-        ))
-        
-    @discord.ui.select(custom_id="category_select_menu")
-    async def on_category_select(self, interaction: discord.Interaction, select: discord.ui.Select):
-        await interaction.response.defer()
-        category = select.values[0]
-        products_in_category = [p for p in self.manager.products if p.get('category') == category]
 
-        # Create a new view for the next step
-        new_view = CatalogueBrowseView(self.cog, [opt.label for opt in select.options])
-        new_view.add_item(ProductSelect(self.cog, products_in_category))
-        
+        self.add_item(CategorySelect(cog))
+        # La catégorie a pu disparaître ou rétrécir depuis un rechargement du catalogue.
+        page_count = len(cog.index.product_pages.get(category, []))
+        if page >= page_count:
+            return
+        self.add_item(ProductSelect(cog, category, page))
+        if page_count > 1:
+            self.add_item(CataloguePageButton(cog, category, page - 1, "◀ Précédents", disabled=page == 0))
+            self.add_item(CataloguePageButton(cog, category, page + 1, "Suivants ▶", disabled=page >= page_count - 1))
+
+
+class CatalogueIndex:
+    """
+    Index du catalogue construit une fois au chargement de products.json : catégories triées,
+    produits par catégorie découpés en pages de 25 (limite des menus Discord), embeds et
+    options de menu préconstruits. Aucune interaction ne reparcourt la liste des produits.
+    """
+    def __init__(self, cog: 'CatalogueCog', products: List[Dict[str, Any]]):
+        self.display_prices: Dict[str, str] = {}
+        self.embeds: Dict[str, discord.Embed] = {}
+        by_category: Dict[str, List[Dict[str, Any]]] = {}
+        for product in products:
+            if not product.get('id'):
+                continue
+            self.display_prices[product['id']] = format_display_price(product)
+            self.embeds[product['id']] = cog.create_product_embed(product, self.display_prices[product['id']])
+            if product.get('category'):
+                by_category.setdefault(product['category'], []).append(product)
+
+        self.categories: List[str] = sorted(by_category)
+        if len(self.categories) > SELECT_MAX_OPTIONS:
+            print(f"ATTENTION: {len(self.categories)} catégories, seules les {SELECT_MAX_OPTIONS} premières sont proposées dans /catalogue.")
+        self.category_options = tuple(discord.SelectOption(label=cat[:100], value=cat) for cat in self.categories[:SELECT_MAX_OPTIONS])
+        self.by_category = by_category
+        self.product_pages: Dict[str, List[Tuple[discord.SelectOption, ...]]] = {}
+        self.page_embeds: Dict[str, List[discord.Embed]] = {}
+        for category, items in by_category.items():
+            chunks = [items[i:i + SELECT_MAX_OPTIONS] for i in range(0, len(items), SELECT_MAX_OPTIONS)]
+            self.product_pages[category] = [
+                tuple(discord.SelectOption(label=p['name'][:100], value=p['id'], description=self.display_prices[p['id']].replace('`', '')[:100]) for p in chunk)
+                for chunk in chunks
+            ]
+            self.page_embeds[category] = [self._category_embed(category, page, len(chunks)) for page in range(len(chunks))]
+
+    @staticmethod
+    def _category_embed(category: str, page: int, page_count: int) -> discord.Embed:
         embed = discord.Embed(
             title=f"Catalogue - {category}",
             description="Veuillez sélectionner un produit dans le menu ci-dessous pour afficher ses détails et l'acheter.",
             color=discord.Color.blurple()
         )
-        await interaction.edit_original_response(embed=embed, view=new_view)
-        
+        if page_count > 1:
+            embed.set_footer(text=f"Page {page + 1}/{page_count}")
+        return embed
+
+
+def format_display_price(product: Dict[str, Any]) -> str:
+    currency = product.get("currency", "EUR")
+    if "options" in product and product.get("options"):
+        try:
+            prices = [opt['price'] for opt in product['options']]
+            min_price = min(prices)
+            return f"À partir de `{min_price:.2f} {currency}`"
+        except (ValueError, TypeError):
+             return "`Prix variable`"
+    elif "price_text" in product:
+        return f"`{product['price_text']}`"
+    else:
+        price = product.get('price', 0.0)
+        if price < 0:
+            return "`Prix sur demande`"
+        return f"`{price:.2f} {currency}`"
+
 class CatalogueCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.manager: Optional[ManagerCog] = None
+        self.index: Optional[CatalogueIndex] = None
 
     async def cog_load(self):
         self.manager = self.bot.get_cog('ManagerCog')
         if not self.manager:
             print("ERREUR CRITIQUE: CatalogueCog n'a pas pu trouver le ManagerCog.")
         else:
+            self.build_index()
             self.bot.add_view(PaymentVerificationView(self.manager))
             self.bot.add_view(PurchasePromoView(self.manager))
 
     def get_display_price(self, product: Dict[str, Any]) -> str:
-        currency = product.get("currency", "EUR")
-        if "options" in product and product.get("options"):
-            try:
-                prices = [opt['price'] for opt in product['options']]
-                min_price = min(prices)
-                return f"À partir de `{min_price:.2f} {currency}`"
-            except (ValueError, TypeError):
-                 return "`Prix variable`"
-        elif "price_text" in product:
-            return f"`{product['price_text']}`"
-        else:
-            price = product.get('price', 0.0)
-            if price < 0:
-                return "`Prix sur demande`"
-            return f"`{price:.2f} {currency}`"
+        cached = self.index.display_prices.get(product.get('id')) if self.index else None
+        return cached or format_display_price(product)
 
-    def create_product_embed(self, product: Dict[str, Any]) -> discord.Embed:
+    def create_product_embed(self, product: Dict[str, Any], display_price: Optional[str] = None) -> discord.Embed:
         embed = discord.Embed(
             title=f"🛒 {product.get('name', 'Produit sans nom')}",
             description=product.get("description", "Pas de description."),
@@ -375,17 +445,23 @@ class CatalogueCog(commands.Cog):
         if product.get("image_url"):
             embed.set_thumbnail(url=product.get("image_url"))
         
-        embed.add_field(name="Prix", value=self.get_display_price(product), inline=True)
+        embed.add_field(name="Prix", value=display_price or self.get_display_price(product), inline=True)
         embed.add_field(name="Catégorie", value=product.get("category", "N/A"), inline=True)
         return embed
     
+    def prepare_index(self, products: List[Dict[str, Any]]) -> 'CatalogueIndex':
+        """Construit un index sans l'activer (appelé hors de la boucle d'événements lors d'un rechargement)."""
+        return CatalogueIndex(self, products)
+
+    def build_index(self):
+        self.index = self.prepare_index(self.manager.products)
+        print(f"Index du catalogue construit : {len(self.index.embeds)} produits, {len(self.index.categories)} catégories.")
+
     @app_commands.command(name="catalogue", description="Affiche les produits disponibles de manière interactive.")
     async def catalogue(self, interaction: discord.Interaction):
-        if not self.manager: return await interaction.response.send_message("Erreur interne.", ephemeral=True)
-        
-        categories = sorted(list(set(p['category'] for p in self.manager.products if p.get('category'))))
+        if not self.manager or not self.index: return await interaction.response.send_message("Erreur interne.", ephemeral=True)
         
-        view = CatalogueBrowseView(self, categories)
+        view = CatalogueBrowseView(self)
         embed = discord.Embed(
             title="Bienvenue au Catalogue ResellBoost",
             description="Veuillez choisir une catégorie dans le menu déroulant pour commencer.",
@@ -397,13 +473,13 @@ class CatalogueCog(commands.Cog):
     @app_commands.command(name="produit", description="Affiche les détails d'un produit par son ID.")
     @app_commands.describe(id="L'ID unique du produit (ex: vbucks)")
     async def produit(self, interaction: discord.Interaction, id: str):
-        if not self.manager: return await interaction.response.send_message("Erreur interne du bot.", ephemeral=True)
+        if not self.manager or not self.index: return await interaction.response.send_message("Erreur interne du bot.", ephemeral=True)
         
         product = self.manager.get_product(id)
         if not product:
             return await interaction.response.send_message("Ce produit est introuvable.", ephemeral=True)
 
-        embed = self.create_product_embed(product)
+        embed = self.index.embeds.get(id) or self.create_product_embed(product)
         
         if product.get("options"):
             view = discord.ui.View(timeout=180)
@@ -3,13 +3,13 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 from typing import Optional, List, Dict, Any
-import json
 from datetime import datetime, timedelta, timezone
 from google.cloud import firestore
 from google.cloud.firestore_v1.transaction import async_transactional
 
 from .manager_cog import ManagerCog
 from .lottery_cog import LotteryCog
+from .static_data import StaticDataError, read_json_file, validate_shop_items
 
 CREDIT_SHOP_ITEMS_FILE = 'credit_shop_items.json'
 
@@ -78,9 +78,6 @@ class CreditShopView(discord.ui.View):
             if user_data.get("store_credit", 0.0) < cost:
                 return {"success": False, "reason": "Fonds insuffisants."}
             
-            # Deduct credits
-            await self.manager.add_transaction(trans, ref, "store_credit", -cost, f"Achat boutique: {item_data['name']}")
-            
             # Apply booster effect
             now = datetime.now(timezone.utc)
             active_boosters = user_data.get('active_boosters', {})
@@ -92,12 +89,17 @@ class CreditShopView(discord.ui.View):
                 expires = now + timedelta(days=3)
                 active_boosters['commission_booster_1'] = {'expires_at': expires.isoformat(), 'bonus': 0.10}
                 
-            trans.update(ref, {'active_boosters': active_boosters})
-            return {"success": True}
+            # Débit et booster écrits en une seule opération sur le document
+            mutation = (self.manager.mutation()
+                .add(ref.id, "store_credit", -cost, f"Achat boutique: {item_data['name']}")
+                .set(ref.id, 'active_boosters', active_boosters))
+            await mutation.apply(trans, {ref.id: user_data})
+            return {"success": True, "mutation": mutation}
         
         result = await purchase_booster_tx(self.manager.db.transaction(), user_ref, item)
         
         if result['success']:
+            result["mutation"].after_commit()
             await interaction.response.send_message(f"✅ Achat réussi ! Vous avez activé **{item['name']}**.", ephemeral=True)
         else:
             await interaction.response.send_message(f"❌ {result['reason']}", ephemeral=True)
@@ -109,11 +111,17 @@ class CreditShopCog(commands.Cog):
         self.lottery_cog: Optional[LotteryCog] = None
         self.shop_items: List[Dict[str, Any]] = []
 
+    def read_items(self) -> List[Dict[str, Any]]:
+        """Lit et valide les articles (lève StaticDataError). Bloquant : utilisé via asyncio.to_thread au rechargement."""
+        items = read_json_file(CREDIT_SHOP_ITEMS_FILE, list)
+        validate_shop_items(CREDIT_SHOP_ITEMS_FILE, items)
+        return items
+
     async def _load_items(self):
+        self.manager.static_watcher.watch(CREDIT_SHOP_ITEMS_FILE)
         try:
-            with open(CREDIT_SHOP_ITEMS_FILE, 'r', encoding='utf-8') as f:
-                self.shop_items = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
+            self.shop_items = self.read_items()
+        except StaticDataError as e:
             print(f"Erreur de chargement du fichier de la boutique à crédits: {e}")
             self.shop_items = []
 
@@ -85,7 +85,7 @@ class EventsCog(commands.Cog):
         await self.manager.db.collection('system').document('events').set({'active': self.manager.active_events}, merge=True)
         
         announce_channel_name = self.manager.config["CHANNELS"].get("ANNOUNCEMENTS")
-        channel = discord.utils.get(interaction.guild.text_channels, name=announce_channel_name)
+        channel = self.manager.resources.channel(interaction.guild, announce_channel_name)
         if channel:
             embed = discord.Embed(title=f"🎉 Événement Serveur Activé : {event_config['name']} ! 🎉",
                                   description=f"Profitez de cet avantage exceptionnel jusqu'au <t:{int(end_time.timestamp())}:F> (<t:{int(end_time.timestamp())}:R>) !",
@@ -0,0 +1,198 @@
+
+import asyncio
+import hashlib
+import json
+import random
+import re
+from collections import Counter
+from types import SimpleNamespace
+from typing import Dict, Any, Optional, List, Tuple, AsyncIterator
+
+# Profil par défaut du modèle simulé (surchargé par un fichier JSON, voir load_fake_profile).
+DEFAULT_PROFILE: Dict[str, Any] = {
+    "SEED": 1234,
+    # Latence avant le premier token : loi log-normale de médiane MEDIAN et d'écart-type SIGMA (en log).
+    "LATENCY_MS": {"MEDIAN": 450, "SIGMA": 0.45, "MIN": 40},
+    "PER_OUTPUT_TOKEN_MS": 4,
+    # Multiplie toutes les durées (0.1 pour des benchmarks rapides).
+    "LATENCY_SCALE": 1.0,
+    "ERROR_RATE": 0.01,
+    # Part des requêtes qui ne répondent pas avant TIMEOUT_SECONDS.
+    "TIMEOUT_RATE": 0.0,
+    "TIMEOUT_SECONDS": 60,
+    "STREAM_CHUNK_CHARS": 40,
+    "MODERATION_RULES": [
+        {"pattern": r"discord\.gg/|https?://", "action": "DELETE_AND_WARN",
+         "reason": "Publicité non autorisée dans ce salon. Veuillez utiliser les salons dédiés."},
+        {"pattern": r"\b(?:vends?|ach[eè]te|wts|wtb)\b", "action": "DELETE_AND_WARN", "except_channels": ["marketplace"],
+         "reason": "Les transactions entre membres se font uniquement dans le forum #marketplace."},
+        {"pattern": r"\b(?:idiot|abruti|nul)\b", "action": "WARN", "reason": "Langage irrespectueux."},
+        {"pattern": r"\b(?:arnaque|menace)\b", "action": "NOTIFY_STAFF", "reason": "Contenu suspect signalé au staff."}
+    ],
+    # Réponses imposées, testées avant les règles : [{"match": regex sur le prompt, "response": texte}].
+    "SCRIPTED": []
+}
+
+ASSISTANT_QUESTION_PATTERN = re.compile(r'Question de l\'utilisateur: "(.*?)"\n', re.DOTALL)
+ASSISTANT_FAQS_PATTERN = re.compile(r"Base de connaissances \(FAQs\):\s*(\[.*?\])\s*\n", re.DOTALL)
+
+
+class FakeGeminiError(RuntimeError):
+    """Erreur injectée par le modèle simulé (équivalent d'un 503 de l'API)."""
+
+
+def load_fake_profile(path: Optional[str] = None) -> Dict[str, Any]:
+    """Profil par défaut, éventuellement complété par le fichier JSON `path` (clés de premier niveau)."""
+    profile = json.loads(json.dumps(DEFAULT_PROFILE))
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            profile.update(json.load(f))
+    return profile
+
+
+def template_pattern(template: str) -> re.Pattern:
+    """Expression reconnaissant un prompt rempli à partir de `template` ; chaque {champ} devient un groupe nommé."""
+    parts = re.split(r"\{(\w+)\}", template)
+    regex, seen = "", set()
+    for position, part in enumerate(parts):
+        if position % 2 == 0:
+            regex += re.escape(part)
+        elif part in seen:
+            regex += f"(?P={part})"
+        else:
+            seen.add(part)
+            regex += f"(?P<{part}>.*?)"
+    return re.compile(regex, re.DOTALL)
+
+
+def count_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+class FakeResponse:
+    """Réponse au format de `generate_content_async` : `.text`, `.usage_metadata`, et itération asynchrone en mode flux."""
+    def __init__(self, text: str, usage: SimpleNamespace, chunks: Optional[List[Tuple[float, str]]] = None):
+        self.text = text
+        self.usage_metadata = usage
+        self._chunks = chunks or []
+
+    async def __aiter__(self) -> AsyncIterator[SimpleNamespace]:
+        for delay, chunk in self._chunks:
+            await asyncio.sleep(delay)
+            yield SimpleNamespace(text=chunk)
+
+
+class FakeGenerativeModel:
+    """
+    Remplaçant local de `genai.GenerativeModel` pour les tests et benchmarks hors ligne (GEMINI_BACKEND=fake).
+    Reconnaît les prompts de modération (simple et par lot), de l'assistant, des promos et du coaching,
+    et y répond par règles avec une latence, un taux d'erreur et une consommation de tokens configurables.
+    """
+    def __init__(self, profile: Optional[Dict[str, Any]] = None):
+        self.profile = profile or load_fake_profile()
+        self.usage: Counter = Counter()
+        self._occurrences: Counter = Counter()
+        self.prompts: List[Tuple[str, re.Pattern]] = []
+        self.moderation_rules = [
+            (re.compile(rule["pattern"], re.IGNORECASE), rule) for rule in self.profile.get("MODERATION_RULES", [])
+        ]
+        self.scripted = [(re.compile(item["match"], re.DOTALL), item["response"]) for item in self.profile.get("SCRIPTED", [])]
+
+    def configure(self, config: Dict[str, Any]):
+        """Compile les prompts de config.json pour les reconnaître (à rappeler après un rechargement)."""
+        moderation = config.get("MODERATION_CONFIG", {})
+        processing = config.get("AI_PROCESSING_CONFIG", {})
+        templates = [
+            ("moderation_batch", moderation.get("AI_BATCH_MODERATION_PROMPT")),
+            ("moderation", moderation.get("AI_MODERATION_PROMPT")),
+            ("promo", processing.get("AI_PROMO_GENERATION_PROMPT")),
+            ("coaching", processing.get("AI_WEEKLY_COACH_PROMPT")),
+        ]
+        self.prompts = [(kind, template_pattern(template)) for kind, template in templates if template]
+
+    # --- Réponses par règles ---
+
+    def _verdict(self, content: str, channel: str) -> Dict[str, str]:
+        for pattern, rule in self.moderation_rules:
+            if pattern.search(content) and channel not in rule.get("except_channels", []):
+                return {"action": rule["action"], "reason": rule["reason"]}
+        return {"action": "PASS", "reason": "Message acceptable."}
+
+    def _answer(self, prompt: str) -> Tuple[str, str]:
+        for pattern, response in self.scripted:
+            if pattern.search(prompt):
+                return "scripted", response
+        for kind, pattern in self.prompts:
+            match = pattern.fullmatch(prompt)
+            if not match:
+                continue
+            fields = match.groupdict()
+            if kind == "moderation":
+                return kind, json.dumps(self._verdict(fields["user_message"], fields["channel_name"]), ensure_ascii=False)
+            if kind == "moderation_batch":
+                items = json.loads(fields["messages_json"])
+                verdicts = {item["id"]: self._verdict(item["content"], item["channel"]) for item in items}
+                return kind, json.dumps({"verdicts": verdicts}, ensure_ascii=False)
+            if kind == "promo":
+                description = f"🔥 **{fields['product_name']}** 🔥\n\n{fields['short_description']}\n\n👉 Offre limitée, profitez-en vite !"
+                return kind, json.dumps({"generated_description": description}, ensure_ascii=False)
+            if kind == "coaching":
+                return kind, (f"Salut {fields['username']} ! Belle semaine avec {fields['weekly_xp']} XP et "
+                              f"{fields['weekly_affiliate_earnings']} crédits d'affiliation. Objectif : faire encore mieux la semaine prochaine !")
+
+        question = ASSISTANT_QUESTION_PATTERN.search(prompt)
+        if question:
+            faqs_match = ASSISTANT_FAQS_PATTERN.search(prompt)
+            faqs = json.loads(faqs_match.group(1)) if faqs_match else []
+            if faqs:
+                answer = {"response_type": "answer", "content": faqs[0]["answer"], "suggested_follow_up": faqs[1]["question"] if len(faqs) > 1 else None}
+            else:
+                answer = {"response_type": "escalate", "content": "Je n'ai pas trouvé de réponse : crée un ticket avec /ticket.", "suggested_follow_up": None}
+            return "assistant", json.dumps(answer, ensure_ascii=False)
+        return "unknown", "{}"
+
+    # --- Interface de genai.GenerativeModel ---
+
+    def _random_for(self, prompt: str) -> random.Random:
+        """Tirages propres à chaque requête (graine, prompt, rang de répétition) : indépendants de l'ordre d'arrivée."""
+        digest = hashlib.blake2b(prompt.encode("utf-8"), digest_size=8).hexdigest()
+        self._occurrences[digest] += 1
+        return random.Random(f"{self.profile.get('SEED')}:{digest}:{self._occurrences[digest]}")
+
+    def _latency(self, draws: random.Random) -> float:
+        latency = self.profile.get("LATENCY_MS", {})
+        median = latency.get("MEDIAN", 450)
+        seconds = max(latency.get("MIN", 0), draws.lognormvariate(0, latency.get("SIGMA", 0.45)) * median) / 1000
+        return seconds * self.profile.get("LATENCY_SCALE", 1.0)
+
+    async def generate_content_async(self, contents: Any, generation_config: Any = None, stream: bool = False, **kwargs) -> FakeResponse:
+        prompt = contents if isinstance(contents, str) else str(contents)
+        kind, text = self._answer(prompt)
+        prompt_tokens, output_tokens = count_tokens(prompt), count_tokens(text)
+        self.usage["calls"] += 1
+        self.usage[f"calls_{kind}"] += 1
+        self.usage["prompt_tokens"] += prompt_tokens
+
+        draws = self._random_for(prompt)
+        draw = draws.random()
+        first_token_delay = self._latency(draws)
+        if draw < self.profile.get("TIMEOUT_RATE", 0):
+            self.usage["timeouts"] += 1
+            await asyncio.sleep(self.profile.get("TIMEOUT_SECONDS", 60))
+            raise FakeGeminiError("504 Deadline Exceeded (simulé)")
+        if draw < self.profile.get("TIMEOUT_RATE", 0) + self.profile.get("ERROR_RATE", 0):
+            self.usage["errors"] += 1
+            await asyncio.sleep(first_token_delay)
+            raise FakeGeminiError("503 Service Unavailable (simulé)")
+
+        self.usage["output_tokens"] += output_tokens
+        usage = SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=output_tokens, total_token_count=prompt_tokens + output_tokens)
+        per_token = self.profile.get("PER_OUTPUT_TOKEN_MS", 4) / 1000 * self.profile.get("LATENCY_SCALE", 1.0)
+        if not stream:
+            await asyncio.sleep(first_token_delay + output_tokens * per_token)
+            return FakeResponse(text, usage)
+
+        size = max(1, self.profile.get("STREAM_CHUNK_CHARS", 40))
+        chunks = [(count_tokens(text[i:i + size]) * per_token, text[i:i + size]) for i in range(0, len(text), size)]
+        await asyncio.sleep(first_token_delay)
+        return FakeResponse(text, usage, chunks)
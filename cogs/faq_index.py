@@ -0,0 +1,134 @@
+
+import hashlib
+import json
+import math
+import re
+from collections import Counter
+from typing import Dict, Any, List, Tuple, Optional
+
+from .moderation_filter import normalize_text
+
+# Mots trop fréquents en français pour départager des documents.
+STOPWORDS = frozenset("""
+a au aux avec ce ces c cest comment d dans de des du elle en est et il ils j je jai l la le les leur lui m ma
+mais me mes mon n ne nos notre nous on ou par pas pour qu que quel quelle quels quelles qui sa se ses son
+sont sur t ta te tes toi ton tu un une vos votre vous y ca cela quoi faire fait peux peut ai as avoir
+""".split())
+
+# Marques de négation : "je ne reçois pas mes achats" signale un problème, pas une question pratique.
+NEGATIONS = frozenset("ne n pas jamais plus aucun aucune rien".split())
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Minuscules sans accents, traits d'union retirés (V-Bucks -> vbucks), mots vides écartés, pluriels en -s réduits."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(normalize_text(text).replace("-", "")):
+        if token in STOPWORDS or (len(token) < 2 and not token.isdigit()):
+            continue
+        if len(token) > 4 and token.endswith("s"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def negations(text: str) -> frozenset:
+    """Marques de négation présentes dans le texte (écartées par `tokenize` comme mots vides)."""
+    return NEGATIONS.intersection(TOKEN_PATTERN.findall(normalize_text(text)))
+
+
+def question_key(question: str) -> str:
+    """
+    Clé de cache d'une question : ses termes significatifs triés ("moyens de paiement ?" = "paiement, quels moyens ?"),
+    négations comprises pour que "je peux payer par paypal" et "je ne peux pas payer par paypal" restent distinctes.
+    """
+    return " ".join(sorted(set(tokenize(question)) | negations(question)))
+
+
+class BM25Index:
+    """Index inversé BM25 sur une liste de textes ; les scores ne sont calculés que pour les documents partageant un terme avec la requête."""
+    def __init__(self, documents: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.lengths: List[int] = []
+        self.terms: List[frozenset] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        for doc_id, text in enumerate(documents):
+            counts = Counter(tokenize(text))
+            self.lengths.append(sum(counts.values()))
+            self.terms.append(frozenset(counts))
+            for token, frequency in counts.items():
+                self.postings.setdefault(token, []).append((doc_id, frequency))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        count = len(documents)
+        self.idf: Dict[str, float] = {
+            token: math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5)) for token, posting in self.postings.items()
+        }
+        # Poids d'un terme absent de l'index : au moins celui du terme le plus rare.
+        self.unknown_idf = math.log(1 + (count + 0.5) / 0.5)
+
+    def search(self, query_tokens: List[str], top_k: int) -> List[Tuple[int, float]]:
+        scores: Dict[int, float] = {}
+        for token in set(query_tokens):
+            idf = self.idf.get(token)
+            if idf is None:
+                continue
+            for doc_id, frequency in self.postings[token]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / (self.average_length or 1))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    def coverage(self, query_tokens: List[str], doc_id: int) -> float:
+        """Part (pondérée par l'idf) des termes de la requête présents dans le document."""
+        terms = set(query_tokens)
+        total = sum(self.idf.get(token, self.unknown_idf) for token in terms)
+        matched = sum(self.idf[token] for token in terms & self.terms[doc_id])
+        return matched / total if total else 0.0
+
+
+class KnowledgeIndex:
+    """
+    Recherche locale dans les FAQs de knowledge_base.json et le catalogue, construite au chargement des données statiques.
+    La question d'une FAQ compte double par rapport à sa réponse.
+    """
+    def __init__(self, faqs: List[Dict[str, Any]], products: List[Dict[str, Any]]):
+        self.faqs = [faq for faq in faqs if faq.get("question") and faq.get("answer")]
+        # Empreinte de la base de connaissances et du catalogue : change quand l'un des deux fichiers change.
+        self.fingerprint = hashlib.blake2b(
+            json.dumps([faqs, products], sort_keys=True, ensure_ascii=False).encode("utf-8"), digest_size=16
+        ).hexdigest()
+        self.products = products
+        self.faq_index = BM25Index([f"{faq['question']} {faq['question']} {faq['answer']}" for faq in self.faqs])
+        self.product_index = BM25Index([
+            " ".join([p.get("name", ""), p.get("category", ""), p.get("description", ""), " ".join(p.get("tags") or [])])
+            for p in products
+        ])
+
+    def search_faqs(self, question: str, top_k: int = 3) -> List[Tuple[Dict[str, Any], float]]:
+        """FAQs classées par pertinence, avec leur couverture de la question (0 à 1)."""
+        tokens = tokenize(question)
+        return [(self.faqs[doc_id], self.faq_index.coverage(tokens, doc_id)) for doc_id, _ in self.faq_index.search(tokens, top_k)]
+
+    def search_products(self, question: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        return [self.products[doc_id] for doc_id, _ in self.product_index.search(tokenize(question), top_k)]
+
+    def direct_answer(self, question: str, min_confidence: float, min_terms: int = 2, min_margin: float = 1.2) -> Optional[Dict[str, Any]]:
+        """
+        Réponse au format de l'assistant quand une FAQ couvre nettement la question, sinon None : la question
+        ne doit pas contenir de négation (signalement d'un problème), la FAQ doit partager au moins `min_terms`
+        termes avec elle et son score BM25 dépasser celui de la suivante d'un facteur `min_margin`.
+        """
+        if negations(question):
+            return None
+        tokens = tokenize(question)
+        hits = self.faq_index.search(tokens, top_k=2)
+        if not hits:
+            return None
+        doc_id, score = hits[0]
+        if len(set(tokens) & self.faq_index.terms[doc_id]) < min_terms or self.faq_index.coverage(tokens, doc_id) < min_confidence:
+            return None
+        if len(hits) > 1 and score < hits[1][1] * min_margin:
+            return None
+        follow_up = self.faqs[hits[1][0]]["question"] if len(hits) > 1 else None
+        return {"response_type": "answer", "content": self.faqs[doc_id]["answer"], "suggested_follow_up": follow_up}
@@ -63,7 +63,7 @@ class GiveawayCog(commands.Cog):
         if not channel_name:
             return await interaction.response.send_message("Le canal de giveaway n'est pas configuré.", ephemeral=True)
         
-        channel = discord.utils.get(interaction.guild.text_channels, name=channel_name)
+        channel = self.manager.resources.channel(interaction.guild, channel_name)
         if not channel:
             return await interaction.response.send_message(f"Le canal `{channel_name}` est introuvable.", ephemeral=True)
 
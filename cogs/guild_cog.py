@@ -50,6 +50,7 @@ class GuildInviteView(discord.ui.View):
             if role: await interaction.user.add_roles(role)
             
             await user_ref.update({"guild_id": self.guild_id})
+            self.manager.invalidate_user(user_ref.id)
             await guild_ref.update({"members": firestore.ArrayUnion([str(interaction.user.id)])})
             
             original_embed.description = f"Vous avez rejoint la guilde **{self.guild_name}** !"
@@ -134,7 +135,7 @@ class GuildCog(commands.Cog):
         try:
             # Create Discord assets first
             guild_category_name = guild_config.get("GUILD_CATEGORY_NAME", "Guildes")
-            category = discord.utils.get(interaction.guild.categories, name=guild_category_name)
+            category = self.manager.resources.category(interaction.guild, guild_category_name)
             if not category:
                 category = await interaction.guild.create_category(guild_category_name)
 
@@ -150,20 +151,24 @@ class GuildCog(commands.Cog):
             # Atomically update DB
             @async_transactional
             async def create_guild_transaction(trans, user_ref, guild_ref):
-                # Deduct cost
-                await self.manager.add_transaction(trans, user_ref, "store_credit", -cost, f"Création de la guilde '{nom}'")
+                # Deduct cost and link the user (single read/write of the user doc)
+                mutation = (self.manager.mutation()
+                    .add(user_ref.id, "store_credit", -cost, f"Création de la guilde '{nom}'")
+                    .set(user_ref.id, "guild_id", guild_id))
+                await mutation.apply(trans)
                 
-                # Create guild doc and update user
+                # Create guild doc
                 guild_db_data = {
                     "name": nom, "name_lower": nom.lower(), "owner_id": str(interaction.user.id),
                     "members": [str(interaction.user.id)], "created_at": datetime.now(timezone.utc).isoformat(),
-                    "color": final_color, "weekly_xp": 0, "role_id": guild_role.id,
+                    "color": final_color, "weekly_xp": 0, "weekly_epoch": self.manager.weekly_epoch, "role_id": guild_role.id,
                     "text_channel_id": text_channel.id, "voice_channel_id": voice_channel.id
                 }
                 trans.set(guild_ref, guild_db_data)
-                trans.update(user_ref, {"guild_id": guild_id})
+                return mutation
             
-            await create_guild_transaction(self.manager.db.transaction(), user_ref, guild_ref)
+            mutation = await create_guild_transaction(self.manager.db.transaction(), user_ref, guild_ref)
+            mutation.after_commit()
         except Exception as e:
             # Rollback Discord assets if they were created
             if guild_role: await guild_role.delete()
@@ -203,7 +208,7 @@ class GuildCog(commands.Cog):
         )
         embed.add_field(name="Chef de Guilde", value=owner.mention)
         embed.add_field(name="Membres", value=f"{len(guild_data.get('members', []))}/{max_members}")
-        embed.add_field(name="XP Hebdomadaire", value=f"{guild_data.get('weekly_xp', 0)} XP")
+        embed.add_field(name="XP Hebdomadaire", value=f"{self.manager.weekly_value(guild_data, 'weekly_xp')} XP")
         embed.set_footer(text=f"Créée le {discord.utils.format_dt(created_dt, style='D')}")
 
         members_list = []
@@ -221,7 +226,7 @@ class GuildCog(commands.Cog):
             return await interaction.response.send_message("❌ Vous ne pouvez pas vous inviter vous-même ou un bot.", ephemeral=True)
 
         user_ref = self.manager.db.collection('users').document(str(interaction.user.id))
-        user_data = (await user_ref.get()).to_dict()
+        user_data = await self.manager.get_user_data(user_ref) or {}
         guild_id = user_data.get("guild_id")
         
         if not guild_id:
@@ -249,7 +254,7 @@ class GuildCog(commands.Cog):
     @guild_group.command(name="quitter", description="Quitte votre guilde actuelle.")
     async def quitter(self, interaction: discord.Interaction):
         user_ref = self.manager.db.collection('users').document(str(interaction.user.id))
-        user_data = (await user_ref.get()).to_dict()
+        user_data = await self.manager.get_user_data(user_ref) or {}
         guild_id = user_data.get("guild_id")
         
         if not guild_id:
@@ -267,6 +272,7 @@ class GuildCog(commands.Cog):
         if role: await interaction.user.remove_roles(role)
         
         await user_ref.update({"guild_id": None, "guild_bonus": firestore.DELETE_FIELD})
+        self.manager.invalidate_user(user_ref.id)
         await guild_ref.update({"members": firestore.ArrayRemove([str(interaction.user.id)])})
         
         await interaction.followup.send(f"✅ Vous avez quitté la guilde **{guild_data['name']}**.", ephemeral=True)
@@ -274,7 +280,7 @@ class GuildCog(commands.Cog):
     @guild_group.command(name="dissoudre", description="Dissout votre guilde (action irréversible).")
     async def dissoudre(self, interaction: discord.Interaction):
         user_ref = self.manager.db.collection('users').document(str(interaction.user.id))
-        user_data = (await user_ref.get()).to_dict()
+        user_data = await self.manager.get_user_data(user_ref) or {}
         guild_id = user_data.get("guild_id")
 
         if not guild_id:
@@ -311,6 +317,7 @@ class GuildCog(commands.Cog):
         for member_id_str in guild_data.get('members', []):
             member_ref = self.manager.db.collection('users').document(member_id_str)
             await member_ref.update({'guild_id': None, 'guild_bonus': firestore.DELETE_FIELD})
+            self.manager.invalidate_user(member_id_str)
             
         # Delete guild doc
         await guild_ref.delete()
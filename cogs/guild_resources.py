@@ -0,0 +1,96 @@
+import discord
+from typing import Dict, Optional, Iterable, List, Any
+
+
+class GuildResourceIndex:
+    """
+    Index nom -> objet des salons textuels, catégories et rôles de chaque serveur, construit au premier accès
+    puis tenu à jour par les événements `on_guild_channel_*` / `on_guild_role_*` relayés par le ManagerCog.
+    En cas de doublon, l'objet retenu est le même que celui de `discord.utils.get` (premier par position).
+    """
+    KINDS = ("text", "category", "role")
+
+    def __init__(self):
+        # guild_id -> type -> nom -> objet
+        self._guilds: Dict[int, Dict[str, Dict[str, Any]]] = {}
+
+    @staticmethod
+    def _members(guild: discord.Guild, kind: str) -> List[Any]:
+        if kind == "text":
+            return guild.text_channels
+        if kind == "category":
+            return guild.categories
+        return guild.roles
+
+    @staticmethod
+    def kind_of(channel: Any) -> Optional[str]:
+        if isinstance(channel, discord.TextChannel):
+            return "text"
+        if isinstance(channel, discord.CategoryChannel):
+            return "category"
+        return None
+
+    def _index(self, guild: discord.Guild) -> Dict[str, Dict[str, Any]]:
+        index = self._guilds.get(guild.id)
+        if index is None:
+            index = {}
+            for kind in self.KINDS:
+                names: Dict[str, Any] = {}
+                for item in self._members(guild, kind):
+                    names.setdefault(item.name, item)
+                index[kind] = names
+            self._guilds[guild.id] = index
+        return index
+
+    def _lookup(self, guild: Optional[discord.Guild], kind: str, name: Optional[str]) -> Optional[Any]:
+        if guild is None or not name:
+            return None
+        return self._index(guild)[kind].get(name)
+
+    def channel(self, guild: Optional[discord.Guild], name: Optional[str]) -> Optional[discord.TextChannel]:
+        return self._lookup(guild, "text", name)
+
+    def category(self, guild: Optional[discord.Guild], name: Optional[str]) -> Optional[discord.CategoryChannel]:
+        return self._lookup(guild, "category", name)
+
+    def role(self, guild: Optional[discord.Guild], name: Optional[str]) -> Optional[discord.Role]:
+        return self._lookup(guild, "role", name)
+
+    def invalidate(self, guild_id: int):
+        self._guilds.pop(guild_id, None)
+
+    def _rescan(self, guild: discord.Guild, kind: str, name: str):
+        """Recalcule l'entrée d'un nom après la disparition ou le renommage de l'objet indexé."""
+        names = self._guilds[guild.id][kind]
+        replacement = next((item for item in self._members(guild, kind) if item.name == name), None)
+        if replacement is None:
+            names.pop(name, None)
+        else:
+            names[name] = replacement
+
+    def added(self, guild: discord.Guild, kind: Optional[str], item: Any):
+        if kind and guild.id in self._guilds:
+            # Une création peut précéder un homonyme dans l'ordre des positions.
+            self._rescan(guild, kind, item.name)
+
+    def removed(self, guild: discord.Guild, kind: Optional[str], item: Any):
+        indexed = self._guilds.get(guild.id, {}).get(kind, {}).get(item.name) if kind else None
+        if indexed is not None and indexed.id == item.id:
+            self._rescan(guild, kind, item.name)
+
+    def updated(self, guild: discord.Guild, kind: Optional[str], before: Any, after: Any):
+        if not kind or guild.id not in self._guilds:
+            return
+        names = self._guilds[guild.id][kind]
+        if before.name != after.name:
+            indexed = names.get(before.name)
+            if indexed is not None and indexed.id == before.id:
+                self._rescan(guild, kind, before.name)
+            self._rescan(guild, kind, after.name)
+        elif getattr(before, "position", None) != getattr(after, "position", None):
+            self._rescan(guild, kind, after.name)
+
+    def missing(self, guild: discord.Guild, channel_names: Iterable[str], role_names: Iterable[str]) -> List[str]:
+        """Noms configurés sans salon ou rôle correspondant sur le serveur."""
+        return ([f"salon '{name}'" for name in channel_names if not self.channel(guild, name)] +
+                [f"rôle '{name}'" for name in role_names if not self.role(guild, name)])
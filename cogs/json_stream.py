@@ -0,0 +1,55 @@
+
+import json
+import re
+
+
+class JSONStringFieldReader:
+    """
+    Lit au fil de l'eau la valeur d'un champ texte d'un objet JSON reçu par fragments (réponse du modèle en flux).
+    `value` contient la partie déjà décodée ; une séquence d'échappement coupée entre deux fragments attend le suivant.
+    """
+    def __init__(self, field: str):
+        self._start_pattern = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buffer = ""
+        self._position = None
+        self.value = ""
+        self.complete = False
+
+    def feed(self, chunk: str) -> str:
+        self._buffer += chunk
+        if self.complete:
+            return self.value
+        if self._position is None:
+            match = self._start_pattern.search(self._buffer)
+            if not match:
+                return self.value
+            self._position = match.end()
+
+        buffer, index = self._buffer, self._position
+        while index < len(buffer):
+            char = buffer[index]
+            if char == '"':
+                self.complete = True
+                break
+            if char != "\\":
+                index += 1
+                continue
+            if index + 1 >= len(buffer):
+                break
+            if buffer[index + 1] != "u":
+                index += 2
+                continue
+            if index + 6 > len(buffer):
+                break
+            # Une moitié haute de paire UTF-16 doit être décodée avec la moitié basse qui la suit.
+            if 0xD800 <= int(buffer[index + 2:index + 6], 16) <= 0xDBFF:
+                if index + 12 > len(buffer):
+                    break
+                index += 12
+            else:
+                index += 6
+
+        if index > self._position:
+            self.value += json.loads('"' + buffer[self._position:index] + '"', strict=False)
+            self._position = index
+        return self.value
@@ -1,26 +1,326 @@
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
-from typing import Optional, List, Dict, Any
+from datetime import datetime, timedelta, timezone
+import bisect
+import heapq
+import math
+from typing import Optional, List, Dict, Any, Tuple
 from google.cloud import firestore
 
 from .manager_cog import ManagerCog
+from .user_store import WEEKLY_DEFAULTS, FIRESTORE_BATCH_LIMIT
+
+# Métriques de l'historique d'activité journalier : (libellé, unité).
+ACTIVITY_METRICS = {"xp": ("XP", " XP"), "affiliate": ("Gains d'Affiliation", " ©"), "messages": ("Messages", "")}
+# Fenêtres précalculées dans `leaderboards/{fenêtre}`.
+ACTIVITY_WINDOWS = {"7d": "7 derniers jours", "30d": "30 derniers jours", "month": "Ce mois-ci"}
+# Catégories de /classement maintenues en mémoire.
+LEADERBOARD_CATEGORIES = ("xp", "weekly_xp", "store_credit", "affiliate_earnings", "weekly_affiliate_earnings")
+
+
+class RankIndex:
+    """
+    Index d'ordre statistique : arbre de Fenwick sur des seaux de score géométriques
+    (BUCKETS_PER_E seaux par facteur e), chaque seau gardant ses entrées triées.
+    Rang, percentile et sélection du k-ième en O(log n) (plus un bisect dans le seau).
+    """
+    BUCKETS_PER_E = 16
+
+    def __init__(self, bucket_count: int = 1024):
+        self.size = bucket_count
+        self.total = 0
+        self._tree = [0] * (bucket_count + 1)
+        # Le seau 0 contient les scores les plus élevés ; entrées (-score, user_id) triées.
+        self._buckets: List[List[Tuple[float, str]]] = [[] for _ in range(bucket_count)]
+
+    def _slot(self, score: float) -> int:
+        return self.size - 1 - min(self.size - 1, int(math.log1p(max(score, 0)) * self.BUCKETS_PER_E))
+
+    def _add(self, slot: int, delta: int):
+        i = slot + 1
+        while i <= self.size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def _count_before(self, slot: int) -> int:
+        """Nombre d'entrées dans les seaux strictement plus hauts que `slot`."""
+        total, i = 0, slot
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def build(self, scores: Dict[str, float]):
+        """Construction en masse en O(n log n)."""
+        self.__init__(self.size)
+        for user_id, score in scores.items():
+            self._buckets[self._slot(score)].append((-score, user_id))
+        for slot, bucket in enumerate(self._buckets):
+            if bucket:
+                bucket.sort()
+                self._add(slot, len(bucket))
+        self.total = len(scores)
+
+    def insert(self, user_id: str, score: float):
+        slot = self._slot(score)
+        bisect.insort(self._buckets[slot], (-score, user_id))
+        self._add(slot, 1)
+        self.total += 1
+
+    def remove(self, user_id: str, score: float):
+        slot = self._slot(score)
+        bucket = self._buckets[slot]
+        index = bisect.bisect_left(bucket, (-score, user_id))
+        if index < len(bucket) and bucket[index] == (-score, user_id):
+            del bucket[index]
+            self._add(slot, -1)
+            self.total -= 1
+
+    def position(self, user_id: str, score: float) -> int:
+        """Position (0 = premier) d'une entrée ; les ex æquo sont départagés par identifiant."""
+        slot = self._slot(score)
+        return self._count_before(slot) + bisect.bisect_left(self._buckets[slot], (-score, user_id))
+
+    def rank(self, score: float) -> int:
+        """Rang (1 = premier) d'un score ; les ex æquo partagent le même rang."""
+        return 1 + self.position("", score)
+
+    def select(self, position: int) -> Tuple[str, float]:
+        """Entrée à la position `position` (0 = premier) par descente dans l'arbre de Fenwick."""
+        slot, remaining = 0, position
+        step = 1 << (self.size.bit_length() - 1)
+        while step:
+            if slot + step <= self.size and self._tree[slot + step] <= remaining:
+                slot += step
+                remaining -= self._tree[slot]
+            step >>= 1
+        neg_score, user_id = self._buckets[slot][remaining]
+        return user_id, -neg_score
+
+
+class MaterializedLeaderboard:
+    """
+    Classement en mémoire d'une catégorie : score de chaque membre et index d'ordre statistique,
+    maintenus incrémentalement. Le top N et le rang de n'importe quel membre se lisent en O(log n).
+    """
+    def __init__(self):
+        self.scores: Dict[str, float] = {}
+        self.index = RankIndex()
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def load(self, scores: Dict[str, float]):
+        self.scores = {user_id: value for user_id, value in scores.items() if value > 0}
+        self.index.build(self.scores)
+
+    def update(self, user_id: str, value: float):
+        old = self.scores.get(user_id, 0)
+        if value == old:
+            return
+        if old > 0:
+            self.index.remove(user_id, old)
+        if value > 0:
+            self.scores[user_id] = value
+            self.index.insert(user_id, value)
+        else:
+            self.scores.pop(user_id, None)
+
+    def top(self, n: int = 10) -> List[Dict[str, Any]]:
+        return self.slice(0, n)
+
+    def slice(self, start: int, stop: int) -> List[Dict[str, Any]]:
+        """Entrées aux positions [start, stop) avec leur position (0 = premier)."""
+        entries = []
+        for position in range(max(start, 0), min(stop, len(self.scores))):
+            user_id, value = self.index.select(position)
+            entries.append({"id": user_id, "value": value, "position": position})
+        return entries
+
+    def position_of(self, user_id: str) -> Optional[int]:
+        """Position exacte (0 = premier, ex æquo départagés par identifiant) d'un membre classé."""
+        value = self.scores.get(user_id)
+        return self.index.position(user_id, value) if value is not None else None
+
+    def standing(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Rang, percentile et écart avec le rang supérieur d'un membre (None s'il n'est pas classé)."""
+        value = self.scores.get(user_id)
+        if value is None:
+            return None
+        rank = self.index.rank(value)
+        total = len(self.scores)
+        ahead = self.index.select(rank - 2) if rank > 1 else None
+        return {
+            "rank": rank, "total": total, "value": value,
+            "top_percent": 100.0 * rank / total,
+            "next_id": ahead[0] if ahead else None,
+            "gap_to_next": ahead[1] - value if ahead else 0
+        }
+
 
 class LeaderboardCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.manager: Optional[ManagerCog] = None
+        self.boards: Dict[str, MaterializedLeaderboard] = {category: MaterializedLeaderboard() for category in LEADERBOARD_CATEGORIES}
+        self.boards_ready = False
+        # Mises à jour reçues pendant une reconstruction, réappliquées après l'échange des scores.
+        self._pending_updates: Optional[Dict[str, Dict[str, Any]]] = None
+        # Sommes par fenêtre des jours clos (avant-hier et plus anciens) : {fenêtre: {métrique: {membre: total}}}.
+        # Recalculées une fois par jour ; chaque agrégation ne relit ensuite qu'hier et aujourd'hui.
+        self._closed_sums: Dict[str, Dict[str, Dict[str, float]]] = {}
+        self._closed_until: Optional[str] = None
 
     async def cog_load(self):
         self.manager = self.bot.get_cog('ManagerCog')
         if not self.manager or not self.manager.db:
             return print("ERREUR CRITIQUE: LeaderboardCog n'a pas pu trouver le ManagerCog ou la BDD.")
+        history_config = self.manager.config.get("ACTIVITY_HISTORY_CONFIG", {})
+        self.aggregate_activity_task.change_interval(minutes=history_config.get("AGGREGATION_INTERVAL_MINUTES", 15))
+        self.aggregate_activity_task.start()
+        self.reconcile_leaderboards_task.change_interval(minutes=self.manager.config.get("LEADERBOARD_CONFIG", {}).get("RECONCILE_INTERVAL_MINUTES", 30))
+        self.reconcile_leaderboards_task.start()
         print("✅ LeaderboardCog chargé.")
 
+    def cog_unload(self):
+        self.aggregate_activity_task.cancel()
+        self.reconcile_leaderboards_task.cancel()
+
+    def category_values(self, user_data: Dict[str, Any]) -> Dict[str, float]:
+        return {
+            category: self.manager.weekly_value(user_data, category) if category in WEEKLY_DEFAULTS else user_data.get(category, 0)
+            for category in LEADERBOARD_CATEGORIES
+        }
+
+    def apply_user_data(self, user_id: str, user_data: Dict[str, Any]):
+        for category, value in self.category_values(user_data).items():
+            self.boards[category].update(user_id, value or 0)
+
+    @commands.Cog.listener()
+    async def on_user_stats_changed(self, user_id: str, user_data: Dict[str, Any]):
+        if not user_data:
+            return
+        self.apply_user_data(user_id, user_data)
+        if self._pending_updates is not None:
+            self._pending_updates[user_id] = user_data
+
+    @commands.Cog.listener()
+    async def on_weekly_epoch_changed(self, epoch: int):
+        for category in LEADERBOARD_CATEGORIES:
+            if category in WEEKLY_DEFAULTS:
+                self.boards[category].load({})
+
+    @tasks.loop(minutes=30)
+    async def reconcile_leaderboards_task(self):
+        """Reconstruit les classements en mémoire depuis Firestore (au démarrage, puis périodiquement)."""
+        self._pending_updates = {}
+        try:
+            scores: Dict[str, Dict[str, float]] = {category: {} for category in LEADERBOARD_CATEGORIES}
+            query = self.manager.db.collection('users').select(list(LEADERBOARD_CATEGORIES) + ["weekly_epoch"])
+            async for doc in query.stream():
+                user_data = self.manager.xp_buffer.overlay(doc.id, doc.to_dict())
+                for category, value in self.category_values(user_data).items():
+                    if value:
+                        scores[category][doc.id] = value
+            for category, board in self.boards.items():
+                board.load(scores[category])
+            for user_id, user_data in self._pending_updates.items():
+                self.apply_user_data(user_id, user_data)
+        finally:
+            self._pending_updates = None
+        self.boards_ready = True
+        print(f"Classements en mémoire reconstruits ({len(self.boards['xp'])} membres classés en XP).")
+
+    @staticmethod
+    def window_range(window: str, today: datetime) -> Tuple[str, str]:
+        """Bornes (AAAAMMJJ incluses) d'une fenêtre précalculée."""
+        if window == "month":
+            start = today.replace(day=1)
+        else:
+            start = today - timedelta(days=int(window.rstrip("d")) - 1)
+        return ManagerCog.activity_day(start), ManagerCog.activity_day(today)
+
+    async def aggregate_days(self, start: str, end: str) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """Totaux journaliers {jour: {métrique: {membre: valeur}}} entre deux jours inclus, fragments `activity_days` fusionnés."""
+        query = self.manager.db.collection('activity_days').where(field_path='day', op_string='>=', value=start).where(field_path='day', op_string='<=', value=end)
+        days: Dict[str, Dict[str, Dict[str, float]]] = {}
+        async for doc in query.stream():
+            data = doc.to_dict()
+            day = days.setdefault(data.get("day", doc.id), {})
+            for metric in ACTIVITY_METRICS:
+                bucket = day.setdefault(metric, {})
+                for user_id, value in data.get(metric, {}).items():
+                    bucket[user_id] = bucket.get(user_id, 0) + value
+        return days
+
+    @staticmethod
+    def sum_days(days: Dict[str, Dict[str, Dict[str, float]]], start: str, end: str,
+                 base: Optional[Dict[str, Dict[str, float]]] = None) -> Dict[str, Dict[str, float]]:
+        """Somme chaque métrique sur les jours [start, end], à partir des totaux `base` s'ils sont fournis."""
+        totals = {metric: dict((base or {}).get(metric, {})) for metric in ACTIVITY_METRICS}
+        for day, metrics in days.items():
+            if start <= day <= end:
+                for metric, values in metrics.items():
+                    bucket = totals.setdefault(metric, {})
+                    for user_id, value in values.items():
+                        bucket[user_id] = bucket.get(user_id, 0) + value
+        return totals
+
+    @staticmethod
+    def top_entries(totals: Dict[str, float], top_n: int) -> List[Dict[str, Any]]:
+        """Top N au format de get_leaderboard_data."""
+        top = heapq.nlargest(top_n, ((value, user_id) for user_id, value in totals.items() if value > 0))
+        return [{"id": user_id, "value": value} for value, user_id in top]
+
+    @tasks.loop(minutes=15)
+    async def aggregate_activity_task(self):
+        """Précalcule les classements par fenêtre et purge les agrégats journaliers expirés."""
+        history_config = self.manager.config.get("ACTIVITY_HISTORY_CONFIG", {})
+        top_n = history_config.get("TOP_N", 25)
+        today = datetime.now(timezone.utc)
+        ranges = {window: self.window_range(window, today) for window in ACTIVITY_WINDOWS}
+        yesterday = ManagerCog.activity_day(today - timedelta(days=1))
+
+        # Les jours clos ne changent plus : ils sont relus une fois par jour seulement. Hier reste ouvert
+        # (deltas encore en tampon au passage de minuit) et n'est compté qu'avec aujourd'hui.
+        if self._closed_until != yesterday:
+            closed_end = ManagerCog.activity_day(today - timedelta(days=2))
+            closed_days = await self.aggregate_days(min(start for start, _ in ranges.values()), closed_end)
+            self._closed_sums = {window: self.sum_days(closed_days, start, min(end, closed_end)) for window, (start, end) in ranges.items()}
+            self._closed_until = yesterday
+        recent_days = await self.aggregate_days(yesterday, ManagerCog.activity_day(today))
+
+        batch = self.manager.db.batch()
+        for window, (start, end) in ranges.items():
+            totals = self.sum_days(recent_days, start, end, base=self._closed_sums.get(window))
+            batch.set(self.manager.db.collection('leaderboards').document(window), {
+                "start": start, "end": end, "updated_at": today.isoformat(),
+                **{metric: self.top_entries(totals[metric], top_n) for metric in ACTIVITY_METRICS}
+            })
+        await batch.commit()
+
+        cutoff = ManagerCog.activity_day(today - timedelta(days=history_config.get("RETENTION_DAYS", 90)))
+        expired_query = self.manager.db.collection('activity_days').where(field_path='day', op_string='<', value=cutoff).limit(FIRESTORE_BATCH_LIMIT)
+        expired = [doc async for doc in expired_query.stream()]
+        if expired:
+            batch = self.manager.db.batch()
+            for doc in expired:
+                batch.delete(doc.reference)
+            await batch.commit()
+
+    @aggregate_activity_task.before_loop
+    async def before_aggregate_activity(self):
+        await self.bot.wait_until_ready()
+
     async def get_leaderboard_data(self, key: str, top_n: int = 10) -> List[Dict[str, Any]]:
         """Gets sorted leaderboard data from Firestore."""
-        query = self.manager.db.collection('users').where(field_path=key, op_string='>', value=0).order_by(key, direction=firestore.Query.DESCENDING).limit(top_n)
+        if key in WEEKLY_DEFAULTS:
+            # Weekly counters only count for documents on the current weekly epoch.
+            query = self.manager.weekly_query('users', key).limit(top_n)
+        else:
+            query = self.manager.db.collection('users').where(field_path=key, op_string='>', value=0).order_by(key, direction=firestore.Query.DESCENDING).limit(top_n)
         docs = query.stream()
         
         sorted_users = [{"id": doc.id, "value": doc.to_dict().get(key, 0)} async for doc in docs]
@@ -28,8 +328,15 @@ class LeaderboardCog(commands.Cog):
 
     async def create_leaderboard_embed(self, interaction: discord.Interaction, leaderboard_type: str, data_key: str, unit: str = "") -> discord.Embed:
         """Creates a standardized embed for a leaderboard."""
-        leaderboard_data = await self.get_leaderboard_data(data_key)
-        
+        if self.boards_ready and data_key in self.boards:
+            # Materialized in memory: no Firestore read per call.
+            leaderboard_data = self.boards[data_key].top(10)
+        else:
+            leaderboard_data = await self.get_leaderboard_data(data_key)
+        return self.render_leaderboard_embed(interaction, leaderboard_type, leaderboard_data, unit)
+
+    def render_leaderboard_embed(self, interaction: discord.Interaction, leaderboard_type: str, leaderboard_data: List[Dict[str, Any]], unit: str = "") -> discord.Embed:
+        """Renders leaderboard entries ({"id", "value"}) into the standard embed."""
         embed = discord.Embed(
             title=f"🏆 Classement - {leaderboard_type} 🏆",
             description=f"Voici le top 10 des membres pour la catégorie '{leaderboard_type}'.",
@@ -64,7 +371,7 @@ class LeaderboardCog(commands.Cog):
         return embed
 
     @app_commands.command(name="classement", description="Affiche les différents classements du serveur.")
-    @app_commands.describe(categorie="La catégorie de classement à afficher.")
+    @app_commands.describe(categorie="La catégorie de classement à afficher.", ma_position="Affiche votre rang, vos voisins et l'écart avec la place suivante.")
     @app_commands.choices(categorie=[
         app_commands.Choice(name="XP Total", value="xp"),
         app_commands.Choice(name="XP Hebdomadaire", value="weekly_xp"),
@@ -72,19 +379,106 @@ class LeaderboardCog(commands.Cog):
         app_commands.Choice(name="Gains d'Affiliation (Hebdo)", value="weekly_affiliate_earnings"),
         app_commands.Choice(name="Gains d'Affiliation (Total)", value="affiliate_earnings"),
     ])
-    async def leaderboard(self, interaction: discord.Interaction, categorie: app_commands.Choice[str]):
+    async def leaderboard(self, interaction: discord.Interaction, categorie: app_commands.Choice[str], ma_position: bool = False):
         if not self.manager:
             return await interaction.response.send_message("Erreur interne.", ephemeral=True)
 
+        unit = " XP" if "xp" in categorie.value else " ©"
+        if ma_position:
+            if not self.boards_ready:
+                return await interaction.response.send_message("⏳ Le classement est en cours de chargement, réessayez dans un instant.", ephemeral=True)
+            embed = self.create_standing_embed(interaction, categorie.name, categorie.value, unit)
+            return await interaction.response.send_message(embed=embed, ephemeral=True)
+
         await interaction.response.defer()
         
         embed = await self.create_leaderboard_embed(
             interaction=interaction,
             leaderboard_type=categorie.name,
             data_key=categorie.value,
-            unit=" XP" if "xp" in categorie.value else " ©"
+            unit=unit
+        )
+
+        await interaction.followup.send(embed=embed)
+
+    def create_standing_embed(self, interaction: discord.Interaction, leaderboard_type: str, data_key: str, unit: str, radius: int = 2) -> discord.Embed:
+        """Shows the caller's rank, percentile, neighbours and gap to the next position."""
+        board = self.boards[data_key]
+        user_id = str(interaction.user.id)
+        standing = board.standing(user_id)
+        embed = discord.Embed(title=f"📍 Votre position - {leaderboard_type}", color=discord.Color.gold())
+        if not standing:
+            embed.description = "Vous n'êtes pas encore classé dans cette catégorie."
+            return embed
+
+        def name_of(member_id: str) -> str:
+            member = interaction.guild.get_member(int(member_id)) if interaction.guild else None
+            return member.display_name if member else f"Utilisateur Inconnu ({member_id})"
+
+        def format_value(value: float) -> str:
+            return f"{value:,.0f}".replace(",", " ") if value == int(value) else f"{value:,.2f}".replace(",", " ")
+
+        embed.description = (
+            f"Vous êtes **#{standing['rank']}** sur **{format_value(standing['total'])}** "
+            f"avec `{format_value(standing['value'])}{unit}` (top {standing['top_percent']:.1f}%)."
         )
+        if standing["next_id"]:
+            embed.add_field(
+                name="Prochaine place",
+                value=f"Encore `{format_value(standing['gap_to_next'])}{unit}` pour dépasser **{name_of(standing['next_id'])}**.",
+                inline=False
+            )
+
+        position = board.position_of(user_id)
+        lines = []
+        for entry in board.slice(position - radius, position + radius + 1):
+            marker = "➡️ " if entry["id"] == user_id else ""
+            lines.append(f"{marker}**#{board.index.rank(entry['value'])}** {name_of(entry['id'])} - `{format_value(entry['value'])}{unit}`")
+        embed.add_field(name="Vos voisins", value="\n".join(lines), inline=False)
+        return embed
+
+    @app_commands.command(name="classement_periode", description="Affiche un classement sur une période (7 jours, 30 jours, mois, dates).")
+    @app_commands.describe(
+        categorie="La métrique à classer.", periode="La période couverte.",
+        debut="Début de la période personnalisée (AAAA-MM-JJ).", fin="Fin de la période personnalisée (AAAA-MM-JJ, aujourd'hui par défaut)."
+    )
+    @app_commands.choices(
+        categorie=[app_commands.Choice(name=label, value=metric) for metric, (label, _) in ACTIVITY_METRICS.items()],
+        periode=[app_commands.Choice(name=label, value=window) for window, label in ACTIVITY_WINDOWS.items()] + [app_commands.Choice(name="Personnalisée", value="custom")]
+    )
+    async def leaderboard_window(self, interaction: discord.Interaction, categorie: app_commands.Choice[str], periode: app_commands.Choice[str],
+                                 debut: Optional[str] = None, fin: Optional[str] = None):
+        if not self.manager:
+            return await interaction.response.send_message("Erreur interne.", ephemeral=True)
+
+        history_config = self.manager.config.get("ACTIVITY_HISTORY_CONFIG", {})
+        today = datetime.now(timezone.utc)
+        if periode.value == "custom":
+            try:
+                start_dt = datetime.strptime(debut, "%Y-%m-%d").replace(tzinfo=timezone.utc) if debut else None
+                end_dt = datetime.strptime(fin, "%Y-%m-%d").replace(tzinfo=timezone.utc) if fin else today
+            except ValueError:
+                return await interaction.response.send_message("❌ Format de date invalide. Utilisez `AAAA-MM-JJ`.", ephemeral=True)
+            oldest = today - timedelta(days=history_config.get("RETENTION_DAYS", 90))
+            if not start_dt or start_dt > end_dt or start_dt < oldest:
+                return await interaction.response.send_message(f"❌ Période invalide. Le début doit être postérieur au {discord.utils.format_dt(oldest, 'd')} et antérieur à la fin.", ephemeral=True)
+
+        await interaction.response.defer()
+
+        top_n = history_config.get("TOP_N", 25)
+        if periode.value == "custom":
+            start, end = ManagerCog.activity_day(start_dt), ManagerCog.activity_day(end_dt)
+            days = await self.aggregate_days(start, end)
+            leaderboard_data = self.top_entries(self.sum_days(days, start, end)[categorie.value], top_n)
+            period_label = f"du {debut} au {end_dt.strftime('%Y-%m-%d')}"
+        else:
+            # Fenêtre précalculée : une seule lecture.
+            window_doc = await self.manager.db.collection('leaderboards').document(periode.value).get()
+            leaderboard_data = window_doc.to_dict().get(categorie.value, []) if window_doc.exists else []
+            period_label = periode.name.lower()
 
+        label, unit = ACTIVITY_METRICS[categorie.value]
+        embed = self.render_leaderboard_embed(interaction, f"{label} ({period_label})", leaderboard_data[:10], unit)
         await interaction.followup.send(embed=embed)
 
 async def setup(bot: commands.Bot):
@@ -39,12 +39,16 @@ class LotteryCog(commands.Cog):
                 return {"success": False, "reason": "déjà participant"}
 
             lottery_pot.append({"id": user_id_str, "name": display_name})
+            mutation = self.manager.mutation().add(user_id_str, "store_credit", -cost, "Participation à la loterie")
+            await mutation.apply(transaction, {user_id_str: user_data})
             transaction.set(self.lottery_ref, {'pot': lottery_pot}, merge=True)
-            await self.manager.add_transaction(transaction, user_ref, "store_credit", -cost, "Participation à la loterie")
             
-            return {"success": True, "new_pot": lottery_pot}
+            return {"success": True, "new_pot": lottery_pot, "mutation": mutation}
 
-        return await tx_logic(self.manager.db.transaction())
+        result = await tx_logic(self.manager.db.transaction())
+        if result["success"]:
+            result["mutation"].after_commit()
+        return result
 
     async def _trigger_draw(self, interaction_or_channel: any, lottery_pot: list, config: dict):
         """Triggers the draw, announces winner, and resets the pot."""
@@ -52,11 +56,10 @@ class LotteryCog(commands.Cog):
         winner_id = winner_data['id']
         prize = config.get("WINNER_PRIZE", 0.70)
         
-        winner_ref = self.manager.db.collection('users').document(winner_id)
-        await self.manager.add_transaction(self.manager.db.transaction(), winner_ref, "store_credit", prize, "Gagnant de la loterie")
+        await self.manager.mutation().add(winner_id, "store_credit", prize, "Gagnant de la loterie").commit()
 
         lottery_channel_name = self.manager.config["CHANNELS"].get("LOTTERY")
-        channel = discord.utils.get(interaction_or_channel.guild.text_channels, name=lottery_channel_name)
+        channel = self.manager.resources.channel(interaction_or_channel.guild, lottery_channel_name)
         
         participant_mentions = [f"<@{p['id']}>" for p in lottery_pot]
         
@@ -11,6 +11,8 @@ import uuid
 from typing import List, Dict, Any, Optional
 import traceback
 import re
+import time
+import weakref
 
 # --- Dépendances Critiques ---
 # Placer l'importation de Firestore ici, en dehors du try/except,
@@ -19,6 +21,19 @@ from google.cloud import firestore
 # FIX: Changed the import style to be more robust against circular dependencies.
 from google.cloud.firestore_v1 import transaction 
 
+from .user_store import (
+    XPAccumulator, UserCache, UserMutation, BatchWritePipeline, FIRESTORE_BATCH_LIMIT, commit_updates,
+    weekly_value, active_guild_bonus
+)
+from .rules import LevelTable, CompiledRules, AchievementIndex
+from .guild_resources import GuildResourceIndex
+from .ai_gateway import GeminiGateway, GatewayUnavailable, PRIORITY_PROMO, PRIORITY_COACHING
+from .faq_index import KnowledgeIndex
+from .fake_gemini import FakeGenerativeModel, load_fake_profile
+from .static_data import (
+    StaticDataError, FileWatcher, read_json_file, validate_config, validate_products, validate_achievements
+)
+
 # --- Dépendances Optionnelles ---
 try:
     from PIL import Image, ImageDraw, ImageFont, ImageOps
@@ -42,8 +57,7 @@ class MissionView(discord.ui.View):
         super().__init__(timeout=None)
         self.manager = manager
     
-    @discord.ui.button(label="Activer/Désactiver les notifications de mission", style=discord.ButtonStyle.secondary, custom_id="toggle_mission_dms")
-    async def toggle_dms(self, interaction: discord.Interaction, button: discord.ui.Button):
+    async def _toggle_opt_in(self, interaction: discord.Interaction, field: str) -> bool:
         user_id_str = str(interaction.user.id)
         user_ref = self.manager.db.collection('users').document(user_id_str)
         
@@ -51,15 +65,26 @@ class MissionView(discord.ui.View):
         async def toggle_opt_in(trans, ref): # trans is the conventional name for the transaction object
             user_doc = await ref.get(transaction=trans)
             user_data = user_doc.to_dict() if user_doc.exists else {}
-            new_status = not user_data.get("missions_opt_in", True)
-            trans.set(ref, {"missions_opt_in": new_status}, merge=True)
+            new_status = not user_data.get(field, True)
+            trans.set(ref, {field: new_status}, merge=True)
             return new_status
 
         new_status = await toggle_opt_in(self.manager.db.transaction(), user_ref)
-        
+        self.manager.invalidate_user(user_id_str)
+        return new_status
+
+    @discord.ui.button(label="Activer/Désactiver les notifications de mission", style=discord.ButtonStyle.secondary, custom_id="toggle_mission_dms")
+    async def toggle_dms(self, interaction: discord.Interaction, button: discord.ui.Button):
+        new_status = await self._toggle_opt_in(interaction, "missions_opt_in")
         status_text = "activées" if new_status else "désactivées"
         await interaction.response.send_message(f"Vos notifications de mission par message privé sont maintenant {status_text}.", ephemeral=True)
 
+    @discord.ui.button(label="Activer/Désactiver le coaching hebdomadaire", style=discord.ButtonStyle.secondary, custom_id="toggle_coaching_dms")
+    async def toggle_coaching(self, interaction: discord.Interaction, button: discord.ui.Button):
+        new_status = await self._toggle_opt_in(interaction, "coaching_opt_in")
+        status_text = "activé" if new_status else "désactivé"
+        await interaction.response.send_message(f"Votre rapport de coaching hebdomadaire par message privé est maintenant {status_text}.", ephemeral=True)
+
 
 class ChallengeSubmissionModal(discord.ui.Modal, title="Soumission de Défi"):
     submission_text = discord.ui.TextInput(
@@ -107,22 +132,19 @@ class CashoutRequestView(discord.ui.View):
 
         cashout_dict = cashout_data.to_dict()
         user_id_str = str(cashout_dict['user_id'])
-        user_ref = self.manager.db.collection('users').document(user_id_str)
         member = interaction.guild.get_member(cashout_dict['user_id'])
         
         original_embed = interaction.message.embeds[0]
         new_embed = original_embed.copy()
 
         if approve:
-            await self.manager.add_transaction(self.manager.db.transaction(), user_ref, "cashout_count", 1, "Approbation de retrait")
+            states = await self.manager.mutation().add(user_id_str, "cashout_count", 1, "Approbation de retrait").commit()
             if member:
-                await self.manager.check_achievements(member)
                 try:
                     await member.send(f"✅ Votre demande de retrait de `{cashout_dict['euros_to_send']:.2f}€` a été approuvée ! Le paiement sera effectué sous peu sur l'adresse `{cashout_dict['paypal_email']}`.")
                 except discord.Forbidden: pass
 
-                cashed_out_user_data = (await user_ref.get()).to_dict()
-                referrer_id_str = cashed_out_user_data.get('referrer')
+                referrer_id_str = states[user_id_str].get('referrer')
 
                 if referrer_id_str:
                     await self.manager.grant_cashout_commission(
@@ -145,14 +167,12 @@ class CashoutRequestView(discord.ui.View):
             await interaction.message.edit(embed=new_embed)
             await interaction.followup.send("Demande approuvée.", ephemeral=True)
         else: # Deny
-            tx = self.manager.db.transaction()
-            await self.manager.add_transaction(
-                tx,
-                user_ref,
+            await self.manager.mutation().add(
+                user_id_str,
                 "store_credit",
                 cashout_dict['credit_to_deduct'],
                 "Remboursement suite au refus de retrait"
-            )
+            ).commit()
             if member:
                 try:
                     await member.send(f"❌ Votre demande de retrait a été refusée par le staff. Vos `{cashout_dict['credit_to_deduct']:.2f}` crédits vous ont été remboursés.")
@@ -188,8 +208,8 @@ class VerificationView(discord.ui.View):
         verified_role_name = roles_config.get("VERIFIED")
         unverified_role_name = roles_config.get("UNVERIFIED")
         
-        verified_role = discord.utils.get(interaction.guild.roles, name=verified_role_name) if verified_role_name else None
-        unverified_role = discord.utils.get(interaction.guild.roles, name=unverified_role_name) if unverified_role_name else None
+        verified_role = self.manager.resources.role(interaction.guild, verified_role_name) if verified_role_name else None
+        unverified_role = self.manager.resources.role(interaction.guild, unverified_role_name) if unverified_role_name else None
 
         if not verified_role:
             return await interaction.response.send_message(f"Erreur : Le rôle `{verified_role_name}` est introuvable.", ephemeral=True)
@@ -204,10 +224,9 @@ class VerificationView(discord.ui.View):
             await interaction.response.send_message("Vous avez été vérifié avec succès ! Bienvenue sur le serveur.", ephemeral=True)
             
             user_ref = self.manager.db.collection('users').document(str(interaction.user.id))
-            user_doc = await user_ref.get()
+            user_data = await self.manager.get_user_data(user_ref)
 
-            if user_doc.exists and user_doc.to_dict().get("referrer"):
-                user_data = user_doc.to_dict()
+            if user_data and user_data.get("referrer"):
                 referrer_id_str = user_data["referrer"]
                 referrer = interaction.guild.get_member(int(referrer_id_str))
                 if referrer:
@@ -309,16 +328,39 @@ class ManagerCog(commands.Cog):
         
         self.config = {}
         self.products = []
+        self.products_by_id: Dict[str, Dict[str, Any]] = {}
         self.achievements = []
+        self.achievement_index = AchievementIndex([])
         self.knowledge_base = {}
+        self.knowledge_index = KnowledgeIndex([], [])
         self.invites_cache = {}
+        self.resources = GuildResourceIndex()
         self.active_events = {}
+        self.xp_buffer = XPAccumulator(self.db)
+        self.user_cache = UserCache()
+        self._pending_xp_flush: Optional[asyncio.Task] = None
+        # Vrai pendant la bascule d'époque hebdomadaire : l'XP n'est plus mise en tampon (voir weekly_leaderboard_task).
+        self._epoch_rollover = False
+        # Tâches de fond lancées sans être attendues : référencées jusqu'à leur fin.
+        self._background_tasks: set = set()
+        # Un verrou par membre : deux vérifications de niveau concurrentes n'appliquent pas deux fois la montée.
+        self._level_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        # Époque hebdomadaire courante et guildes dont le compteur a déjà été basculé sur cette époque.
+        self.weekly_epoch = 0
+        self._current_epoch_guilds: set = set()
+        # Rechargement à chaud des fichiers statiques (les autres cogs y ajoutent leurs propres fichiers).
+        self.static_watcher = FileWatcher()
+        self._reload_lock = asyncio.Lock()
         
         if not IMAGING_AVAILABLE:
             print("⚠️ ATTENTION: La librairie 'Pillow' est manquante. La commande /profil utilisera un embed standard.")
 
         self.model = None
-        if not AI_AVAILABLE:
+        if os.environ.get("GEMINI_BACKEND") == "fake":
+            # Modèle simulé local (tests et benchmarks hors ligne) ; profil optionnel dans GEMINI_FAKE_PROFILE.
+            self.model = FakeGenerativeModel(load_fake_profile(os.environ.get("GEMINI_FAKE_PROFILE")))
+            print("🧪 Modèle Gemini simulé (GEMINI_BACKEND=fake) : aucun appel réseau.")
+        elif not AI_AVAILABLE:
             print("ATTENTION: Le package google-generativeai n'est pas installé. Les fonctionnalités d'IA seront désactivées.")
         else:
             gemini_key = os.environ.get("GEMINI_API_KEY")
@@ -328,6 +370,8 @@ class ManagerCog(commands.Cog):
                 print("✅ Modèle Gemini initialisé avec succès.")
             else:
                 print("⚠️ ATTENTION: La clé API Gemini (GEMINI_API_KEY) est manquante dans l'environnement. L'IA est désactivée.")
+        # Tous les appels au modèle passent par la passerelle (priorités, débit, échéances).
+        self.ai = GeminiGateway(self.model)
 
     async def cog_load(self):
         print("Chargement des données du ManagerCog...")
@@ -335,6 +379,10 @@ class ManagerCog(commands.Cog):
 
         await self._load_static_data()
         await self._load_active_events()
+        await self._load_weekly_epoch()
+        self.xp_flush_task.start()
+        if self.config.get("HOT_RELOAD_CONFIG", {}).get("ENABLED", True):
+            self.static_reload_task.start()
         self.bot.add_view(VerificationView(self))
         self.bot.add_view(TicketCreationView(self))
         self.bot.add_view(TicketCloseView(self))
@@ -344,12 +392,18 @@ class ManagerCog(commands.Cog):
         self.mission_assignment_task.start()
         self.check_vip_status_task.start()
         self.weekly_coaching_report_task.start()
+        self.ledger_compaction_task.start()
 
-    def cog_unload(self):
+    async def cog_unload(self):
         self.weekly_leaderboard_task.cancel()
         self.mission_assignment_task.cancel()
         self.check_vip_status_task.cancel()
         self.weekly_coaching_report_task.cancel()
+        self.ledger_compaction_task.cancel()
+        self.static_reload_task.cancel()
+        # stop() laisse un flush en cours se terminer, puis on vide le reste du tampon.
+        self.xp_flush_task.stop()
+        await self.flush_xp_buffer()
         print("ManagerCog déchargé.")
 
     @commands.Cog.listener()
@@ -365,11 +419,58 @@ class ManagerCog(commands.Cog):
         if guild:
             await self._update_invite_cache(guild)
             print(f"Cache des invitations mis à jour pour la guilde : {guild.name}")
+            self.report_missing_resources(guild)
         else:
             print(f"ATTENTION: Guilde avec l'ID {guild_id_str} non trouvée.")
 
         print("Tâches de fond démarrées via cog_load.")
 
+    def report_missing_resources(self, guild: discord.Guild):
+        """Signale une seule fois les salons et rôles de CHANNELS / ROLES introuvables sur le serveur."""
+        role_names = []
+        for value in self.config.get("ROLES", {}).values():
+            role_names.extend(value if isinstance(value, list) else [value])
+        missing = self.resources.missing(guild, [name for name in self.config.get("CHANNELS", {}).values() if name], [name for name in role_names if name])
+        if missing:
+            print(f"ATTENTION: {len(missing)} nom(s) de config.json introuvable(s) sur {guild.name} : {', '.join(missing)}")
+
+    @commands.Cog.listener()
+    async def on_static_data_reloaded(self):
+        guild_id_str = self.config.get("GUILD_ID")
+        guild = self.bot.get_guild(int(guild_id_str)) if guild_id_str and guild_id_str.isdigit() else None
+        if guild:
+            self.report_missing_resources(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel: discord.abc.GuildChannel):
+        self.resources.added(channel.guild, GuildResourceIndex.kind_of(channel), channel)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        self.resources.removed(channel.guild, GuildResourceIndex.kind_of(channel), channel)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel):
+        if GuildResourceIndex.kind_of(before) != GuildResourceIndex.kind_of(after):
+            return self.resources.invalidate(after.guild.id)
+        self.resources.updated(after.guild, GuildResourceIndex.kind_of(after), before, after)
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role: discord.Role):
+        self.resources.added(role.guild, "role", role)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        self.resources.removed(role.guild, "role", role)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        self.resources.updated(after.guild, "role", before, after)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.resources.invalidate(guild.id)
+
     async def _load_static_json(self, file_path: str) -> any:
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
@@ -379,11 +480,121 @@ class ManagerCog(commands.Cog):
             return {} if 'knowledge_base' in file_path else []
 
     async def _load_static_data(self):
-        self.config = await self._load_static_json(self.CONFIG_FILE)
-        self.products = await self._load_static_json(self.PRODUCTS_FILE)
-        self.achievements = await self._load_static_json(self.ACHIEVEMENTS_FILE)
-        self.knowledge_base = await self._load_static_json(self.KNOWLEDGE_BASE_FILE)
+        self.static_watcher.watch(self.CONFIG_FILE, self.PRODUCTS_FILE, self.ACHIEVEMENTS_FILE, self.KNOWLEDGE_BASE_FILE)
+        self._apply_static_data(self._compile_static_data(
+            await self._load_static_json(self.CONFIG_FILE),
+            await self._load_static_json(self.PRODUCTS_FILE),
+            await self._load_static_json(self.ACHIEVEMENTS_FILE),
+            await self._load_static_json(self.KNOWLEDGE_BASE_FILE)
+        ))
         print("Données de configuration statiques chargées.")
+
+    @staticmethod
+    def _compile_static_data(config: Dict[str, Any], products: List[Dict[str, Any]], achievements: List[Dict[str, Any]],
+                             knowledge_base: Dict[str, Any]) -> Dict[str, Any]:
+        """Construit les index dérivés des fichiers statiques, sans toucher à l'état du cog."""
+        return {
+            "config": config,
+            "products": products,
+            "products_by_id": {p['id']: p for p in products if p.get('id')},
+            "achievements": achievements,
+            "achievement_index": AchievementIndex(achievements),
+            "knowledge_base": knowledge_base,
+            "knowledge_index": KnowledgeIndex(knowledge_base.get("faqs", []), products),
+            "level_table": LevelTable.from_config(config),
+            "rules": CompiledRules(config),
+        }
+
+    def _prepare_static_data(self) -> Dict[str, Any]:
+        """Lit, valide et compile les fichiers statiques. Bloquant : exécuté via asyncio.to_thread."""
+        config = read_json_file(self.CONFIG_FILE, dict)
+        validate_config(self.CONFIG_FILE, config)
+        products = read_json_file(self.PRODUCTS_FILE, list)
+        validate_products(self.PRODUCTS_FILE, products)
+        achievements = read_json_file(self.ACHIEVEMENTS_FILE, list)
+        validate_achievements(self.ACHIEVEMENTS_FILE, achievements)
+        knowledge_base = read_json_file(self.KNOWLEDGE_BASE_FILE, dict)
+        try:
+            return self._compile_static_data(config, products, achievements, knowledge_base)
+        except (TypeError, ValueError, AttributeError, OverflowError) as e:
+            raise StaticDataError(f"{self.CONFIG_FILE}: règles de gamification invalides ({e})") from e
+
+    def _apply_static_data(self, state: Dict[str, Any]):
+        """Remplace d'un bloc (sans await) les données statiques et leurs index, puis les réglages qui en dépendent."""
+        self.config = state["config"]
+        self.products = state["products"]
+        self.products_by_id = state["products_by_id"]
+        self.achievements = state["achievements"]
+        self.achievement_index = state["achievement_index"]
+        self.knowledge_base = state["knowledge_base"]
+        self.knowledge_index = state["knowledge_index"]
+        self.level_table = state["level_table"]
+        self.rules = state["rules"]
+
+        buffer_config = self.config.get("XP_BUFFER_CONFIG", {})
+        self.xp_buffer.max_pending_users = buffer_config.get("MAX_PENDING_USERS", 200)
+        self.xp_buffer.day_shards = self.config.get("ACTIVITY_HISTORY_CONFIG", {}).get("DAY_SHARDS", 32)
+        cache_config = self.config.get("USER_CACHE_CONFIG", {})
+        self.user_cache.max_size = cache_config.get("MAX_SIZE", 5000)
+        self.user_cache.ttl_seconds = cache_config.get("TTL_SECONDS", 120)
+        self.xp_flush_task.change_interval(seconds=buffer_config.get("FLUSH_INTERVAL_SECONDS", 10))
+        self.static_reload_task.change_interval(seconds=self.config.get("HOT_RELOAD_CONFIG", {}).get("POLL_INTERVAL_SECONDS", 5))
+        self.ai.configure(self.config)
+        if isinstance(self.model, FakeGenerativeModel):
+            self.model.configure(self.config)
+
+    async def reload_static_data(self) -> Dict[str, float]:
+        """
+        Recharge config, produits, succès, base de connaissances et articles de la boutique à crédits sans redémarrage.
+        Tout est lu, validé et indexé hors de la boucle d'événements, puis remplacé d'un bloc : en cas de fichier
+        invalide (StaticDataError), les données en place sont conservées. Retourne la durée de chaque étape en ms.
+        """
+        async with self._reload_lock:
+            # Les modifications faites pendant le rechargement déclencheront un nouveau passage.
+            self.static_watcher.mark()
+            catalogue_cog = self.bot.get_cog('CatalogueCog')
+            shop_cog = self.bot.get_cog('CreditShopCog')
+            timings: Dict[str, float] = {}
+
+            start = time.perf_counter()
+            state = await asyncio.to_thread(self._prepare_static_data)
+            timings["Configuration et règles"] = (time.perf_counter() - start) * 1000
+
+            catalogue_index = None
+            if catalogue_cog:
+                start = time.perf_counter()
+                catalogue_index = await asyncio.to_thread(catalogue_cog.prepare_index, state["products"])
+                timings["Index du catalogue"] = (time.perf_counter() - start) * 1000
+
+            shop_items = None
+            if shop_cog:
+                start = time.perf_counter()
+                shop_items = await asyncio.to_thread(shop_cog.read_items)
+                timings["Boutique à crédits"] = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            self._apply_static_data(state)
+            if catalogue_index is not None:
+                catalogue_cog.index = catalogue_index
+            if shop_items is not None:
+                shop_cog.shop_items = shop_items
+            timings["Remplacement"] = (time.perf_counter() - start) * 1000
+
+        self.bot.dispatch("static_data_reloaded")
+        print(f"✅ Données statiques rechargées en {sum(timings.values()):.1f} ms.")
+        return timings
+
+    @tasks.loop(seconds=5)
+    async def static_reload_task(self):
+        """Surveille les fichiers statiques et les recharge dès qu'ils sont modifiés."""
+        changed = await asyncio.to_thread(self.static_watcher.changed)
+        if not changed:
+            return
+        print(f"Fichiers statiques modifiés ({', '.join(changed)}), rechargement...")
+        try:
+            await self.reload_static_data()
+        except StaticDataError as e:
+            print(f"❌ Rechargement annulé, les données actuelles sont conservées : {e}")
     
     async def _load_active_events(self):
         events_doc = await self.db.collection('system').document('events').get()
@@ -393,8 +604,50 @@ class ManagerCog(commands.Cog):
             self.active_events = {}
         print(f"Événements actifs chargés en mémoire: {len(self.active_events)}.")
     
+    async def _load_weekly_epoch(self):
+        epoch_doc = await self.db.collection('system').document('weekly_epoch').get()
+        self.weekly_epoch = epoch_doc.to_dict().get('epoch', 0) if epoch_doc.exists else 0
+        self._current_epoch_guilds.clear()
+        print(f"Époque hebdomadaire courante : {self.weekly_epoch}.")
+
+    def weekly_value(self, data: Optional[Dict[str, Any]], field: str) -> Any:
+        """Valeur d'un compteur hebdomadaire (weekly_xp, weekly_affiliate_earnings...) pour la semaine en cours."""
+        return weekly_value(data, field, self.weekly_epoch)
+
+    def guild_bonus(self, user_data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        return active_guild_bonus(user_data, self.weekly_epoch)
+
+    def weekly_query(self, collection: str, field: str, minimum: float = 0) -> firestore.AsyncQuery:
+        """
+        Requête triée sur un compteur hebdomadaire, restreinte aux documents de l'époque courante.
+        Nécessite les index composites (weekly_epoch, champ) de firestore.indexes.json
+        (`firebase deploy --only firestore:indexes`).
+        """
+        query = self.db.collection(collection)
+        if self.weekly_epoch:
+            # À l'époque 0, les documents antérieurs aux époques n'ont pas encore de champ `weekly_epoch`.
+            query = query.where('weekly_epoch', '==', self.weekly_epoch)
+        return query.where(field, '>', minimum).order_by(field, direction=firestore.Query.DESCENDING)
+
+    async def ensure_guild_epoch(self, guild_id: str):
+        """Remet à zéro le compteur hebdomadaire d'une guilde restée sur une époque précédente."""
+        if guild_id in self._current_epoch_guilds:
+            return
+        guild_ref = self.db.collection('guilds').document(guild_id)
+        epoch = self.weekly_epoch
+
+        @transaction.async_transactional
+        async def rollover_tx(trans):
+            guild_doc = await guild_ref.get(transaction=trans)
+            if guild_doc.exists and guild_doc.to_dict().get('weekly_epoch', 0) != epoch:
+                trans.update(guild_ref, {"weekly_xp": 0, "weekly_epoch": epoch})
+
+        await rollover_tx(self.db.transaction())
+        if epoch == self.weekly_epoch:
+            self._current_epoch_guilds.add(guild_id)
+
     def get_product(self, product_id: str) -> Optional[Dict[str, Any]]:
-        return next((p for p in self.products if p.get('id') == product_id), None)
+        return self.products_by_id.get(product_id)
 
     async def _parse_gemini_json_response(self, text: str) -> Optional[Dict[str, Any]]:
         """Analyse de manière robuste une réponse JSON potentiellement mal formatée de l'IA."""
@@ -414,14 +667,12 @@ class ManagerCog(commands.Cog):
             print("ATTENTION: Le prompt de génération de promo est manquant dans config.json")
             return "Offre spéciale ! Ne manquez pas cette promotion."
         
-        prompt = prompt_template.format(
-            product_name=product_name,
-            short_description=short_description
-        )
+        # replace() plutôt que format() : le prompt contient un exemple JSON avec des accolades.
+        prompt = prompt_template.replace("{product_name}", product_name).replace("{short_description}", short_description)
         
         try:
             generation_config = GenerationConfig(response_mime_type="application/json")
-            response = await self.model.generate_content_async(contents=prompt, generation_config=generation_config)
+            response = await self.ai.generate(PRIORITY_PROMO, prompt, generation_config=generation_config)
             parsed_json = await self._parse_gemini_json_response(response.text)
             return parsed_json.get("generated_description") if parsed_json else short_description
         except Exception as e:
@@ -442,13 +693,56 @@ class ManagerCog(commands.Cog):
         
         await self.update_mission_progress(message.author, "send_message", 1)
 
+    async def flush_xp_buffer(self) -> bool:
+        """Écrit le tampon d'XP. Retourne False si l'écriture a échoué (les deltas restent en attente)."""
+        try:
+            flushed = await self.xp_buffer.flush()
+            # Les valeurs en cache ne reflètent plus Firestore une fois les incréments écrits.
+            for user_id in flushed:
+                self.invalidate_user(user_id)
+            return True
+        except Exception as e:
+            print(f"Erreur lors de l'écriture du tampon d'XP (les deltas seront réessayés): {e}")
+            return False
+
+    def _schedule_xp_flush(self):
+        if self._pending_xp_flush is None or self._pending_xp_flush.done():
+            self._pending_xp_flush = asyncio.create_task(self.flush_xp_buffer())
+
+    @tasks.loop(seconds=10)
+    async def xp_flush_task(self):
+        await self.flush_xp_buffer()
+
+    @tasks.loop(hours=24)
+    async def ledger_compaction_task(self):
+        """
+        Supprime les entrées de journal plus anciennes que la durée de rétention configurée.
+        La requête de groupe de collections sur `ledger.timestamp` nécessite l'exemption d'index
+        déclarée dans firestore.indexes.json.
+        """
+        retention_days = self.config.get("TRANSACTION_LOG_CONFIG", {}).get("RETENTION_DAYS", 90)
+        cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+        deleted = 0
+        while True:
+            query = self.db.collection_group('ledger').where('timestamp', '<', cutoff).limit(FIRESTORE_BATCH_LIMIT)
+            docs = [doc async for doc in query.stream()]
+            if not docs:
+                break
+            batch = self.db.batch()
+            for doc in docs:
+                batch.delete(doc.reference)
+            await batch.commit()
+            deleted += len(docs)
+        if deleted:
+            print(f"Compactage du journal : {deleted} entrée(s) de plus de {retention_days} jours supprimée(s).")
+
     @commands.Cog.listener()
     async def on_member_join(self, member: discord.Member):
         if member.bot or not self.db: return
         
         unverified_role_name = self.config.get("ROLES", {}).get("UNVERIFIED")
         if unverified_role_name:
-            role = discord.utils.get(member.guild.roles, name=unverified_role_name)
+            role = self.resources.role(member.guild, unverified_role_name)
             if role:
                 try:
                     await member.add_roles(role, reason="Nouveau membre")
@@ -467,14 +761,10 @@ class ManagerCog(commands.Cog):
                 break
         
         if inviter and inviter.id != member.id:
-            await user_ref.set({"referrer": str(inviter.id)}, merge=True)
-            
-            inviter_ref = self.db.collection('users').document(str(inviter.id))
-            tx = self.db.transaction()
-            await self.add_transaction(
-                tx, inviter_ref,
-                "referral_count", 1, f"Parrainage de {member.name}"
-            )
+            await (self.mutation()
+                .set(member.id, "referrer", str(inviter.id))
+                .add(inviter.id, "referral_count", 1, f"Parrainage de {member.name}")
+                .commit())
             print(f"{member.name} a été invité par {inviter.name}")
         
         await self._update_invite_cache(member.guild)
@@ -493,13 +783,25 @@ class ManagerCog(commands.Cog):
     async def on_invite_delete(self, invite: discord.Invite):
         await self._update_invite_cache(invite.guild)
     
-    async def get_or_create_user_data(self, user_ref: firestore.AsyncDocumentReference) -> Dict[str, Any]:
+    def invalidate_user(self, user_id: str):
+        """À appeler après toute écriture sur `users/{user_id}` faite hors des helpers du ManagerCog."""
+        self.user_cache.invalidate(str(user_id))
+
+    async def get_user_data(self, user_ref: firestore.AsyncDocumentReference) -> Optional[Dict[str, Any]]:
+        """Lit un document utilisateur en passant par le cache partagé. Retourne None s'il n'existe pas."""
+        cached = self.user_cache.get(user_ref.id)
+        if cached is not None:
+            return cached
         user_doc = await user_ref.get()
-        if user_doc.exists:
-            return user_doc.to_dict()
-        
-        default_data = {
-            "xp": 0, "level": 1, "weekly_xp": 0, "last_message_timestamp": 0,
+        if not user_doc.exists:
+            return None
+        user_data = user_doc.to_dict()
+        self.user_cache.put(user_ref.id, user_data)
+        return user_data
+
+    def _default_user_data(self) -> Dict[str, Any]:
+        return {
+            "xp": 0, "level": 1, "weekly_xp": 0, "weekly_epoch": self.weekly_epoch, "last_message_timestamp": 0,
             "message_count": 0, "purchase_count": 0, "purchase_total_value": 0.0,
             "achievements": [], "store_credit": 0.0, "warnings": 0,
             "affiliate_sale_count": 0, "affiliate_earnings": 0.0, "referral_count": 0,
@@ -508,45 +810,103 @@ class ManagerCog(commands.Cog):
             "join_timestamp": datetime.now(timezone.utc).timestamp(),
             "weekly_affiliate_earnings": 0.0,
             "active_boosters": {}, "permanent_affiliate_bonus": False, "vip_premium": None,
-            "transaction_log": [],
             "missions_opt_in": self.config.get("MISSION_SYSTEM", {}).get("OPT_IN_DEFAULT", True),
+            "coaching_opt_in": self.config.get("COACHING_CONFIG", {}).get("OPT_IN_DEFAULT", True),
             "current_daily_mission": None, "current_weekly_mission": None,
             "guild_id": None, "guild_bonus": {}
         }
+
+    async def get_or_create_user_data(self, user_ref: firestore.AsyncDocumentReference) -> Dict[str, Any]:
+        user_data = await self.get_user_data(user_ref)
+        if user_data is not None:
+            return user_data
+        
+        default_data = self._default_user_data()
         await user_ref.set(default_data)
+        self.user_cache.put(user_ref.id, default_data)
         print(f"Nouvel utilisateur initialisé dans Firestore : {user_ref.id}")
         return default_data
 
-    @transaction.async_transactional # FIX: Using the imported transaction module
-    async def add_transaction(self, trans: firestore.AsyncTransaction, user_ref: firestore.AsyncDocumentReference, type: str, amount: any, description: str):
-        user_doc = await user_ref.get(transaction=trans)
-        user_data = user_doc.to_dict() if user_doc.exists else await self.get_or_create_user_data(user_ref)
-        
-        new_value = user_data.get(type, 0) + amount
-        
-        log_entry = {
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "type": type, "amount": amount, "description": description
-        }
-        transaction_log = user_data.get("transaction_log", [])
-        transaction_log.insert(0, log_entry) # Add to the beginning
-        
-        max_log_size = self.config.get("TRANSACTION_LOG_CONFIG", {}).get("MAX_USER_LOG_SIZE", 50)
-        if len(transaction_log) > max_log_size:
-            transaction_log = transaction_log[:max_log_size]
-            
-        update_payload = {
-            type: new_value,
-            "transaction_log": transaction_log
-        }
-        trans.update(user_ref, update_payload)
+    def mutation(self) -> UserMutation:
+        """Crée une unité de travail sur les documents utilisateurs (une lecture et une écriture par document)."""
+        return UserMutation(
+            self.db, self._default_user_data, on_commit=self.publish_user_states, epoch=self.weekly_epoch,
+            achievement_index=self.achievement_index, on_unlock=self._on_achievements_unlocked
+        )
 
-    async def grant_xp(self, user: discord.Member, source: any, reason: str, _is_achievement_reward: bool = False):
+    def _on_achievements_unlocked(self, user_id: str, achievements: List[Dict[str, Any]], state: Dict[str, Any]):
+        """
+        Suites d'un déblocage de succès (déjà écrit avec la statistique) : historique d'activité,
+        XP de guilde et montée de niveau éventuelle due à l'XP de la récompense.
+        """
+        reward = sum(achievement.get("reward_xp", 0) for achievement in achievements if achievement.get("reward_xp", 0) > 0)
+        if not reward:
+            return
+        self.record_activity(user_id, xp=reward)
+        if state.get("guild_id"):
+            self.spawn(self.credit_guild_xp(state["guild_id"], reward), "XP de guilde d'un succès")
+        guild_id_str = self.config.get("GUILD_ID")
+        guild = self.bot.get_guild(int(guild_id_str)) if guild_id_str and guild_id_str.isdigit() else None
+        member = guild.get_member(int(user_id)) if guild else None
+        if member:
+            self.spawn(self.refresh_level(member), "niveau après un succès")
+
+    def spawn(self, coro, label: str) -> asyncio.Task:
+        """Lance une tâche de fond gardée en référence jusqu'à sa fin ; son éventuelle erreur est journalisée."""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+
+        def done(finished: asyncio.Task):
+            self._background_tasks.discard(finished)
+            if not finished.cancelled() and finished.exception():
+                print(f"Erreur de tâche de fond ({label}): {finished.exception()}")
+        task.add_done_callback(done)
+        return task
+
+    async def credit_guild_xp(self, guild_id: str, xp: int):
+        await self.ensure_guild_epoch(guild_id)
+        if self._epoch_rollover:
+            # Pendant la bascule d'époque, un incrément en tampon serait écrit après la remise à zéro.
+            await self.db.collection('guilds').document(guild_id).update({"weekly_xp": firestore.Increment(xp)})
+            return
+        if self.xp_buffer.add_guild_xp(guild_id, xp):
+            self._schedule_xp_flush()
+
+    @staticmethod
+    def activity_day(when: Optional[datetime] = None) -> str:
+        """Clé (AAAAMMJJ, UTC) du seau d'activité journalier."""
+        return (when or datetime.now(timezone.utc)).strftime("%Y%m%d")
+
+    def record_activity(self, user_id: str, xp: int = 0, affiliate: float = 0.0, messages: int = 0):
+        """Ajoute des gains à l'historique d'activité du jour (écrit en différé avec le tampon d'XP)."""
+        if self.xp_buffer.add_activity(str(user_id), self.activity_day(), {"xp": xp, "affiliate": affiliate, "messages": messages}):
+            self._schedule_xp_flush()
+
+    def publish_user_states(self, states: Dict[str, Dict[str, Any]]):
+        """
+        À appeler avec les états retournés par une transaction validée (UserMutation).
+        Write-through dans le cache et notification `user_stats_changed` aux autres cogs.
+        """
+        for user_id, state in states.items():
+            self.user_cache.put(user_id, state)
+            self.bot.dispatch("user_stats_changed", user_id, self.xp_buffer.overlay(user_id, state))
+
+    async def get_ledger_page(self, user_id: str, page_size: int = 10, start_after: Optional[Any] = None) -> tuple[List[Dict[str, Any]], Optional[Any]]:
+        """Retourne une page du journal d'un utilisateur (du plus récent au plus ancien) et le curseur de la page suivante."""
+        query = self.db.collection('users').document(str(user_id)).collection('ledger').order_by('timestamp', direction=firestore.Query.DESCENDING)
+        if start_after is not None:
+            query = query.start_after(start_after)
+        docs = [doc async for doc in query.limit(page_size + 1).stream()]
+        next_cursor = docs[page_size - 1] if len(docs) > page_size else None
+        return [doc.to_dict() for doc in docs[:page_size]], next_cursor
+
+    async def grant_xp(self, user: discord.Member, source: any, reason: str):
         user_id_str = str(user.id)
         user_ref = self.db.collection('users').document(user_id_str)
         xp_config = self.config.get("GAMIFICATION_CONFIG", {}).get("XP_SYSTEM", {})
         
-        user_data = await self.get_or_create_user_data(user_ref)
+        stored_data = await self.get_or_create_user_data(user_ref)
+        user_data = self.xp_buffer.overlay(user_id_str, stored_data)
         
         if isinstance(source, str) and source == "message" and user_data.get("xp_gated", False):
             return
@@ -554,63 +914,70 @@ class ManagerCog(commands.Cog):
         now = datetime.now(timezone.utc)
         
         xp_to_add = 0
-        tx = self.db.transaction()
         if source == "message":
             cooldown = xp_config.get("ANTI_FARM_COOLDOWN_SECONDS", 60)
             last_msg_ts = user_data.get("last_message_timestamp", 0)
             if now.timestamp() - last_msg_ts < cooldown: return
             xp_per_message_range = xp_config.get("XP_PER_MESSAGE", [10, 20])
             xp_to_add = random.randint(*xp_per_message_range)
-            await user_ref.update({"last_message_timestamp": now.timestamp()})
-            await self.add_transaction(tx, user_ref, "message_count", 1, reason)
         elif isinstance(source, int):
             xp_to_add = source
         
         if xp_to_add == 0: return
 
-        # --- Calculate Boosts ---
-        total_boost = 1.0
-        # VIP Bonus
-        vip_data = user_data.get("vip_premium")
-        if vip_data and datetime.fromisoformat(vip_data.get("expires_at", "1970-01-01T00:00:00+00:00")) > now:
-            vip_config = self.config.get("GAMIFICATION_CONFIG", {}).get("VIP_SYSTEM", {}).get("PREMIUM", {})
-            sorted_tiers = sorted(vip_config.get("XP_BOOST_TIERS", []), key=lambda x: x.get("consecutive_months", 0), reverse=True)
-            for tier in sorted_tiers:
-                if vip_data.get("consecutive_months", 0) >= tier.get("consecutive_months", 999):
-                    total_boost += tier.get("boost", 0)
-                    break
-        
-        # Check for active XP boosters from shop
-        active_boosters = user_data.get("active_boosters", {})
-        for booster_id, booster_data in active_boosters.items():
-            if 'xp_booster' in booster_id and datetime.fromisoformat(booster_data.get('expires_at', "1970-01-01T00:00:00+00:00")) > now:
-                total_boost += booster_data.get('multiplier', 1.0) - 1.0 # e.g., 1.25 -> 0.25
+        # --- Calculate Boosts --- (VIP tiers and shop boosters, compiled at config load)
+        total_boost = self.rules.xp_multiplier(user_data, now.timestamp())
         
         # Event bonus
         event_multiplier = self.active_events.get("double_xp", {}).get("multiplier", 1.0)
         final_xp = int(xp_to_add * total_boost * event_multiplier)
         
-        @transaction.async_transactional # FIX: Using the imported transaction module
-        async def _update_xp_and_guild(trans, user_ref, guild_ref, final_xp, reason):
-            await self.add_transaction(trans, user_ref, "xp", final_xp, reason)
-            await self.add_transaction(trans, user_ref, "weekly_xp", final_xp, f"Gain hebdomadaire: {reason}")
-            if guild_ref:
-                trans.update(guild_ref, {"weekly_xp": firestore.Increment(final_xp)})
-
         guild_id = user_data.get("guild_id")
-        guild_ref = self.db.collection('guilds').document(guild_id) if guild_id else None
-        
-        await _update_xp_and_guild(self.db.transaction(), user_ref, guild_ref, final_xp, reason)
+        if guild_id:
+            await self.ensure_guild_epoch(guild_id)
+        # Un Increment aveugle n'est correct que si le document est déjà sur l'époque courante ;
+        # sinon le premier gain de la semaine passe par une transaction qui remet les compteurs à zéro.
+        # Pendant la bascule d'époque, rien n'est mis en tampon : un delta accepté sous l'ancienne époque
+        # et écrit après la bascule tomberait sur un document encore marqué de l'ancienne époque.
+        buffered = source == "message" and not self._epoch_rollover and user_data.get("weekly_epoch", 0) == self.weekly_epoch
+        if buffered and self.achievement_index.newly_unlocked({**user_data, "message_count": user_data.get("message_count", 0) + 1}, ("message_count",)):
+            # Ce message débloque un succès : il est écrit avec le compteur dans une transaction, après le tampon en attente.
+            await self.flush_xp_buffer()
+            buffered = False
+        if buffered:
+            # Chemin chaud : les gains liés aux messages sont écrits en différé et par lots.
+            flush_needed = self.xp_buffer.add(
+                user_id_str,
+                {"xp": final_xp, "weekly_xp": final_xp, "message_count": 1},
+                {"last_message_timestamp": now.timestamp()},
+                guild_id=guild_id, guild_xp=final_xp
+            )
+            if flush_needed:
+                self._schedule_xp_flush()
+            self.bot.dispatch("user_stats_changed", user_id_str, self.xp_buffer.overlay(user_id_str, stored_data))
+        else:
+            mutation = (self.mutation()
+                .add(user_id_str, "xp", final_xp, reason)
+                .add(user_id_str, "weekly_xp", final_xp, f"Gain hebdomadaire: {reason}"))
+            if source == "message":
+                mutation.add(user_id_str, "message_count", 1, "Message").set(user_id_str, "last_message_timestamp", now.timestamp())
+            if guild_id:
+                mutation.update_document(self.db.collection('guilds').document(guild_id), {"weekly_xp": firestore.Increment(final_xp)})
+            await mutation.commit()
+        self.record_activity(user_id_str, xp=final_xp, messages=1 if source == "message" else 0)
+
+        await self.refresh_level(user)
+
+    async def refresh_level(self, user: discord.Member):
+        """Applique une éventuelle montée de niveau (rôles, parrainage) et l'annonce ; une vérification à la fois par membre."""
+        lock = self._level_locks.setdefault(str(user.id), asyncio.Lock())
+        async with lock:
+            leveled_up, new_level = await self.check_level_up(user)
 
-        leveled_up, new_level = await self.check_level_up(user)
-        
-        if not _is_achievement_reward:
-            await self.check_achievements(user)
-        
         if leveled_up:
             channel_name = self.config.get("CHANNELS", {}).get("LEVEL_UP_ANNOUNCEMENTS")
             if channel_name:
-                channel = discord.utils.get(user.guild.text_channels, name=channel_name)
+                channel = self.resources.channel(user.guild, channel_name)
                 if channel:
                     await channel.send(f"🎉 Bravo {user.mention}, tu as atteint le niveau **{new_level}** !")
 
@@ -629,6 +996,7 @@ class ManagerCog(commands.Cog):
                 xp_gain = xp_config.get("XP_BONUS_REFERRAL_HITS_LVL_5", 2000)
                 user_ref = self.db.collection('users').document(str(user.id))
                 await user_ref.update({"lvl5_milestone_rewarded": True})
+                self.invalidate_user(user_ref.id)
                 await self.grant_xp(referrer, xp_gain, f"Filleul {user.display_name} a atteint le niveau 5")
                 try:
                     await referrer.send(f"🚀 Votre filleul {user.mention} a atteint le niveau 5 rapidement ! Vous gagnez **{xp_gain} XP** bonus !")
@@ -636,52 +1004,46 @@ class ManagerCog(commands.Cog):
 
     async def check_level_up(self, user: discord.Member) -> tuple[bool, int]:
         user_ref = self.db.collection('users').document(str(user.id))
-        user_data = (await user_ref.get()).to_dict()
+        user_data = self.xp_buffer.overlay(user_ref.id, await self.get_user_data(user_ref))
         if not user_data: return False, 1
 
         if user_data.get("xp_gated", False): return False, user_data.get("level", 1)
         
-        xp_config = self.config.get("GAMIFICATION_CONFIG", {}).get("XP_SYSTEM", {})
-        base_xp = xp_config.get("LEVEL_UP_FORMULA_BASE_XP", 150)
-        multiplier = xp_config.get("LEVEL_UP_FORMULA_MULTIPLIER", 1.6)
         old_level = user_data.get("level", 1)
-        xp_needed = int(base_xp * (multiplier ** old_level))
-        
-        if user_data.get("xp", 0) < xp_needed:
+        new_level = self.level_table.level_for(user_data.get("xp", 0))
+        if new_level <= old_level:
             return False, old_level
-            
-        new_level = old_level
-        while user_data.get("xp", 0) >= int(base_xp * (multiplier ** new_level)):
-            new_level += 1
         
-        tx = self.db.transaction()
-        await self.add_transaction(tx, user_ref, "level", new_level - old_level, "Montée de niveau")
+        await self.mutation().add(user_ref.id, "level", new_level - old_level, "Montée de niveau").commit()
         
         await self.check_referral_milestones(user, user_data)
         # DM logic and role rewards...
         return True, new_level
 
 
-    async def check_achievements(self, user: discord.Member):
-        if not user: return
-        user_ref = self.db.collection('users').document(str(user.id))
-        user_stats = (await user_ref.get()).to_dict()
-        if not user_stats: return
-
-        for achievement in self.achievements:
-            if achievement.get("id") in user_stats.get("achievements", []): continue
-            trigger = achievement.get("trigger", {})
-            if user_stats.get(trigger.get("type"), 0) >= trigger.get("value", 999999):
-                await self.grant_achievement(user, achievement)
-    
-    async def grant_achievement(self, user: discord.Member, achievement: dict):
-        user_ref = self.db.collection('users').document(str(user.id))
-        await user_ref.update({"achievements": firestore.ArrayUnion([achievement.get("id")])})
-
-        if (xp_reward := achievement.get("reward_xp", 0)) > 0:
-            await self.grant_xp(user, xp_reward, f"Succès: {achievement.get('name')}", _is_achievement_reward=True)
-        
-        # Announcement logic remains the same...
+    async def recompute_all_levels(self) -> tuple[int, int]:
+        """
+        Recalcule en masse le niveau de tous les membres avec la table courante (après un changement
+        de formule). Seuls les niveaux modifiés sont écrits. Retourne (membres analysés, niveaux modifiés).
+        """
+        await self.flush_xp_buffer()
+        user_ids, xp_values, levels = [], [], []
+        async for doc in self.db.collection('users').select(['xp', 'level', 'xp_gated']).stream():
+            data = doc.to_dict()
+            # Les membres bloqués par un défi de prestige gardent leur niveau.
+            if data.get('xp_gated', False):
+                continue
+            user_ids.append(doc.id)
+            xp_values.append(data.get('xp', 0))
+            levels.append(data.get('level', 1))
+
+        changes = self.level_table.changed_levels(xp_values, levels)
+        users = self.db.collection('users')
+        await commit_updates(self.db, [(users.document(user_ids[i]), {"level": level}) for i, level in changes],
+                             concurrency=self.config.get("WEEKLY_RESET_CONFIG", {}).get("CONCURRENCY", 4))
+        for i, _ in changes:
+            self.invalidate_user(user_ids[i])
+        return len(user_ids), len(changes)
 
     async def record_purchase(self, user_id: int, product: dict, option: Optional[dict], credit_used: float, guild_id: int, transaction_code: str) -> tuple[bool, str]:
         guild = self.bot.get_guild(guild_id)
@@ -689,11 +1051,18 @@ class ManagerCog(commands.Cog):
         member = guild.get_member(user_id)
         if not member: return False, "Membre non trouvé."
         
-        buyer_ref = self.db.collection('users').document(str(user_id))
+        buyer_id_str = str(user_id)
+        buyer_data = await self.get_or_create_user_data(self.db.collection('users').document(buyer_id_str))
         price = option.get('price') if option else product.get('price', 0)
+
+        # Acheteur et parrain sont mis à jour dans une seule transaction (une lecture/écriture par document).
+        mutation = (self.mutation()
+            .add(buyer_id_str, "purchase_count", 1, "Achat")
+            .add(buyer_id_str, "purchase_total_value", price, "Achat"))
+        if credit_used > 0:
+            mutation.add(buyer_id_str, "store_credit", -credit_used, "Achat avec crédit")
         
         if product.get("type") == "subscription":
-             buyer_data = await self.get_or_create_user_data(buyer_ref)
              vip_data = buyer_data.get("vip_premium")
              now = datetime.now(timezone.utc)
              duration = self.config.get("GAMIFICATION_CONFIG", {}).get("VIP_SYSTEM", {}).get("PREMIUM", {}).get("DURATION_DAYS", 7)
@@ -704,29 +1073,14 @@ class ManagerCog(commands.Cog):
                  "expires_at": new_expiry.isoformat(),
                  "consecutive_months": vip_data.get("consecutive_months", 0) + 1 if vip_data else 1
              }
-             await buyer_ref.update({"vip_premium": new_vip_data})
+             mutation.set(buyer_id_str, "vip_premium", new_vip_data)
              
              vip_role_name = self.config.get("ROLES", {}).get("VIP_PREMIUM")
              if vip_role_name:
-                 role = discord.utils.get(guild.roles, name=vip_role_name)
+                 role = self.resources.role(guild, vip_role_name)
                  if role: await member.add_roles(role)
 
-        tx = self.db.transaction()
-        @transaction.async_transactional # FIX: Using the imported transaction module
-        async def purchase_transaction(trans, buyer_ref, price, credit_used):
-            await self.add_transaction(trans, buyer_ref, "purchase_count", 1, "Achat")
-            await self.add_transaction(trans, buyer_ref, "purchase_total_value", price, "Achat")
-            if credit_used > 0:
-                await self.add_transaction(trans, buyer_ref, "store_credit", -credit_used, "Achat avec crédit")
-        
-        await purchase_transaction(tx, buyer_ref, price, credit_used)
-
-        xp_per_euro = self.config.get("GAMIFICATION_CONFIG", {}).get("XP_SYSTEM", {}).get("XP_PER_EURO_SPENT", 20)
-        xp_gain = int(price * xp_per_euro)
-        await self.grant_xp(member, xp_gain, "Achat")
-        await self.check_achievements(member)
-        
-        buyer_data = (await buyer_ref.get()).to_dict()
+        referrer = None
         referrer_id_str = buyer_data.get("referrer")
         if referrer_id_str:
             referrer = guild.get_member(int(referrer_id_str))
@@ -734,55 +1088,34 @@ class ManagerCog(commands.Cog):
                 referrer_data = await self.get_or_create_user_data(self.db.collection('users').document(referrer_id_str))
                 commission_earned = self.calculate_commission(referrer_data, price, product, option)
                 if commission_earned > 0:
-                    ref_transaction = self.db.transaction()
-                    await self.add_transaction(ref_transaction, self.db.collection('users').document(referrer_id_str), "store_credit", commission_earned, f"Commission sur achat de {member.display_name}")
-                    await self.add_transaction(ref_transaction, self.db.collection('users').document(referrer_id_str), "affiliate_earnings", commission_earned, "Gain d'affiliation")
-                    await self.add_transaction(ref_transaction, self.db.collection('users').document(referrer_id_str), "weekly_affiliate_earnings", commission_earned, "Gain d'affiliation hebdo")
-                    await self.check_achievements(referrer)
+                    (mutation
+                        .add(referrer_id_str, "store_credit", commission_earned, f"Commission sur achat de {member.display_name}")
+                        .add(referrer_id_str, "affiliate_earnings", commission_earned, "Gain d'affiliation")
+                        .add(referrer_id_str, "weekly_affiliate_earnings", commission_earned, "Gain d'affiliation hebdo"))
+                else:
+                    referrer = None
+
+        await mutation.commit()
+        if referrer:
+            self.record_activity(referrer_id_str, affiliate=commission_earned)
+
+        xp_per_euro = self.config.get("GAMIFICATION_CONFIG", {}).get("XP_SYSTEM", {}).get("XP_PER_EURO_SPENT", 20)
+        xp_gain = int(price * xp_per_euro)
+        await self.grant_xp(member, xp_gain, "Achat")
         
         return True, "Achat enregistré."
     
     def calculate_commission(self, referrer_data: dict, price: float, product: dict, option: Optional[dict]) -> float:
         """Calculates affiliate commission based on comprehensive rules."""
-        aff_config = self.config.get("GAMIFICATION_CONFIG", {}).get("AFFILIATE_SYSTEM", {})
-        vip_config = self.config.get("GAMIFICATION_CONFIG", {}).get("VIP_SYSTEM", {}).get("PREMIUM", {})
-        guild_config = self.config.get("GUILD_SYSTEM", {})
-        now = datetime.now(timezone.utc)
-        
         margin_type = product.get("margin_type", "total")
         commissionable_amount = price - (option.get("purchase_cost", 0) if option else product.get("purchase_cost", 0)) if margin_type == "net" else price
         if commissionable_amount <= 0: return 0.0
 
-        guild_bonus = referrer_data.get("guild_bonus", {})
-        if guild_bonus.get("type") == 'top1':
-            return commissionable_amount * guild_config.get("WEEKLY_REWARDS", {}).get("TOP_1", {}).get("commission_rate", 0.90)
-
-        base_rate = next((t.get('rate', 0) for t in sorted(aff_config.get("COMMISSION_TIERS", []), key=lambda x: x.get('level', 0), reverse=True) if referrer_data.get("level", 1) >= t.get('level', 999)), 0)
-        
-        total_boost = 0.0
-        vip_data = referrer_data.get("vip_premium")
-        if vip_data and datetime.fromisoformat(vip_data.get("expires_at", "1970-01-01T00:00:00+00:00")) > now:
-            total_boost += next((t.get('bonus', 0) for t in sorted(vip_config.get("COMMISSION_BONUS_TIERS", []), key=lambda x: x.get('consecutive_months', 0), reverse=True) if vip_data.get("consecutive_months", 0) >= t.get('consecutive_months', 999)), 0)
-            
-        if referrer_data.get("permanent_affiliate_bonus", False):
-            total_boost += aff_config.get("PERMANENT_LOYALTY_BONUS", {}).get("RATE", 0)
-            
-        active_boosters = referrer_data.get("active_boosters", {})
-        for booster_id, booster_data in active_boosters.items():
-            if 'commission_booster' in booster_id and datetime.fromisoformat(booster_data.get('expires_at', "1970-01-01T00:00:00+00:00")) > now:
-                total_boost += booster_data.get('bonus', 0.0)
-                
-        total_boost += referrer_data.get("affiliate_booster", 0.0)
-        
-        if guild_bonus.get("type") in ['top2', 'top3']:
-            total_boost += guild_bonus.get("commission_boost", 0.0)
-        
-        commission_rate = base_rate + total_boost
-        
-        cap = guild_bonus.get("max_commission_rate", 1.0) if guild_bonus.get("type") in ['top2', 'top3'] else 1.0
-        
-        final_rate = min(commission_rate, cap)
-        return commissionable_amount * final_rate
+        rate = self.rules.commission_rate(
+            referrer_data, self.guild_bonus(referrer_data),
+            self.weekly_value(referrer_data, "affiliate_booster"), datetime.now(timezone.utc).timestamp()
+        )
+        return commissionable_amount * rate
 
     async def grant_cashout_commission(self, referrer_id_str: str, amount_cashed_out: float, referral_member: discord.Member, guild: discord.Guild):
         """Grants commission to a referrer when their referral cashes out."""
@@ -792,27 +1125,17 @@ class ManagerCog(commands.Cog):
         
         if not referrer: return
 
-        cashout_config = self.config.get("GAMIFICATION_CONFIG", {}).get("AFFILIATE_SYSTEM", {}).get("CASHOUT_COMMISSION", {})
-        guild_bonus = referrer_data.get("guild_bonus", {})
-        
-        # Start with the base rate
-        rate = cashout_config.get("BASE_RATE", 0.05)
-        
-        # Guild bonus takes precedence over all other bonuses
-        guild_bonus_type = guild_bonus.get("type")
-        if guild_bonus_type in ['top1', 'top2', 'top3']:
-            # The cashout_commission_rate is stored in the user's guild_bonus dict
-            rate = guild_bonus.get("cashout_commission_rate", rate)
-        # If no guild bonus applies, check for VIP status
-        elif referrer_data.get("vip_premium"):
-            rate = cashout_config.get("VIP_RATE", rate)
+        # Guild bonus takes precedence over all other bonuses, then VIP status
+        rate = self.rules.cashout_commission_rate(referrer_data, self.guild_bonus(referrer_data))
 
         commission_earned = amount_cashed_out * rate
         if commission_earned > 0:
-            tx = self.db.transaction()
-            await self.add_transaction(tx, referrer_ref, "store_credit", commission_earned, f"Commission sur cashout de {referral_member.display_name}")
-            await self.add_transaction(tx, referrer_ref, "affiliate_earnings", commission_earned, "Gain d'affiliation (cashout)")
-            await self.add_transaction(tx, referrer_ref, "weekly_affiliate_earnings", commission_earned, "Gain d'affiliation hebdo (cashout)")
+            await (self.mutation()
+                .add(referrer_id_str, "store_credit", commission_earned, f"Commission sur cashout de {referral_member.display_name}")
+                .add(referrer_id_str, "affiliate_earnings", commission_earned, "Gain d'affiliation (cashout)")
+                .add(referrer_id_str, "weekly_affiliate_earnings", commission_earned, "Gain d'affiliation hebdo (cashout)")
+                .commit())
+            self.record_activity(referrer_id_str, affiliate=commission_earned)
             try:
                 await referrer.send(f"💸 Votre filleul {referral_member.display_name} a retiré de l'argent ! Vous gagnez une commission de **{commission_earned:.2f} crédits**.")
             except discord.Forbidden: pass
@@ -832,15 +1155,19 @@ class ManagerCog(commands.Cog):
             # Apply VIP discount if applicable
             xp_gained = math.floor(credits / cost_per_xp)
             
-            await self.add_transaction(trans, user_ref, "store_credit", -credits, f"Achat de {xp_gained} XP")
-            await self.add_transaction(trans, user_ref, "xp", xp_gained, f"Achat avec {credits} crédits")
+            mutation = (self.mutation()
+                .add(user_ref.id, "store_credit", -credits, f"Achat de {xp_gained} XP")
+                .add(user_ref.id, "xp", xp_gained, f"Achat avec {credits} crédits"))
+            await mutation.apply(trans, {user_ref.id: user_data})
             
-            return {"success": True, "xp_gained": xp_gained}
+            return {"success": True, "xp_gained": xp_gained, "mutation": mutation}
 
         result = await purchase_xp_tx(self.db.transaction(), user_ref, credits_to_spend)
 
         if result["success"]:
-            await self.check_level_up(interaction.user)
+            result["mutation"].after_commit()
+            self.record_activity(user_ref.id, xp=result["xp_gained"])
+            await self.refresh_level(interaction.user)
             await interaction.response.send_message(f"✅ Vous avez échangé **{credits_to_spend:.2f} crédits** contre **{result['xp_gained']} XP** !", ephemeral=True)
         else:
             await interaction.response.send_message(f"❌ {result['reason']}", ephemeral=True)
@@ -874,16 +1201,16 @@ class ManagerCog(commands.Cog):
             return await interaction.followup.send(f"❌ Le montant minimum de retrait pour votre niveau est de **{threshold:.2f} crédits**.", ephemeral=True)
         
         euros_to_send = amount * cashout_config.get("CREDIT_TO_EUR_RATE", 1.0)
-        await self.add_transaction(self.db.transaction(), user_ref, "store_credit", -amount, f"Demande de retrait de {amount:.2f} crédits")
+        await self.mutation().add(user_ref.id, "store_credit", -amount, f"Demande de retrait de {amount:.2f} crédits").commit()
         
         requests_channel_name = self.config.get("CHANNELS", {}).get("CASHOUT_REQUESTS")
         if not requests_channel_name:
-            await self.add_transaction(self.db.transaction(), user_ref, "store_credit", amount, "Remboursement - Erreur canal de retrait")
+            await self.mutation().add(user_ref.id, "store_credit", amount, "Remboursement - Erreur canal de retrait").commit()
             return await interaction.followup.send("❌ Erreur critique : le salon des demandes de retrait n'est pas configuré. Votre demande a été annulée et vos crédits restaurés.", ephemeral=True)
 
-        channel = discord.utils.get(interaction.guild.text_channels, name=requests_channel_name)
+        channel = self.resources.channel(interaction.guild, requests_channel_name)
         if not channel:
-            await self.add_transaction(self.db.transaction(), user_ref, "store_credit", amount, "Remboursement - Erreur canal de retrait")
+            await self.mutation().add(user_ref.id, "store_credit", amount, "Remboursement - Erreur canal de retrait").commit()
             return await interaction.followup.send("❌ Erreur critique : le salon des demandes de retrait est introuvable. Votre demande a été annulée et vos crédits restaurés.", ephemeral=True)
             
         embed = discord.Embed(title="Nouvelle Demande de Retrait", color=discord.Color.gold())
@@ -909,7 +1236,7 @@ class ManagerCog(commands.Cog):
         if not mod_alerts_channel_name:
             return await interaction.followup.send("Erreur: Impossible de soumettre le défi (canal de modération non configuré).", ephemeral=True)
             
-        channel = discord.utils.get(interaction.guild.text_channels, name=mod_alerts_channel_name)
+        channel = self.resources.channel(interaction.guild, mod_alerts_channel_name)
         if not channel:
             return await interaction.followup.send("Erreur: Impossible de soumettre le défi.", ephemeral=True)
         
@@ -938,6 +1265,7 @@ class ManagerCog(commands.Cog):
                             await user.send(f"🎉 **Mission accomplie !**\n> {mission.get('description')}\n**Récompense :** +{mission.get('reward_xp', 0)} XP")
                         except discord.Forbidden: pass
                 await user_ref.update({mission_type: mission})
+                self.invalidate_user(user_ref.id)
                 break
 
     @tasks.loop(hours=24)
@@ -972,6 +1300,7 @@ class ManagerCog(commands.Cog):
                 }
             
             await user_doc.reference.update(update_data)
+            self.invalidate_user(user_doc.id)
 
 
     @tasks.loop(hours=1)
@@ -984,7 +1313,7 @@ class ManagerCog(commands.Cog):
         if not guild: return
         
         vip_role_name = self.config.get("ROLES", {}).get("VIP_PREMIUM")
-        vip_role = discord.utils.get(guild.roles, name=vip_role_name) if vip_role_name else None
+        vip_role = self.resources.role(guild, vip_role_name) if vip_role_name else None
         if not vip_role: return
 
         query = self.db.collection('users').where('vip_premium', '!=', None).stream()
@@ -998,32 +1327,131 @@ class ManagerCog(commands.Cog):
                 if member:
                     await member.remove_roles(vip_role, reason="Abonnement VIP Premium expiré")
                 await doc.reference.update({"vip_premium": firestore.DELETE_FIELD})
+                self.invalidate_user(doc.id)
 
 
     @tasks.loop(hours=168) # Weekly
     async def weekly_coaching_report_task(self):
         if not self.model: return
-        
+        try:
+            finished = await self.run_weekly_coaching()
+        except Exception as e:
+            print(f"Erreur du coaching hebdomadaire (nouvelle tentative programmée): {e}")
+            finished = False
+        # Tant que la semaine n'est pas terminée, elle est reprise toutes les RETRY_MINUTES (membres restants seulement).
+        if finished:
+            self.weekly_coaching_report_task.change_interval(hours=168)
+        else:
+            self.weekly_coaching_report_task.change_interval(minutes=self.config.get("COACHING_CONFIG", {}).get("RETRY_MINUTES", 30))
+
+    async def run_weekly_coaching(self) -> bool:
+        """
+        Rapports de coaching hebdomadaires : les membres éligibles (hors désinscrits) sont lus d'abord, puis
+        `CONCURRENCY` tâches génèrent les rapports pendant qu'un expéditeur unique envoie les MPs au rythme
+        de `DMS_PER_MINUTE`. Les membres traités sont enregistrés dans `system/weekly_coaching` par paquets :
+        une reprise (redémarrage ou nouvelle tentative) ne renvoie aucun rapport. Retourne True quand la semaine est terminée.
+        """
         coach_prompt = self.config.get("AI_PROCESSING_CONFIG", {}).get("AI_WEEKLY_COACH_PROMPT")
-        if not coach_prompt: return
-        
-        users_query = self.db.collection('users').where('weekly_xp', '>', 10).stream()
-
-        async for doc in users_query:
+        if not coach_prompt: return True
+        coaching_config = self.config.get("COACHING_CONFIG", {})
+        concurrency = max(1, coaching_config.get("CONCURRENCY", 4))
+        dm_interval = 60 / max(coaching_config.get("DMS_PER_MINUTE", 30), 1)
+        checkpoint_every = max(1, coaching_config.get("CHECKPOINT_EVERY", 25))
+        breaker_wait = coaching_config.get("BREAKER_WAIT_MINUTES", 30) * 60
+
+        pipeline = BatchWritePipeline(self.db, "weekly_coaching", datetime.now(timezone.utc).strftime("%G-W%V"))
+        checkpoint = await pipeline.load_checkpoint()
+        if checkpoint.get("finished"):
+            print("Rapports de coaching déjà envoyés cette semaine.")
+            return True
+        done = set(checkpoint.get("done", {}))
+
+        # Sélection complète avant toute génération : aucun flux Firestore ne reste ouvert pendant l'envoi.
+        candidates = []
+        skipped = 0
+        async for doc in self.weekly_query('users', 'weekly_xp', 10).stream():
             user_data = doc.to_dict()
-            user_id = int(doc.id)
-            user = self.bot.get_user(user_id)
+            if doc.id in done or not user_data.get("coaching_opt_in", True):
+                skipped += 1
+                continue
+            user = self.bot.get_user(int(doc.id))
             if user:
-                prompt = coach_prompt.format(
+                candidates.append((doc.id, user, coach_prompt.format(
                     username=user.display_name,
-                    weekly_xp=user_data.get('weekly_xp', 0),
-                    weekly_affiliate_earnings=user_data.get('weekly_affiliate_earnings', 0.0)
-                )
+                    weekly_xp=self.weekly_value(user_data, 'weekly_xp'),
+                    weekly_affiliate_earnings=self.weekly_value(user_data, 'weekly_affiliate_earnings')
+                )))
+        print(f"Coaching hebdomadaire : {len(candidates)} rapports à envoyer ({skipped} membres déjà traités ou désinscrits).")
+
+        prompts: asyncio.Queue = asyncio.Queue()
+        for candidate in candidates:
+            prompts.put_nowait(candidate)
+        reports: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+        processed: Dict[str, bool] = {}
+        stats = {"sent": 0, "dm_failed": 0, "generation_failed": 0, "breaker_waits": 0}
+
+        async def generate_reports():
+            waited = 0.0
+            while not prompts.empty():
+                user_id, user, prompt = prompts.get_nowait()
                 try:
-                    response = await self.model.generate_content_async(prompt)
-                    await user.send(response.text)
+                    response = await self.ai.generate(PRIORITY_COACHING, prompt)
+                    await reports.put((user_id, user, response.text))
+                except GatewayUnavailable:
+                    # Disjoncteur ouvert : le membre est remis en file et la génération attend la fenêtre semi-ouverte.
+                    prompts.put_nowait((user_id, user, prompt))
+                    delay = max(self.ai.breaker.retry_in, 1.0)
+                    if waited + delay > breaker_wait:
+                        # Panne trop longue pour ce passage : les membres restants sont repris par la nouvelle tentative.
+                        stats["generation_failed"] += prompts.qsize()
+                        while not prompts.empty():
+                            prompts.get_nowait()
+                        return
+                    if not stats["breaker_waits"]:
+                        print(f"Coaching hebdomadaire en pause : Gemini indisponible, reprise dans {delay:.0f}s.")
+                    stats["breaker_waits"] += 1
+                    waited += delay
+                    await asyncio.sleep(delay)
                 except Exception as e:
+                    # Non enregistré : le membre sera repris si la semaine est relancée.
+                    stats["generation_failed"] += 1
+                    print(f"Erreur génération coaching pour {user_id}: {e}")
+
+        async def send_reports():
+            while (report := await reports.get()) is not None:
+                user_id, user, text = report
+                try:
+                    await user.send(text[:2000])
+                    stats["sent"] += 1
+                except discord.HTTPException as e:
+                    stats["dm_failed"] += 1
                     print(f"Erreur envoi coaching DM à {user_id}: {e}")
+                processed[user_id] = True
+                if len(processed) >= checkpoint_every:
+                    await pipeline.save_checkpoint(done=dict(processed))
+                    processed.clear()
+                await asyncio.sleep(dm_interval)
+
+        async def generate_all():
+            await asyncio.gather(*(generate_reports() for _ in range(min(concurrency, len(candidates)) or 1)))
+            await reports.put(None)
+
+        # Si l'un des deux étages échoue, l'autre est annulé (les générateurs ne restent pas bloqués sur la file pleine).
+        stages = [asyncio.create_task(generate_all()), asyncio.create_task(send_reports())]
+        try:
+            await asyncio.gather(*stages)
+        finally:
+            for stage in stages:
+                stage.cancel()
+            if processed:
+                await pipeline.save_checkpoint(done=dict(processed))
+        # Une semaine avec des échecs de génération reste ouverte : la tâche la reprend après RETRY_MINUTES.
+        finished = not stats["generation_failed"]
+        if finished:
+            await pipeline.save_checkpoint(finished=True)
+        print(f"Coaching hebdomadaire {'terminé' if finished else 'interrompu'} : {stats['sent']} envoyés, "
+              f"{stats['dm_failed']} MPs refusés, {stats['generation_failed']} échecs de génération.")
+        return finished
 
     @tasks.loop(hours=168) # 7 days * 24 hours
     async def weekly_leaderboard_task(self):
@@ -1032,26 +1460,79 @@ class ManagerCog(commands.Cog):
         if not guild_id_str or guild_id_str == "VOTRE_VRAI_ID_DE_SERVEUR_ICI": return
         guild = self.bot.get_guild(int(guild_id_str))
         if not guild: return
-        
+
+        reset_config = self.config.get("WEEKLY_RESET_CONFIG", {})
+        pipeline = BatchWritePipeline(
+            self.db, "weekly_reset", datetime.now(timezone.utc).strftime("%G-W%V"),
+            concurrency=reset_config.get("CONCURRENCY", 4), batch_size=reset_config.get("BATCH_SIZE", FIRESTORE_BATCH_LIMIT)
+        )
+        checkpoint = await pipeline.load_checkpoint()
+        if checkpoint.get("finished"):
+            return print("Classement hebdomadaire déjà traité cette semaine.")
+
+        # Les deltas d'XP en attente appartiennent à la semaine qui se termine ; jusqu'à la bascule de
+        # l'époque, les nouveaux gains sont écrits directement (transaction) au lieu d'être mis en tampon.
+        self._epoch_rollover = True
+        try:
+            if not await self.flush_xp_buffer():
+                retry_minutes = reset_config.get("RETRY_MINUTES", 10)
+                self.weekly_leaderboard_task.change_interval(minutes=retry_minutes)
+                return print(f"Classement hebdomadaire reporté de {retry_minutes} min : le tampon d'XP n'a pas pu être écrit.")
+            await self._rollover_weekly_epoch(guild, pipeline, checkpoint)
+        finally:
+            self._epoch_rollover = False
+        # Gains éventuellement mis en tampon par un chemin concurrent pendant la bascule.
+        await self.flush_xp_buffer()
+        self.weekly_leaderboard_task.change_interval(hours=168)
+        print("Tâche de classement hebdomadaire terminée.")
+
+    async def _rollover_weekly_epoch(self, guild: discord.Guild, pipeline: BatchWritePipeline, checkpoint: Dict[str, Any]):
+        """Annonce les classements, passe à l'époque suivante et écrit les bonus de guilde (reprise via `checkpoint`)."""
+        if checkpoint:
+            print("Reprise de la réinitialisation hebdomadaire interrompue.")
+            bonus_by_member = checkpoint.get("bonus_by_member", {})
+            next_epoch = checkpoint.get("epoch", self.weekly_epoch + 1)
+        else:
+            bonus_by_member = await self._announce_weekly_leaderboards(guild)
+            next_epoch = self.weekly_epoch + 1
+            await pipeline.save_checkpoint(bonus_by_member=bonus_by_member, epoch=next_epoch)
+
+        # La remise à zéro est une seule écriture : les compteurs (utilisateurs et guildes) d'une
+        # époque précédente sont lus comme nuls et basculés paresseusement à la prochaine écriture.
+        await self.db.collection('system').document('weekly_epoch').set({"epoch": next_epoch})
+        self.weekly_epoch = next_epoch
+        self._current_epoch_guilds.clear()
+        # Les documents lus désormais comme étant d'une époque précédente repassent par une transaction.
+        self._epoch_rollover = False
+        self.bot.dispatch("weekly_epoch_changed", next_epoch)
+
+        # Seuls les membres des guildes récompensées sont écrits ; les anciens bonus expirent avec leur époque.
+        users = self.db.collection('users')
+        await pipeline.write('guild_bonus', [
+            (users.document(member_id), {"guild_bonus": {**bonus, "epoch": next_epoch}})
+            for member_id, bonus in bonus_by_member.items()
+        ])
+        for member_id in bonus_by_member:
+            self.invalidate_user(member_id)
+        await pipeline.save_checkpoint(finished=True)
+
+    async def _announce_weekly_leaderboards(self, guild: discord.Guild) -> Dict[str, Dict[str, Any]]:
+        """Attribue les rôles du top 3, publie les classements et retourne les bonus de guilde par membre."""
         roles_config = self.config.get("ROLES", {})
         top_roles_names = [roles_config.get(k) for k in ["LEADERBOARD_TOP_1_XP", "LEADERBOARD_TOP_2_XP", "LEADERBOARD_TOP_3_XP"] if roles_config.get(k)]
         for role_name in top_roles_names:
-            role = discord.utils.get(guild.roles, name=role_name)
+            role = self.resources.role(guild, role_name)
             if role:
                 for member in role.members:
                     try:
                         await member.remove_roles(role, reason="Réinitialisation classement hebdo")
                     except discord.HTTPException: pass
-        
-        all_users_stream = self.db.collection('users').stream()
-        async for user_doc in all_users_stream:
-            await user_doc.reference.update({"guild_bonus": {}})
-        
-        users_top_query = self.db.collection('users').where('weekly_xp', '>', 0).order_by('weekly_xp', direction=firestore.Query.DESCENDING).limit(3)
+
+        users_top_query = self.weekly_query('users', 'weekly_xp').limit(3)
         top_users_docs = [doc async for doc in users_top_query.stream()]
 
         user_lb_channel_name = self.config.get("CHANNELS", {}).get("WEEKLY_LEADERBOARD_ANNOUNCEMENTS")
-        user_lb_channel = discord.utils.get(guild.text_channels, name=user_lb_channel_name) if user_lb_channel_name else None
+        user_lb_channel = self.resources.channel(guild, user_lb_channel_name) if user_lb_channel_name else None
         
         if user_lb_channel:
             embed = discord.Embed(title="🏆 Classement Hebdomadaire des Membres (XP) 🏆", color=discord.Color.gold())
@@ -1060,19 +1541,20 @@ class ManagerCog(commands.Cog):
                 rank, member = i + 1, guild.get_member(int(doc.id))
                 if member:
                     role_name = roles_config.get(f"LEADERBOARD_TOP_{rank}_XP")
-                    if role_name and (role_to_add := discord.utils.get(guild.roles, name=role_name)):
+                    if role_name and (role_to_add := self.resources.role(guild, role_name)):
                         await member.add_roles(role_to_add)
                     description += f"{ {1: '🥇', 2: '🥈', 3: '🥉'}.get(rank, f'**#{rank}**')} **{member.display_name}** - `{doc.to_dict().get('weekly_xp', 0)}` XP\n"
             embed.description = description or "Personne n'a gagné d'XP cette semaine."
             await user_lb_channel.send(embed=embed)
 
-        guilds_top_query = self.db.collection('guilds').where('weekly_xp', '>', 0).order_by('weekly_xp', direction=firestore.Query.DESCENDING).limit(3)
+        guilds_top_query = self.weekly_query('guilds', 'weekly_xp').limit(3)
         top_guilds_docs = [doc async for doc in guilds_top_query.stream()]
         
         guild_rewards_config = self.config.get("GUILD_SYSTEM", {}).get("WEEKLY_REWARDS", {})
         guild_lb_channel_name = self.config.get("CHANNELS", {}).get("GUILD_LEADERBOARD")
-        guild_lb_channel = discord.utils.get(guild.text_channels, name=guild_lb_channel_name) if guild_lb_channel_name else None
+        guild_lb_channel = self.resources.channel(guild, guild_lb_channel_name) if guild_lb_channel_name else None
 
+        bonus_by_member: Dict[str, Dict[str, Any]] = {}
         if guild_lb_channel:
             embed = discord.Embed(title="🛡️ Classement Hebdomadaire des Guildes 🛡️", color=discord.Color.blurple())
             description = ""
@@ -1083,25 +1565,17 @@ class ManagerCog(commands.Cog):
                 if (reward_key := f"TOP_{rank}") in guild_rewards_config:
                     bonus_data = {**guild_rewards_config[reward_key], "type": f'top{rank}'}
                     for member_id_str in guild_data.get('members', []):
-                        await self.db.collection('users').document(member_id_str).update({"guild_bonus": bonus_data})
+                        bonus_by_member[member_id_str] = bonus_data
             embed.description = description or "Aucune guilde n'a gagné d'XP cette semaine."
             embed.set_footer(text="Les bonus de commission sont actifs pour la semaine à venir !")
             await guild_lb_channel.send(embed=embed)
-        
-        all_users_reset_stream = self.db.collection('users').stream()
-        async for user_doc in all_users_reset_stream:
-            await user_doc.reference.update({"weekly_xp": 0, "weekly_affiliate_earnings": 0, "affiliate_booster": 0.0})
-            
-        all_guilds_reset_stream = self.db.collection('guilds').stream()
-        async for guild_doc in all_guilds_reset_stream:
-            await guild_doc.reference.update({"weekly_xp": 0})
-            
-        print("Tâche de classement hebdomadaire terminée.")
+        return bonus_by_member
 
     @weekly_leaderboard_task.before_loop
     @mission_assignment_task.before_loop
     @check_vip_status_task.before_loop
     @weekly_coaching_report_task.before_loop
+    @ledger_compaction_task.before_loop
     async def before_weekly_task(self):
         await self.bot.wait_until_ready()
     
@@ -0,0 +1,95 @@
+
+import asyncio
+from collections import Counter
+from typing import Dict, Any, Optional, List, Tuple, Callable, Awaitable
+
+VALID_ACTIONS = ("PASS", "DELETE_AND_WARN", "WARN", "NOTIFY_STAFF", "CREATE_SUPPORT_TICKET")
+
+# Un élément à modérer : {"id": ..., "channel": ..., "content": ...}
+BatchQuery = Callable[[List[Dict[str, str]]], Awaitable[Optional[Dict[str, Any]]]]
+SingleQuery = Callable[[Dict[str, str]], Awaitable[Optional[Dict[str, Any]]]]
+
+
+def valid_verdict(verdict: Any) -> bool:
+    return isinstance(verdict, dict) and verdict.get("action") in VALID_ACTIONS
+
+
+class ModerationBatcher:
+    """
+    Regroupe les messages à modérer pendant `window_seconds` (ou jusqu'à `max_batch` messages)
+    et les envoie au modèle en une seule requête. La réponse doit contenir un verdict par identifiant
+    de message ; les verdicts absents ou invalides, ou un lot en erreur, sont repris en requêtes
+    individuelles. Chaque appelant attend au plus `max_latency` secondes, puis reçoit None.
+    """
+    def __init__(self, query_batch: BatchQuery, query_single: SingleQuery,
+                 window_seconds: float = 0.25, max_batch: int = 10, max_latency: float = 4.0):
+        self.query_batch = query_batch
+        self.query_single = query_single
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._pending: List[Tuple[Dict[str, str], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+        self.counters: Counter = Counter()
+
+    async def submit(self, item: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """Met le message en file et attend son verdict (None si le plafond de latence est dépassé)."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self._flush)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.max_latency)
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            return None
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Dict[str, str], asyncio.Future]]):
+        verdicts: Dict[str, Any] = {}
+        if len(batch) > 1:
+            self.counters["batches"] += 1
+            self.counters["batched_messages"] += len(batch)
+            try:
+                response = await self.query_batch([item for item, _ in batch])
+                verdicts = response if isinstance(response, dict) else {}
+            except Exception as e:
+                print(f"Erreur de modération par lot (repli sur des requêtes individuelles): {e}")
+
+        retries = []
+        for item, future in batch:
+            verdict = verdicts.get(item["id"])
+            if valid_verdict(verdict):
+                self._resolve(future, verdict)
+            else:
+                retries.append((item, future))
+        if len(batch) > 1 and retries:
+            self.counters["fallbacks"] += len(retries)
+        await asyncio.gather(*(self._run_single(item, future) for item, future in retries))
+
+    async def _run_single(self, item: Dict[str, str], future: asyncio.Future):
+        self.counters["single_requests"] += 1
+        try:
+            verdict = await self.query_single(item)
+        except Exception as e:
+            print(f"Erreur de modération individuelle: {e}")
+            verdict = None
+        self._resolve(future, verdict)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, verdict: Optional[Dict[str, Any]]):
+        if not future.done():
+            future.set_result(verdict)
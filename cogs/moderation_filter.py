@@ -0,0 +1,174 @@
+
+import hashlib
+import math
+import re
+import time
+import unicodedata
+from collections import Counter
+from typing import Dict, Any, Optional, Tuple, List
+
+# Niveaux de décision du pré-filtre : PASS local, sanction locale, ou renvoi vers Gemini.
+TIER_PASS = "local_pass"
+TIER_ACTION = "local_action"
+TIER_AI = "ai"
+
+INVITE_PATTERN = re.compile(r"(?:discord(?:app)?\.com/invite|discord\.gg|dsc\.gg)/[\w-]+", re.IGNORECASE)
+URL_PATTERN = re.compile(r"(?:https?://|www\.)([^\s/<>]+)", re.IGNORECASE)
+LINK_PATTERN = re.compile(r"(?:https?://|www\.)[^\s<>]+", re.IGNORECASE)
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]{2,}")
+PHONE_PATTERN = re.compile(r"(?<!\d)(?:\+33\s?|0)[1-9](?:[\s.-]?\d{2}){4}(?!\d)")
+
+REASON_INVITE = "Publicité non autorisée dans ce salon. Veuillez utiliser les salons dédiés."
+REASON_PERSONAL_INFO = "Le partage d'informations personnelles est interdit pour votre sécurité."
+REASON_BLOCKED_TERM = "Contenu interdit (arnaque ou spam connu)."
+REASON_DEGRADED_SUSPECT = "Terme suspect (modération IA indisponible, vérification manuelle requise)."
+REASON_DEGRADED_LINK = "Lien inconnu (modération IA indisponible, vérification manuelle requise)."
+
+
+def normalize_text(text: str) -> str:
+    """Minuscules sans accents ni caractères de largeur nulle, pour comparer aux listes de termes."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char) and unicodedata.category(char) != "Cf")
+
+
+def compile_terms(terms: List[str]) -> Optional[re.Pattern]:
+    """Une seule expression compilée pour toute une liste de termes (les plus longs d'abord)."""
+    normalized = sorted({normalize_text(term) for term in terms if term}, key=len, reverse=True)
+    if not normalized:
+        return None
+    return re.compile(r"(?<!\w)(?:" + "|".join(re.escape(term) for term in normalized) + r")(?!\w)")
+
+
+def canonicalize_links(text: str) -> str:
+    """Réduit chaque lien à `hôte/chemin` (sans schéma, www, paramètres ni ancre) pour que les variantes d'un même lien coïncident."""
+    def canonical(match: re.Match) -> str:
+        url = re.sub(r"^(?:https?://)?(?:www\.)?", "", match.group(0), flags=re.IGNORECASE)
+        host, _, path = url.partition("/")
+        path = re.split(r"[?#]", path, maxsplit=1)[0].rstrip("/")
+        return host.lower() + ("/" + path if path else "")
+    return LINK_PATTERN.sub(canonical, text)
+
+
+def verdict_cache_key(content: str, channel_class: str) -> str:
+    """Empreinte du contenu normalisé (casse, espaces, caractères invisibles, liens) et de la classe du salon."""
+    normalized = " ".join(normalize_text(canonicalize_links(content)).split())
+    digest = hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+    return f"{channel_class}:{digest}"
+
+
+def shannon_entropy(text: str) -> float:
+    """Entropie en bits par caractère."""
+    if not text:
+        return 0.0
+    length = len(text)
+    return -sum(count / length * math.log2(count / length) for count in Counter(text).values())
+
+
+class ModerationPrefilter:
+    """
+    Premier passage local devant la modération Gemini. Les messages clairement sains sont laissés
+    passer, les infractions évidentes (invitations, coordonnées, termes bloqués) sont sanctionnées
+    localement, et seuls les cas ambigus (liens inconnus, termes suspects, texte anormal, membre à
+    risque) sont transmis au modèle. Les compteurs par niveau sont dans `counters`.
+    """
+    def __init__(self, config: Dict[str, Any]):
+        # user_id -> (risque, horodatage de la dernière mise à jour)
+        self._risk: Dict[str, Tuple[float, float]] = {}
+        self.counters: Counter = Counter()
+        self.configure(config)
+
+    def configure(self, config: Dict[str, Any]):
+        """(Re)compile les règles depuis MODERATION_CONFIG.PREFILTER, en conservant scores et compteurs."""
+        prefilter = config.get("MODERATION_CONFIG", {}).get("PREFILTER", {})
+        self.enabled = prefilter.get("ENABLED", True)
+        self.blocked_terms = compile_terms(prefilter.get("BLOCKED_TERMS", []))
+        self.suspect_terms = compile_terms(prefilter.get("SUSPECT_TERMS", []))
+        self.allowed_domains = tuple(domain.lower() for domain in prefilter.get("ALLOWED_DOMAINS", []))
+        self.max_clean_length = prefilter.get("MAX_CLEAN_LENGTH", 300)
+        self.max_entropy = prefilter.get("MAX_ENTROPY_BITS", 4.6)
+        self.entropy_min_length = prefilter.get("ENTROPY_MIN_LENGTH", 40)
+        self.risk_threshold = prefilter.get("RISK_THRESHOLD", 1.0)
+        self.risk_half_life = prefilter.get("RISK_HALF_LIFE_HOURS", 24) * 3600
+        self.new_member_risk = prefilter.get("NEW_MEMBER_RISK", 0.5)
+        self.new_member_seconds = prefilter.get("NEW_MEMBER_HOURS", 24) * 3600
+
+    def risk(self, user_id: str, now: Optional[float] = None) -> float:
+        """Score de risque du membre, décroissant de moitié tous les RISK_HALF_LIFE_HOURS."""
+        entry = self._risk.get(user_id)
+        if not entry:
+            return 0.0
+        score, updated_at = entry
+        return score * 0.5 ** (((now or time.time()) - updated_at) / self.risk_half_life)
+
+    def record_action(self, user_id: str, weight: float = 1.0, now: Optional[float] = None):
+        """À appeler après chaque sanction (locale ou IA) : le membre est ensuite davantage contrôlé."""
+        now = now or time.time()
+        self._risk[user_id] = (self.risk(user_id, now) + weight, now)
+        if len(self._risk) > 10000:
+            # Les scores devenus négligeables sont oubliés.
+            self._risk = {uid: entry for uid, entry in self._risk.items() if self.risk(uid, now) > 0.05}
+
+    def _unknown_link(self, content: str) -> bool:
+        for match in URL_PATTERN.finditer(content):
+            host = match.group(1).lower().split(":")[0]
+            if not any(host == domain or host.endswith("." + domain) for domain in self.allowed_domains):
+                return True
+        return False
+
+    def classify(self, content: str, user_id: str, member_age_seconds: Optional[float] = None) -> Tuple[str, Optional[Dict[str, str]]]:
+        """
+        Retourne (niveau, verdict). Le verdict a la forme de celui de Gemini ({"action", "reason"}) ;
+        il vaut None quand le message doit être transmis au modèle.
+        """
+        tier, verdict = self._classify(content, user_id, member_age_seconds)
+        self.counters[tier] += 1
+        return tier, verdict
+
+    def _classify(self, content: str, user_id: str, member_age_seconds: Optional[float]) -> Tuple[str, Optional[Dict[str, str]]]:
+        if not self.enabled:
+            return TIER_AI, None
+        if not content.strip():
+            return TIER_PASS, {"action": "PASS", "reason": "Message sans texte."}
+
+        if INVITE_PATTERN.search(content):
+            return TIER_ACTION, {"action": "DELETE_AND_WARN", "reason": REASON_INVITE}
+        if EMAIL_PATTERN.search(content) or PHONE_PATTERN.search(content):
+            return TIER_ACTION, {"action": "DELETE_AND_WARN", "reason": REASON_PERSONAL_INFO}
+
+        normalized = normalize_text(content)
+        if self.blocked_terms and self.blocked_terms.search(normalized):
+            return TIER_ACTION, {"action": "DELETE_AND_WARN", "reason": REASON_BLOCKED_TERM}
+
+        risk = self.risk(user_id)
+        if member_age_seconds is not None and member_age_seconds < self.new_member_seconds:
+            risk += self.new_member_risk
+        ambiguous = (
+            risk >= self.risk_threshold
+            or len(content) > self.max_clean_length
+            or (self.suspect_terms is not None and self.suspect_terms.search(normalized) is not None)
+            or self._unknown_link(content)
+            or (len(content) >= self.entropy_min_length and shannon_entropy(normalized) > self.max_entropy)
+        )
+        if ambiguous:
+            return TIER_AI, None
+        return TIER_PASS, {"action": "PASS", "reason": "Pré-filtre local."}
+
+    def degraded_verdict(self, content: str) -> Dict[str, str]:
+        """
+        Verdict local d'un message ambigu quand Gemini est indisponible : aucune sanction automatique sur un
+        simple doute, les termes suspects et liens inconnus sont signalés au staff et le reste passe.
+        """
+        normalized = normalize_text(content)
+        if self.suspect_terms is not None and self.suspect_terms.search(normalized):
+            return {"action": "NOTIFY_STAFF", "reason": REASON_DEGRADED_SUSPECT}
+        if self._unknown_link(content):
+            return {"action": "NOTIFY_STAFF", "reason": REASON_DEGRADED_LINK}
+        return {"action": "PASS", "reason": "Mode dégradé : aucun motif local."}
+
+    def stats(self) -> Dict[str, Any]:
+        total = sum(self.counters.values())
+        return {
+            **{tier: self.counters[tier] for tier in (TIER_PASS, TIER_ACTION, TIER_AI)},
+            "total": total,
+            "local_rate": (self.counters[TIER_PASS] + self.counters[TIER_ACTION]) / total if total else 0.0,
+        }
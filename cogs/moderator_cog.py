@@ -3,7 +3,7 @@ from discord.ext import commands
 from discord import app_commands
 import json, os, re, uuid, asyncio
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 from google.cloud import firestore
 from google.cloud.firestore_v1 import transaction
 
@@ -16,18 +16,30 @@ except ImportError:
 
 # FIX: On importe la vue depuis son propre fichier pour éviter les dépendances
 from .catalogue_cog import PurchasePromoView
+from .moderation_filter import ModerationPrefilter, verdict_cache_key
+from .moderation_batch import ModerationBatcher, valid_verdict
+from .user_store import TTLCache
+from .ai_gateway import PRIORITY_MODERATION
 
 class ModeratorCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.manager: Optional['ManagerCog'] = None
         self.model: Optional[genai.GenerativeModel] = None
+        self.prefilter = ModerationPrefilter({})
+        self.batcher = ModerationBatcher(self.query_moderation_batch, self.query_moderation_single)
+        # Verdicts par empreinte de contenu (spam recopié, raids) et requêtes en cours pour un même contenu.
+        self.verdict_cache = TTLCache(max_size=5000, ttl_seconds=600)
+        self._inflight_verdicts: Dict[str, asyncio.Future] = {}
+        self.coalesced_verdicts = 0
+        self.degraded_verdicts = 0
 
     async def cog_load(self):
         await asyncio.sleep(1) 
         self.manager = self.bot.get_cog('ManagerCog')
         if not self.manager:
             return print(f"❌ ERREUR CRITIQUE: {self.__class__.__name__} n'a pas pu trouver le ManagerCog.")
+        self.configure_moderation()
         
         if AI_AVAILABLE and self.manager.model:
             self.model = self.manager.model
@@ -35,7 +47,79 @@ class ModeratorCog(commands.Cog):
         else:
             print(f"⚠️ ATTENTION: {self.__class__.__name__} n'a pas pu charger le modèle AI.")
 
+    def configure_moderation(self):
+        mod_config = self.manager.config.get("MODERATION_CONFIG", {})
+        batch_config = mod_config.get("BATCH", {})
+        self.prefilter.configure(self.manager.config)
+        self.batcher.window_seconds = batch_config.get("WINDOW_MS", 250) / 1000
+        self.batcher.max_batch = batch_config.get("MAX_MESSAGES", 10)
+        self.batcher.max_latency = batch_config.get("MAX_LATENCY_SECONDS", 4)
+        cache_config = mod_config.get("VERDICT_CACHE", {})
+        self.verdict_cache.max_size = cache_config.get("MAX_SIZE", 5000)
+        self.verdict_cache.ttl_seconds = cache_config.get("TTL_SECONDS", 600)
+
+    @commands.Cog.listener()
+    async def on_static_data_reloaded(self):
+        if self.manager:
+            self.configure_moderation()
+            # Les verdicts en cache ont été rendus avec l'ancien prompt.
+            self.verdict_cache.clear()
+
+    def channel_class(self, channel_name: str) -> str:
+        """Les règles de modération ne distinguent que la marketplace des autres salons (hors salons de promo)."""
+        return "marketplace" if channel_name == self.manager.config.get("CHANNELS", {}).get("MARKETPLACE") else "general"
+
+    def degraded_verdict(self, message: discord.Message) -> Dict[str, str]:
+        """Verdict des règles locales, utilisé sans attendre quand le disjoncteur Gemini est ouvert (jamais mis en cache)."""
+        self.degraded_verdicts += 1
+        return self.prefilter.degraded_verdict(message.content)
+
+    async def moderate_remote(self, message: discord.Message) -> Optional[Dict[str, Any]]:
+        """
+        Verdict IA d'un message ambigu : depuis le cache, une requête en cours pour le même contenu, ou Gemini.
+        Disjoncteur ouvert, le verdict vient des règles locales.
+        """
+        mod_config = self.manager.config.get("MODERATION_CONFIG", {})
+        use_cache = mod_config.get("VERDICT_CACHE", {}).get("ENABLED", True)
+        key = verdict_cache_key(message.content, self.channel_class(message.channel.name))
+        if use_cache:
+            cached = self.verdict_cache.get(key)
+            if cached is not None:
+                return cached
+        if self.manager.ai.breaker.rejecting:
+            return self.degraded_verdict(message)
+        if use_cache:
+            pending = self._inflight_verdicts.get(key)
+            if pending is not None:
+                self.coalesced_verdicts += 1
+                result = await asyncio.shield(pending)
+                return result if result is not None or not self.manager.ai.breaker.rejecting else self.degraded_verdict(message)
+
+        future = asyncio.get_running_loop().create_future()
+        if use_cache:
+            self._inflight_verdicts[key] = future
+        result = None
+        try:
+            if mod_config.get("BATCH", {}).get("ENABLED", True):
+                result = await self.batcher.submit({"id": str(message.id), "channel": message.channel.name, "content": message.content})
+            else:
+                result = await self.query_gemini_moderation(message)
+            if use_cache and valid_verdict(result):
+                self.verdict_cache.put(key, result)
+        finally:
+            self._inflight_verdicts.pop(key, None)
+            future.set_result(result)
+        if result is None and self.manager.ai.breaker.rejecting:
+            # Le disjoncteur s'est ouvert pendant l'attente du lot ou de l'appel.
+            return self.degraded_verdict(message)
+        return result
+
     async def query_gemini_moderation(self, message: discord.Message) -> Optional[Dict[str, Any]]:
+        return await self.query_moderation_single(
+            {"id": str(message.id), "channel": message.channel.name, "content": message.content}
+        )
+
+    async def query_moderation_single(self, item: Dict[str, str]) -> Optional[Dict[str, Any]]:
         if not self.model or not self.manager: return None
         
         mod_config = self.manager.config.get("MODERATION_CONFIG", {})
@@ -44,23 +128,34 @@ class ModeratorCog(commands.Cog):
              print("ATTENTION: Le prompt de modération IA est manquant dans config.json")
              return {"action": "PASS", "reason": "Configuration IA manquante."}
              
-        prompt = prompt_template.format(
-            user_message=message.content,
-            channel_name=message.channel.name
-        )
+        # replace() plutôt que format() : le prompt contient un exemple JSON avec des accolades.
+        prompt = prompt_template.replace("{user_message}", item["content"]).replace("{channel_name}", item["channel"])
 
         try:
             generation_config = GenerationConfig(
                 response_mime_type="application/json"
             )
-            response = await self.model.generate_content_async(
-                contents=prompt,
-                generation_config=generation_config
-            )
+            response = await self.manager.ai.generate(PRIORITY_MODERATION, prompt, generation_config=generation_config)
             return await self.manager._parse_gemini_json_response(response.text)
         except Exception as e:
             print(f"Erreur Gemini (Modération): {e}")
-            return {"action": "PASS", "reason": f"Erreur d'analyse IA."}
+            # Aucun verdict (équivaut à PASS) : rien n'est mis en cache.
+            return None
+
+    async def query_moderation_batch(self, items: List[Dict[str, str]]) -> Optional[Dict[str, Any]]:
+        """Un seul appel pour plusieurs messages. Retourne {id du message: verdict}, ou None si la réponse est inexploitable."""
+        if not self.model or not self.manager: return None
+
+        prompt_template = self.manager.config.get("MODERATION_CONFIG", {}).get("AI_BATCH_MODERATION_PROMPT")
+        if not prompt_template:
+            return None
+        prompt = prompt_template.replace("{messages_json}", json.dumps(items, ensure_ascii=False))
+
+        generation_config = GenerationConfig(response_mime_type="application/json")
+        response = await self.manager.ai.generate(PRIORITY_MODERATION, prompt, generation_config=generation_config)
+        parsed = await self.manager._parse_gemini_json_response(response.text)
+        verdicts = parsed.get("verdicts") if isinstance(parsed, dict) else None
+        return verdicts if isinstance(verdicts, dict) else None
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
@@ -85,13 +180,19 @@ class ModeratorCog(commands.Cog):
         if any(role_name in author_roles for role_name in staff_role_names):
             return
 
-        result = await self.query_gemini_moderation(message)
+        # Seuls les messages que le pré-filtre local ne sait pas trancher sont envoyés à Gemini.
+        joined_at = getattr(message.author, "joined_at", None)
+        member_age = (discord.utils.utcnow() - joined_at).total_seconds() if joined_at else None
+        tier, result = self.prefilter.classify(message.content, str(message.author.id), member_age)
+        if result is None:
+            result = await self.moderate_remote(message)
         if not result: return
         
         action = result.get("action", "PASS")
         reason = result.get("reason", "Aucune raison spécifiée.")
 
         if action == "PASS": return
+        self.prefilter.record_action(str(message.author.id))
         
         action_handlers = {
             "DELETE_AND_WARN": self.handle_delete_and_warn,
@@ -141,7 +242,7 @@ class ModeratorCog(commands.Cog):
         if not self.manager: return
         channel_name = self.manager.config.get("CHANNELS", {}).get("MOD_ALERTS")
         if not channel_name: return
-        mod_channel = discord.utils.get(guild.text_channels, name=channel_name)
+        mod_channel = self.manager.resources.channel(guild, channel_name)
         if mod_channel:
             embed = discord.Embed(title=f"🚨 {title}", description=description, color=discord.Color.orange())
             await mod_channel.send(embed=embed)
@@ -150,19 +251,8 @@ class ModeratorCog(commands.Cog):
         if not self.manager or not self.manager.db: return
         user_ref = self.manager.db.collection('users').document(str(member.id))
         
-        @async_transactional
-        async def increment_warning(transaction, ref):
-            user_doc = await ref.get(transaction=transaction)
-            if not user_doc.exists:
-                await self.manager.get_or_create_user_data(ref)
-                user_doc = await ref.get(transaction=transaction)
-
-            user_data = user_doc.to_dict()
-            new_warning_count = user_data.get('warnings', 0) + 1
-            transaction.update(ref, {'warnings': new_warning_count})
-            return new_warning_count
-
-        warning_count = await increment_warning(self.manager.db.transaction(), user_ref)
+        states = await self.manager.mutation().add(user_ref.id, "warnings", 1, f"Avertissement : {reason}").commit()
+        warning_count = states[user_ref.id].get("warnings", 0)
         
         threshold = self.manager.config.get("MODERATION_CONFIG", {}).get("WARNING_THRESHOLD", 3)
 
@@ -179,6 +269,7 @@ class ModeratorCog(commands.Cog):
                 await member.timeout(timedelta(days=1), reason=f"Seuil d'avertissement ({threshold}) atteint.")
                 await self.notify_staff(member.guild, f"Seuil d'avertissement atteint pour {member.mention}", "L'utilisateur a été mis en silencieux pour 24h.")
                 await user_ref.update({'warnings': 0})
+                self.manager.invalidate_user(user_ref.id)
             except discord.Forbidden:
                 # FIX: Corrected indentation on the following line
                 await self.notify_staff(member.guild, f"ERREUR: Tentative de Mute sur {member.mention} a échoué (permissions).", "Seuil d'avertissement atteint.")
@@ -224,7 +315,7 @@ class ModeratorCog(commands.Cog):
         
         # 4. Send to promo channel
         promo_channel_name = self.manager.config["CHANNELS"].get("PROMO_FLASH")
-        promo_channel = discord.utils.get(interaction.guild.text_channels, name=promo_channel_name)
+        promo_channel = self.manager.resources.channel(interaction.guild, promo_channel_name)
 
         if not promo_channel:
             return await interaction.followup.send(f"Le canal de promotion `{promo_channel_name}` est introuvable.", ephemeral=True)
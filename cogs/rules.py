@@ -0,0 +1,206 @@
+
+import bisect
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Any, List, Tuple, Sequence, Optional
+
+# --- Dépendances Optionnelles ---
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Au-delà, les seuils ne sont plus atteignables en pratique.
+MAX_LEVEL = 1000
+MAX_THRESHOLD_XP = 10 ** 15
+# Date d'expiration par défaut (déjà passée) des VIP et boosters sans `expires_at`.
+EPOCH_ISO = "1970-01-01T00:00:00+00:00"
+
+
+class LevelTable:
+    """
+    Seuils d'XP précalculés à partir de LEVEL_UP_FORMULA_BASE_XP / LEVEL_UP_FORMULA_MULTIPLIER.
+    `thresholds[i]` est l'XP nécessaire pour quitter le niveau i + 1, soit int(base_xp * multiplier ** (i + 1)).
+    """
+    def __init__(self, base_xp: float, multiplier: float):
+        self.base_xp = base_xp
+        self.multiplier = multiplier
+        thresholds: List[int] = []
+        for level in range(1, MAX_LEVEL):
+            threshold = int(base_xp * multiplier ** level)
+            if threshold > MAX_THRESHOLD_XP:
+                break
+            # Garantit une table croissante même avec un multiplicateur <= 1.
+            thresholds.append(max(threshold, thresholds[-1] if thresholds else threshold))
+        self.thresholds: Tuple[int, ...] = tuple(thresholds)
+        self._array = np.asarray(self.thresholds, dtype=np.int64) if NUMPY_AVAILABLE else None
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'LevelTable':
+        xp_config = config.get("GAMIFICATION_CONFIG", {}).get("XP_SYSTEM", {})
+        return cls(xp_config.get("LEVEL_UP_FORMULA_BASE_XP", 150), xp_config.get("LEVEL_UP_FORMULA_MULTIPLIER", 1.6))
+
+    def level_for(self, xp: float) -> int:
+        """Niveau correspondant à un total d'XP (O(log n))."""
+        return 1 + bisect.bisect_right(self.thresholds, xp)
+
+    def xp_for_next_level(self, level: int) -> int:
+        """XP totale nécessaire pour passer au niveau suivant."""
+        return self.thresholds[level - 1] if 1 <= level <= len(self.thresholds) else MAX_THRESHOLD_XP
+
+    def changed_levels(self, xp_values: Sequence[float], current_levels: Sequence[int]) -> List[Tuple[int, int]]:
+        """Recalcule des niveaux en masse. Retourne (indice, nouveau niveau) pour ceux qui changent."""
+        if NUMPY_AVAILABLE:
+            new_levels = np.searchsorted(self._array, np.asarray(xp_values, dtype=np.float64), side='right') + 1
+            changed = np.nonzero(new_levels != np.asarray(current_levels, dtype=np.int64))[0]
+            return [(int(i), int(new_levels[i])) for i in changed]
+        changes = []
+        for i, (xp, level) in enumerate(zip(xp_values, current_levels)):
+            new_level = self.level_for(xp)
+            if new_level != level:
+                changes.append((i, new_level))
+        return changes
+
+
+@lru_cache(maxsize=8192)
+def expiry_timestamp(iso_timestamp: str) -> float:
+    """Horodatage POSIX d'une date ISO (mis en cache : les mêmes dates d'expiration sont relues à chaque message)."""
+    return datetime.fromisoformat(iso_timestamp).timestamp()
+
+
+class TierTable:
+    """Paliers triés une fois (seuil -> valeur) : valeur du plus haut palier atteint, par bisect."""
+    __slots__ = ("thresholds", "values", "default")
+
+    def __init__(self, tiers: List[Dict[str, Any]], key_field: str, value_field: str, default: float = 0.0):
+        ordered = sorted(tiers, key=lambda tier: tier.get(key_field, 0))
+        self.thresholds: Tuple[float, ...] = tuple(tier.get(key_field, 0) for tier in ordered)
+        self.values: Tuple[float, ...] = tuple(tier.get(value_field, 0) for tier in ordered)
+        self.default = default
+
+    def lookup(self, key: float) -> float:
+        index = bisect.bisect_right(self.thresholds, key) - 1
+        return self.values[index] if index >= 0 else self.default
+
+
+class CompiledRules:
+    """
+    Règles de GAMIFICATION_CONFIG, VIP_SYSTEM et GUILD_SYSTEM compilées au chargement de la config :
+    paliers pré-triés et constantes extraites, pour résoudre les multiplicateurs d'un état utilisateur
+    sans reparcourir la configuration.
+    """
+    __slots__ = (
+        "commission_tiers", "vip_commission_tiers", "vip_xp_tiers", "loyalty_rate",
+        "top1_commission_rate", "cashout_base_rate", "cashout_vip_rate"
+    )
+
+    def __init__(self, config: Dict[str, Any]):
+        gamification = config.get("GAMIFICATION_CONFIG", {})
+        affiliate = gamification.get("AFFILIATE_SYSTEM", {})
+        premium = gamification.get("VIP_SYSTEM", {}).get("PREMIUM", {})
+        rewards = config.get("GUILD_SYSTEM", {}).get("WEEKLY_REWARDS", {})
+        cashout = affiliate.get("CASHOUT_COMMISSION", {})
+
+        self.commission_tiers = TierTable(affiliate.get("COMMISSION_TIERS", []), "level", "rate")
+        self.vip_commission_tiers = TierTable(premium.get("COMMISSION_BONUS_TIERS", []), "consecutive_months", "bonus")
+        self.vip_xp_tiers = TierTable(premium.get("XP_BOOST_TIERS", []), "consecutive_months", "boost")
+        self.loyalty_rate = affiliate.get("PERMANENT_LOYALTY_BONUS", {}).get("RATE", 0)
+        self.top1_commission_rate = rewards.get("TOP_1", {}).get("commission_rate", 0.90)
+        self.cashout_base_rate = cashout.get("BASE_RATE", 0.05)
+        self.cashout_vip_rate = cashout.get("VIP_RATE", self.cashout_base_rate)
+
+    @staticmethod
+    def _active_vip(user_data: Dict[str, Any], now_ts: float) -> Optional[Dict[str, Any]]:
+        vip_data = user_data.get("vip_premium")
+        if vip_data and expiry_timestamp(vip_data.get("expires_at", EPOCH_ISO)) > now_ts:
+            return vip_data
+        return None
+
+    def xp_multiplier(self, user_data: Dict[str, Any], now_ts: float) -> float:
+        """Multiplicateur d'XP personnel (VIP + boosters de la boutique), hors événements serveur."""
+        multiplier = 1.0
+        vip_data = self._active_vip(user_data, now_ts)
+        if vip_data:
+            multiplier += self.vip_xp_tiers.lookup(vip_data.get("consecutive_months", 0))
+        for booster_id, booster_data in user_data.get("active_boosters", {}).items():
+            if "xp_booster" in booster_id and expiry_timestamp(booster_data.get("expires_at", EPOCH_ISO)) > now_ts:
+                multiplier += booster_data.get("multiplier", 1.0) - 1.0  # e.g., 1.25 -> 0.25
+        return multiplier
+
+    def commission_rate(self, referrer_data: Dict[str, Any], guild_bonus: Dict[str, Any], affiliate_booster: float, now_ts: float) -> float:
+        """Taux de commission d'affiliation final d'un parrain (plafonné par le bonus de guilde éventuel)."""
+        bonus_type = guild_bonus.get("type")
+        if bonus_type == "top1":
+            return self.top1_commission_rate
+
+        rate = self.commission_tiers.lookup(referrer_data.get("level", 1))
+        vip_data = self._active_vip(referrer_data, now_ts)
+        if vip_data:
+            rate += self.vip_commission_tiers.lookup(vip_data.get("consecutive_months", 0))
+        if referrer_data.get("permanent_affiliate_bonus", False):
+            rate += self.loyalty_rate
+        for booster_id, booster_data in referrer_data.get("active_boosters", {}).items():
+            if "commission_booster" in booster_id and expiry_timestamp(booster_data.get("expires_at", EPOCH_ISO)) > now_ts:
+                rate += booster_data.get("bonus", 0.0)
+        rate += affiliate_booster
+
+        if bonus_type in ("top2", "top3"):
+            rate += guild_bonus.get("commission_boost", 0.0)
+            return min(rate, guild_bonus.get("max_commission_rate", 1.0))
+        return min(rate, 1.0)
+
+    def cashout_commission_rate(self, referrer_data: Dict[str, Any], guild_bonus: Dict[str, Any]) -> float:
+        """Le bonus de guilde prime sur tout le reste, puis le statut VIP."""
+        if guild_bonus.get("type") in ("top1", "top2", "top3"):
+            return guild_bonus.get("cashout_commission_rate", self.cashout_base_rate)
+        if referrer_data.get("vip_premium"):
+            return self.cashout_vip_rate
+        return self.cashout_base_rate
+
+
+class AchievementIndex:
+    """
+    Succès de achievements_config.json indexés par statistique déclencheuse (message_count, purchase_count...),
+    chaque liste triée par seuil. Seuls les succès des statistiques modifiées sont évalués, et seulement
+    au-delà du dernier seuil déjà débloqué par l'utilisateur pour cette statistique.
+    """
+    def __init__(self, achievements: List[Dict[str, Any]]):
+        by_stat: Dict[str, List[Dict[str, Any]]] = {}
+        for achievement in achievements:
+            trigger = achievement.get("trigger") or {}
+            if achievement.get("id") and trigger.get("type"):
+                by_stat.setdefault(trigger["type"], []).append(achievement)
+
+        self.thresholds: Dict[str, Tuple[float, ...]] = {}
+        self.achievements: Dict[str, Tuple[Dict[str, Any], ...]] = {}
+        # id du succès -> (statistique, position dans la liste triée)
+        self.positions: Dict[str, Tuple[str, int]] = {}
+        for stat, items in by_stat.items():
+            items.sort(key=lambda achievement: achievement["trigger"].get("value", 0))
+            self.thresholds[stat] = tuple(achievement["trigger"].get("value", 0) for achievement in items)
+            self.achievements[stat] = tuple(items)
+            for position, achievement in enumerate(items):
+                self.positions[achievement["id"]] = (stat, position)
+
+    def _resume_position(self, stat: str, owned: Sequence[str]) -> int:
+        """Position suivant le plus haut succès déjà débloqué pour `stat`."""
+        start = 0
+        for achievement_id in owned:
+            position = self.positions.get(achievement_id)
+            if position and position[0] == stat and position[1] >= start:
+                start = position[1] + 1
+        return start
+
+    def newly_unlocked(self, user_data: Dict[str, Any], stats: Sequence[str]) -> List[Dict[str, Any]]:
+        """Succès atteints par `user_data` pour les statistiques `stats` et pas encore débloqués."""
+        owned = user_data.get("achievements") or []
+        unlocked = []
+        for stat in stats:
+            thresholds = self.thresholds.get(stat)
+            if not thresholds:
+                continue
+            end = bisect.bisect_right(thresholds, user_data.get(stat, 0))
+            start = self._resume_position(stat, owned)
+            unlocked.extend(achievement for achievement in self.achievements[stat][start:end] if achievement["id"] not in owned)
+        return unlocked
@@ -0,0 +1,94 @@
+
+import json
+import os
+from numbers import Number
+from typing import Dict, Any, List, Iterable, Optional
+
+
+class StaticDataError(ValueError):
+    """Fichier de données statiques illisible ou invalide : le rechargement est abandonné."""
+
+
+def read_json_file(file_path: str, expected_type: type) -> Any:
+    """Lit un fichier JSON et vérifie le type de sa racine (lève StaticDataError)."""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise StaticDataError(f"{file_path}: {e}") from e
+    if not isinstance(data, expected_type):
+        raise StaticDataError(f"{file_path}: la racine doit être de type {expected_type.__name__}.")
+    return data
+
+
+def _is_price(value: Any) -> bool:
+    return isinstance(value, Number) and not isinstance(value, bool)
+
+
+def _check_entries(file_path: str, entries: List[Any], required: Iterable[str]) -> None:
+    """Chaque entrée doit être un objet avec les champs requis et un `id` unique."""
+    seen = set()
+    for position, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise StaticDataError(f"{file_path}: l'entrée n°{position} n'est pas un objet.")
+        missing = [field for field in required if not entry.get(field)]
+        if missing:
+            raise StaticDataError(f"{file_path}: l'entrée n°{position} n'a pas de {', '.join(missing)}.")
+        if entry["id"] in seen:
+            raise StaticDataError(f"{file_path}: l'identifiant '{entry['id']}' est en double.")
+        seen.add(entry["id"])
+
+
+def validate_config(file_path: str, config: Dict[str, Any]) -> None:
+    for section in ("CHANNELS", "ROLES", "GAMIFICATION_CONFIG", "GUILD_SYSTEM"):
+        if section in config and not isinstance(config[section], dict):
+            raise StaticDataError(f"{file_path}: la section {section} doit être un objet.")
+
+
+def validate_products(file_path: str, products: List[Dict[str, Any]]) -> None:
+    _check_entries(file_path, products, ("id", "name"))
+    for product in products:
+        if "price" in product and not _is_price(product["price"]):
+            raise StaticDataError(f"{file_path}: prix invalide pour '{product['id']}'.")
+        for option in product.get("options") or []:
+            if not isinstance(option, dict) or not option.get("name") or not _is_price(option.get("price")):
+                raise StaticDataError(f"{file_path}: option invalide pour '{product['id']}'.")
+
+
+def validate_achievements(file_path: str, achievements: List[Dict[str, Any]]) -> None:
+    _check_entries(file_path, achievements, ("id", "name"))
+    for achievement in achievements:
+        trigger = achievement.get("trigger")
+        if not isinstance(trigger, dict) or not trigger.get("type") or not _is_price(trigger.get("value")):
+            raise StaticDataError(f"{file_path}: déclencheur invalide pour '{achievement['id']}'.")
+
+
+def validate_shop_items(file_path: str, items: List[Dict[str, Any]]) -> None:
+    _check_entries(file_path, items, ("id", "name"))
+    for item in items:
+        if not _is_price(item.get("cost")):
+            raise StaticDataError(f"{file_path}: coût invalide pour '{item['id']}'.")
+
+
+class FileWatcher:
+    """Détecte les fichiers modifiés depuis le dernier `mark()` en comparant leur date de modification."""
+    def __init__(self):
+        self.mtimes: Dict[str, Optional[float]] = {}
+
+    def watch(self, *paths: str) -> None:
+        for path in paths:
+            self.mtimes.setdefault(path, self._mtime(path))
+
+    @staticmethod
+    def _mtime(path: str) -> Optional[float]:
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def changed(self) -> List[str]:
+        return [path for path, mtime in self.mtimes.items() if self._mtime(path) != mtime]
+
+    def mark(self, paths: Optional[Iterable[str]] = None) -> None:
+        for path in (self.mtimes if paths is None else paths):
+            self.mtimes[path] = self._mtime(path)
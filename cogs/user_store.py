@@ -0,0 +1,515 @@
+
+import asyncio
+import copy
+import time
+import zlib
+from collections import defaultdict, OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, List, Tuple, Callable
+
+from google.api_core import exceptions as gcp_exceptions
+from google.cloud import firestore
+from google.cloud.firestore_v1 import transaction
+
+from .rules import AchievementIndex
+
+# Limite imposée par Firestore pour un WriteBatch.
+FIRESTORE_BATCH_LIMIT = 500
+
+# Compteurs hebdomadaires et leur valeur en début de semaine. Ils ne sont valables que si
+# le champ `weekly_epoch` du document correspond à l'époque courante (`system/weekly_epoch`).
+WEEKLY_DEFAULTS: Dict[str, Any] = {"weekly_xp": 0, "weekly_affiliate_earnings": 0.0, "affiliate_booster": 0.0}
+
+
+def weekly_value(data: Optional[Dict[str, Any]], field: str, epoch: int) -> Any:
+    """Valeur d'un compteur hebdomadaire, remise à zéro si le document date d'une époque précédente."""
+    default = WEEKLY_DEFAULTS.get(field, 0)
+    if not data or data.get("weekly_epoch", 0) != epoch:
+        return default
+    return data.get(field, default)
+
+
+def active_guild_bonus(data: Optional[Dict[str, Any]], epoch: int) -> Dict[str, Any]:
+    """Bonus de guilde de la semaine en cours (les bonus d'une époque précédente sont ignorés)."""
+    bonus = (data or {}).get("guild_bonus") or {}
+    return bonus if bonus.get("epoch", 0) == epoch else {}
+
+
+def activity_shard(user_id: str, shards: int) -> int:
+    """Fragment (stable) de `activity_days` qui porte l'activité journalière d'un membre."""
+    return zlib.crc32(user_id.encode("utf-8")) % max(shards, 1)
+
+
+class TTLCache:
+    """
+    Cache LRU à durée de vie limitée.
+    Les entrées sont copiées en lecture pour que les appelants puissent modifier le dict librement.
+    """
+    def __init__(self, max_size: int = 5000, ttl_seconds: float = 120):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: 'OrderedDict[str, Tuple[float, Dict[str, Any]]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(entry[1])
+
+    def put(self, key: str, value: Dict[str, Any]):
+        self._entries[key] = (time.monotonic(), copy.deepcopy(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: str):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries), "max_size": self.max_size,
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+class UserCache(TTLCache):
+    """Cache des documents `users/{id}` partagé par les cogs (voir ManagerCog.get_user_data)."""
+
+
+class XPAccumulator:
+    """
+    Tampon d'écriture différée pour l'XP gagnée via les messages.
+    Les deltas (xp, weekly_xp, message_count...) sont cumulés en mémoire par utilisateur
+    et par guilde, puis écrits en lots avec firestore.Increment lors d'un flush.
+
+    Il porte aussi l'historique d'activité journalier, seule source des classements par période :
+    les agrégats `activity_days/{jour}-{fragment}` (champs `day` et `shard`, puis une map par métrique
+    indexée par utilisateur). Les membres sont répartis sur `day_shards` fragments par jour pour rester
+    loin des limites d'un document (1 Mio, ~20 000 champs). Ces agrégats sont écrits dans leurs propres
+    lots, après l'XP : un échec de leur côté ne bloque jamais l'écriture de l'XP.
+    """
+    def __init__(self, db: firestore.AsyncClient, max_pending_users: int = 200, day_shards: int = 32):
+        self.db = db
+        self.max_pending_users = max_pending_users
+        self.day_shards = day_shards
+        self._users: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._guilds: Dict[str, int] = defaultdict(int)
+        self._day_activity: Dict[str, Dict[str, Dict[str, float]]] = {}
+        self._flush_lock = asyncio.Lock()
+        self.flushed_users = 0
+        self.flushed_batches = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._users) + len(self._guilds) + len(self._day_activity)
+
+    def add(self, user_id: str, increments: Dict[str, Any], fields: Optional[Dict[str, Any]] = None, guild_id: Optional[str] = None, guild_xp: int = 0) -> bool:
+        """Ajoute des deltas au tampon. Retourne True si le seuil de flush est atteint."""
+        entry = self._users.setdefault(user_id, {"inc": defaultdict(int), "set": {}})
+        for field, delta in increments.items():
+            entry["inc"][field] += delta
+        if fields:
+            entry["set"].update(fields)
+        if guild_id and guild_xp:
+            self._guilds[guild_id] += guild_xp
+        return len(self._users) >= self.max_pending_users
+
+    def add_guild_xp(self, guild_id: str, xp: int) -> bool:
+        """Ajoute de l'XP hebdomadaire à une guilde (sa remise à zéro d'époque doit déjà être faite)."""
+        self._guilds[guild_id] += xp
+        return len(self._guilds) >= self.max_pending_users
+
+    def add_activity(self, user_id: str, day: str, metrics: Dict[str, float]) -> bool:
+        """Ajoute des métriques (xp, affiliate, messages) au seau du jour `day` (AAAAMMJJ)."""
+        metrics = {metric: value for metric, value in metrics.items() if value}
+        if metrics:
+            self._merge_activity(self._day_activity, day, user_id, metrics)
+        return len(self._users) + sum(len(users_metrics) for users_metrics in self._day_activity.values()) >= self.max_pending_users
+
+    @staticmethod
+    def _merge_activity(target: Dict[str, Dict[str, Dict[str, float]]], outer: str, inner: str, metrics: Dict[str, float]):
+        bucket = target.setdefault(outer, {}).setdefault(inner, {})
+        for metric, value in metrics.items():
+            bucket[metric] = bucket.get(metric, 0) + value
+
+    def overlay(self, user_id: str, user_data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Retourne une copie de user_data avec les deltas encore en attente appliqués."""
+        entry = self._users.get(user_id)
+        if user_data is None or not entry:
+            return user_data
+        merged = dict(user_data)
+        for field, delta in entry["inc"].items():
+            merged[field] = merged.get(field, 0) + delta
+        merged.update(entry["set"])
+        return merged
+
+    def _restore(self, users: Dict[str, Dict[str, Dict[str, Any]]], guilds: Dict[str, int],
+                 day_activity: Dict[str, Dict[str, Dict[str, float]]]):
+        """Réinjecte des deltas non écrits dans le tampon (sans écraser les valeurs plus récentes)."""
+        for user_id, entry in users.items():
+            current = self._users.setdefault(user_id, {"inc": defaultdict(int), "set": {}})
+            for field, delta in entry["inc"].items():
+                current["inc"][field] += delta
+            current["set"] = {**entry["set"], **current["set"]}
+        for guild_id, xp in guilds.items():
+            self._guilds[guild_id] += xp
+        for day, users_metrics in day_activity.items():
+            for user_id, metrics in users_metrics.items():
+                self._merge_activity(self._day_activity, day, user_id, metrics)
+
+    async def _write(self, ops: List[Tuple[str, str, Dict[str, Any]]], create: bool = False) -> Tuple[int, Optional[Exception]]:
+        """
+        Valide `ops` par lots. Retourne le nombre d'opérations traitées et l'erreur qui a arrêté l'écriture.
+        Sans `create`, les documents ne sont que mis à jour : un document supprimé entre-temps (membre
+        parti, guilde dissoute) n'est pas recréé, son entrée est abandonnée.
+        """
+        for start in range(0, len(ops), FIRESTORE_BATCH_LIMIT):
+            chunk = ops[start:start + FIRESTORE_BATCH_LIMIT]
+            batch = self.db.batch()
+            for collection, doc_id, payload in chunk:
+                ref = self.db.collection(collection).document(doc_id)
+                if create:
+                    batch.set(ref, payload, merge=True)
+                else:
+                    batch.update(ref, payload)
+            try:
+                await batch.commit()
+            except gcp_exceptions.NotFound:
+                # Le lot entier est refusé : ses documents sont repris un par un pour écarter les absents.
+                for index, (collection, doc_id, payload) in enumerate(chunk):
+                    try:
+                        await self.db.collection(collection).document(doc_id).update(payload)
+                    except gcp_exceptions.NotFound:
+                        self.dropped += 1
+                        print(f"Tampon d'XP : {collection}/{doc_id} n'existe plus, ses deltas sont abandonnés.")
+                    except Exception as e:
+                        return start + index, e
+            except Exception as e:
+                return start, e
+            self.flushed_batches += 1
+        return len(ops), None
+
+    async def flush(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        Écrit tous les deltas en attente. Retourne les entrées utilisateur effectivement écrites.
+        Un échec sur l'XP est levé (les deltas non écrits sont réinjectés) ; un échec sur les agrégats
+        journaliers est seulement signalé, leurs deltas étant réessayés au flush suivant. Les utilisateurs
+        et guildes ne sont que mis à jour : ceux supprimés depuis ne sont pas recréés.
+        """
+        async with self._flush_lock:
+            users, guilds, day_activity = self._users, self._guilds, self._day_activity
+            self._users, self._guilds, self._day_activity = {}, defaultdict(int), {}
+            if not users and not guilds and not day_activity:
+                return {}
+
+            ops: List[Tuple[str, str, Dict[str, Any]]] = []
+            for user_id, entry in users.items():
+                payload = {field: firestore.Increment(delta) for field, delta in entry["inc"].items() if delta}
+                payload.update(entry["set"])
+                ops.append(('users', user_id, payload))
+            for guild_id, xp in guilds.items():
+                ops.append(('guilds', guild_id, {"weekly_xp": firestore.Increment(xp)}))
+
+            written, error = await self._write(ops)
+            if error:
+                pending = ops[written:]
+                self._restore(
+                    {doc_id: users[doc_id] for collection, doc_id, _ in pending if collection == 'users'},
+                    {doc_id: guilds[doc_id] for collection, doc_id, _ in pending if collection == 'guilds'},
+                    day_activity
+                )
+                raise error
+            self.flushed_users += len(users)
+
+            # Agrégats journaliers fragmentés : doc_id -> (jour, {membre: métriques}) pour réinjecter ce qui n'est pas écrit.
+            shards: Dict[str, Tuple[str, Dict[str, Dict[str, float]]]] = {}
+            for day, users_metrics in day_activity.items():
+                for user_id, metrics in users_metrics.items():
+                    shard = activity_shard(user_id, self.day_shards)
+                    shards.setdefault(f"{day}-{shard:03d}", (day, {}))[1][user_id] = metrics
+            activity_ops = []
+            for doc_id, (day, users_metrics) in shards.items():
+                payload: Dict[str, Any] = {"day": day, "shard": int(doc_id.rsplit("-", 1)[1])}
+                for user_id, metrics in users_metrics.items():
+                    for metric, value in metrics.items():
+                        payload.setdefault(metric, {})[user_id] = firestore.Increment(value)
+                activity_ops.append(('activity_days', doc_id, payload))
+
+            written, error = await self._write(activity_ops, create=True)
+            if error:
+                pending_days: Dict[str, Dict[str, Dict[str, float]]] = {}
+                for _, doc_id, _ in activity_ops[written:]:
+                    day, users_metrics = shards[doc_id]
+                    pending_days.setdefault(day, {}).update(users_metrics)
+                self._restore({}, {}, pending_days)
+                print(f"Erreur d'écriture des agrégats d'activité journaliers (réessayés au prochain flush): {error}")
+            return users
+
+
+class UserMutation:
+    """
+    Unité de travail regroupant plusieurs deltas, affectations et entrées de journal
+    pour un ou plusieurs utilisateurs. Chaque document est lu une seule fois et écrit
+    une seule fois, dans une seule transaction. Les entrées de journal sont insérées
+    dans la sous-collection append-only `users/{id}/ledger`. Si `epoch` est fourni, les
+    compteurs hebdomadaires d'une époque précédente sont remis à zéro avant d'appliquer les deltas.
+    Si `achievement_index` est fourni, les succès déclenchés par les statistiques modifiées sont
+    débloqués (et leur XP accordée) dans la même écriture ; `on_unlock` est appelé après validation.
+
+    Utilisation :
+        states = await manager.mutation().add(uid, "store_credit", 5, "Gain").add(uid, "xp", 10, "Gain").commit()
+
+    Pour participer à une transaction existante, appeler `apply(trans, snapshots)` où `snapshots`
+    contient les documents déjà lus dans cette même transaction (ils ne seront pas relus), puis
+    `after_commit()` une fois cette transaction validée.
+    """
+    def __init__(self, db: firestore.AsyncClient, default_factory: Callable[[], Dict[str, Any]],
+                 on_commit: Optional[Callable[[Dict[str, Dict[str, Any]]], None]] = None, epoch: Optional[int] = None,
+                 achievement_index: Optional[AchievementIndex] = None,
+                 on_unlock: Optional[Callable[[str, List[Dict[str, Any]], Dict[str, Any]], None]] = None):
+        self.db = db
+        self.default_factory = default_factory
+        self.on_commit = on_commit
+        self.epoch = epoch
+        self.achievement_index = achievement_index
+        self.on_unlock = on_unlock
+        self._user_ids: List[str] = []
+        self._deltas: Dict[str, Dict[str, Any]] = defaultdict(dict)
+        self._fields: Dict[str, Dict[str, Any]] = defaultdict(dict)
+        self._logs: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._documents: List[Tuple[firestore.AsyncDocumentReference, Dict[str, Any]]] = []
+        self.states: Dict[str, Dict[str, Any]] = {}
+        self.unlocked: Dict[str, List[Dict[str, Any]]] = {}
+
+    @property
+    def user_ids(self) -> List[str]:
+        return list(self._user_ids)
+
+    def _track(self, user_id: Any) -> str:
+        user_id = str(user_id)
+        if user_id not in self._user_ids:
+            self._user_ids.append(user_id)
+        return user_id
+
+    def add(self, user_id: Any, field: str, amount: Any, description: str) -> 'UserMutation':
+        """Ajoute `amount` au champ numérique `field` et journalise l'opération."""
+        user_id = self._track(user_id)
+        self._deltas[user_id][field] = self._deltas[user_id].get(field, 0) + amount
+        self._logs[user_id].append({
+            "timestamp": datetime.now(timezone.utc),
+            "type": field, "amount": amount, "description": description
+        })
+        return self
+
+    def set(self, user_id: Any, field: str, value: Any) -> 'UserMutation':
+        """Affecte une valeur à un champ (sans entrée de journal)."""
+        user_id = self._track(user_id)
+        self._fields[user_id][field] = value
+        return self
+
+    def update_document(self, ref: firestore.AsyncDocumentReference, payload: Dict[str, Any]) -> 'UserMutation':
+        """Ajoute une écriture aveugle (ex: firestore.Increment) sur un document non utilisateur."""
+        self._documents.append((ref, payload))
+        return self
+
+    async def apply(self, trans: firestore.AsyncTransaction, snapshots: Optional[Dict[str, Optional[Dict[str, Any]]]] = None) -> Dict[str, Dict[str, Any]]:
+        """Lit puis écrit chaque document dans `trans`. Retourne le nouvel état de chaque utilisateur."""
+        snapshots = dict(snapshots or {})
+        refs = {user_id: self.db.collection('users').document(user_id) for user_id in self._user_ids}
+
+        # Firestore impose que toutes les lectures précèdent les écritures.
+        for user_id, ref in refs.items():
+            if user_id not in snapshots:
+                doc = await ref.get(transaction=trans)
+                snapshots[user_id] = doc.to_dict() if doc.exists else None
+
+        states = {}
+        # Réinitialisé à chaque tentative : la transaction peut être rejouée.
+        self.unlocked = {}
+        for user_id, ref in refs.items():
+            base = snapshots[user_id]
+            logs = list(self._logs[user_id])
+            state = dict(base) if base is not None else self.default_factory()
+
+            payload = {}
+            if self.epoch is not None and state.get("weekly_epoch", 0) != self.epoch:
+                payload.update(WEEKLY_DEFAULTS, weekly_epoch=self.epoch)
+                state.update(payload)
+            payload.update({field: state.get(field, 0) + delta for field, delta in self._deltas[user_id].items()})
+            payload.update(self._fields[user_id])
+            state.update(payload)
+
+            if self.achievement_index:
+                unlocked = self.achievement_index.newly_unlocked(state, [*self._deltas[user_id], *self._fields[user_id]])
+                if unlocked:
+                    self._unlock(state, payload, logs, unlocked)
+                    self.unlocked[user_id] = unlocked
+
+            if base is not None:
+                # Migration paresseuse : l'ancien journal embarqué et les anciens seaux d'activité par
+                # utilisateur (remplacés par `activity_days`) sont retirés à la première écriture.
+                for legacy_field in ("transaction_log", "activity"):
+                    if state.pop(legacy_field, None) is not None:
+                        payload[legacy_field] = firestore.DELETE_FIELD
+                trans.update(ref, payload)
+            else:
+                trans.set(ref, state)
+            for entry in logs:
+                trans.set(ref.collection('ledger').document(), entry)
+            states[user_id] = state
+
+        for ref, payload in self._documents:
+            trans.update(ref, payload)
+
+        self.states = states
+        return states
+
+    @staticmethod
+    def _unlock(state: Dict[str, Any], payload: Dict[str, Any], logs: List[Dict[str, Any]], unlocked: List[Dict[str, Any]]):
+        """Ajoute les succès débloqués et leur récompense d'XP à l'état et à l'écriture en cours."""
+        achievement_ids = [achievement["id"] for achievement in unlocked]
+        state["achievements"] = list(state.get("achievements") or []) + achievement_ids
+        payload["achievements"] = firestore.ArrayUnion(achievement_ids)
+        for achievement in unlocked:
+            reward = achievement.get("reward_xp", 0)
+            if reward <= 0:
+                continue
+            for field in ("xp", "weekly_xp"):
+                state[field] = state.get(field, 0) + reward
+                payload[field] = state[field]
+            logs.append({
+                "timestamp": datetime.now(timezone.utc),
+                "type": "xp", "amount": reward, "description": f"Succès: {achievement.get('name')}"
+            })
+
+    async def commit(self) -> Dict[str, Dict[str, Any]]:
+        """Exécute l'unité de travail dans sa propre transaction."""
+        @transaction.async_transactional
+        async def _run(trans):
+            return await self.apply(trans)
+
+        await _run(self.db.transaction())
+        return self.after_commit()
+
+    def after_commit(self) -> Dict[str, Dict[str, Any]]:
+        """Suites d'une écriture validée (`on_commit`, puis `on_unlock` par membre). Retourne les nouveaux états."""
+        if self.on_commit:
+            self.on_commit(self.states)
+        if self.on_unlock:
+            for user_id, unlocked in self.unlocked.items():
+                self.on_unlock(user_id, unlocked, self.states[user_id])
+        return self.states
+
+
+async def commit_updates(db: firestore.AsyncClient, ops: List[Tuple[firestore.AsyncDocumentReference, Dict[str, Any]]],
+                         concurrency: int = 4, batch_size: int = FIRESTORE_BATCH_LIMIT):
+    """Applique des `update` par lots de `batch_size`, validés par vagues de `concurrency` lots en parallèle."""
+    async def commit_batch(chunk):
+        batch = db.batch()
+        for ref, payload in chunk:
+            batch.update(ref, payload)
+        await batch.commit()
+
+    wave = batch_size * concurrency
+    for start in range(0, len(ops), wave):
+        chunk = ops[start:start + wave]
+        await asyncio.gather(*(commit_batch(chunk[i:i + batch_size]) for i in range(0, len(chunk), batch_size)))
+
+
+class BatchWritePipeline:
+    """
+    Parcourt une collection entière en un seul passage et applique les écritures par lots de 500.
+    Chaque page de `concurrency` lots est validée en parallèle, puis le dernier identifiant traité
+    est enregistré dans `system/{checkpoint_id}` afin de reprendre après une interruption.
+    Le point de reprise n'est valable que pour la même `run_key` (ex: la semaine ISO en cours).
+    """
+    def __init__(self, db: firestore.AsyncClient, checkpoint_id: str, run_key: str, concurrency: int = 4, batch_size: int = FIRESTORE_BATCH_LIMIT):
+        self.db = db
+        self.checkpoint_ref = db.collection('system').document(checkpoint_id)
+        self.checkpoint_id = checkpoint_id
+        self.run_key = run_key
+        self.concurrency = max(1, concurrency)
+        self.batch_size = min(batch_size, FIRESTORE_BATCH_LIMIT)
+        self.checkpoint: Dict[str, Any] = {}
+
+    async def load_checkpoint(self) -> Dict[str, Any]:
+        """Charge le point de reprise de cette exécution (vide s'il appartient à une exécution précédente)."""
+        doc = await self.checkpoint_ref.get()
+        data = doc.to_dict() if doc.exists else None
+        self.checkpoint = data if data and data.get("run_key") == self.run_key else {}
+        return self.checkpoint
+
+    async def save_checkpoint(self, **fields: Any):
+        if not self.checkpoint:
+            # Nouvelle exécution : on écrase le point de reprise précédent.
+            await self.checkpoint_ref.set({"run_key": self.run_key, **fields})
+        else:
+            await self.checkpoint_ref.set(fields, merge=True)
+        for key, value in fields.items():
+            if isinstance(value, dict):
+                self.checkpoint.setdefault(key, {}).update(value)
+            else:
+                self.checkpoint[key] = value
+        self.checkpoint["run_key"] = self.run_key
+
+    async def commit_all(self, ops: List[Tuple[firestore.AsyncDocumentReference, Dict[str, Any]]]):
+        await commit_updates(self.db, ops, self.concurrency, self.batch_size)
+
+    async def write(self, label: str, updates: List[Tuple[firestore.AsyncDocumentReference, Dict[str, Any]]]) -> int:
+        """Applique une liste d'écritures connue à l'avance (idempotente : rejouée entièrement en cas de reprise)."""
+        if self.checkpoint.get("completed", {}).get(label):
+            return 0
+        await self.commit_all(updates)
+        await self.save_checkpoint(completed={label: True})
+        print(f"[{self.checkpoint_id}] {label} : {len(updates)} documents mis à jour.")
+        return len(updates)
+
+    async def run(self, collection: str, build_update: Callable[[Any], Optional[Dict[str, Any]]]) -> int:
+        """
+        Applique `build_update(doc)` à chaque document de `collection` (None = pas d'écriture).
+        Retourne le nombre de documents écrits lors de cet appel.
+        """
+        if self.checkpoint.get("completed", {}).get(collection):
+            return 0
+
+        last_id = self.checkpoint.get("cursors", {}).get(collection)
+        page_size = self.batch_size * self.concurrency
+        scanned = written = 0
+        while True:
+            query = self.db.collection(collection).order_by('__name__')
+            if last_id:
+                query = query.start_after({'__name__': last_id})
+            docs = [doc async for doc in query.limit(page_size).stream()]
+            if not docs:
+                break
+
+            ops = [(doc.reference, payload) for doc in docs if (payload := build_update(doc))]
+            await self.commit_all(ops)
+
+            last_id = docs[-1].id
+            scanned += len(docs)
+            written += len(ops)
+            await self.save_checkpoint(cursors={collection: last_id})
+            print(f"[{self.checkpoint_id}] {collection} : {scanned} documents parcourus, {written} mis à jour.")
+            if len(docs) < page_size:
+                break
+
+        await self.save_checkpoint(completed={collection: True})
+        return written